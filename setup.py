@@ -384,9 +384,11 @@ class TestBaseCommand(distutils.core.Command):
          "Run only testcases whose name contains the passed string"),
         ("testfile=", None, "Specific test file to run (e.g "
                             "validation, storage, ...)"),
+        ("jobs=", "j", "Number of processes to run the CLI tests in"),
     ]
 
     def initialize_options(self):
+        self.jobs = 1
         self.debug = 0
         self.testverbose = 0
         self.regenerate_output = 0
@@ -404,6 +406,7 @@ class TestBaseCommand(distutils.core.Command):
             # for "virt-install-many-devices", despite the actual test
             # function name not containing any '-'
             self.only = self.only.replace("-", "_")
+        self.jobs = int(self.jobs)
 
     def _find_tests_in_dir(self, dirname, excludes):
         testfiles = []
@@ -424,6 +427,34 @@ class TestBaseCommand(distutils.core.Command):
             raise RuntimeError("--testfile didn't catch anything")
         return testfiles
 
+    def _parallelize_clitests(self, tests):
+        """
+        Run the clitest cases up front in a pool of worker processes,
+        and replace them in the suite with cases that report the results
+        """
+        from tests import clitest
+
+        def _flatten(suite):
+            if not isinstance(suite, unittest.TestSuite):
+                return [suite]
+            ret = []
+            for sub in suite:
+                ret.extend(_flatten(sub))
+            return ret
+
+        alltests = _flatten(tests)
+        clitests = [t for t in alltests if isinstance(t, clitest.CLITests)]
+        if not clitests:
+            return tests
+
+        replayed = iter(clitest.run_parallel(clitests, self.jobs))
+        newtests = []
+        for test in alltests:
+            if isinstance(test, clitest.CLITests):
+                test = next(replayed)
+            newtests.append(test)
+        return unittest.TestSuite(newtests)
+
     def run(self):
         cov = None
         if self.coverage:
@@ -463,6 +494,9 @@ class TestBaseCommand(distutils.core.Command):
                 print("%s" % test)
             print("")
 
+        if self.jobs > 1:
+            tests = self._parallelize_clitests(tests)
+
         verbosity = 1
         if self.debug or self.testverbose or self._force_verbose:
             verbosity = 2
@@ -567,6 +601,38 @@ class TestDist(TestBaseCommand):
         TestBaseCommand.run(self)
 
 
+class BenchmarkCommand(distutils.core.Command):
+    user_options = [
+        ("scales=", None, "Comma separated object counts to generate "
+                          "test driver XML for (default: 10,100,1000)"),
+        ("output=", None, "Write JSON results to this file"),
+        ("baseline=", None, "Compare results against this JSON file"),
+        ("tolerance=", None, "Allowed slowdown against the baseline, "
+                             "as a fraction (default: 0.2)"),
+    ]
+    description = "Run scale benchmarks against generated test driver XML"
+
+    def initialize_options(self):
+        self.scales = None
+        self.output = None
+        self.baseline = None
+        self.tolerance = 0.2
+
+    def finalize_options(self):
+        if self.scales:
+            self.scales = [int(s) for s in str(self.scales).split(",")]
+        self.tolerance = float(self.tolerance)
+
+    def run(self):
+        import tests as testsmodule
+        testsmodule.setup_logging()
+        testsmodule.setup_cli_imports()
+
+        from tests.benchmarks import suite
+        sys.exit(suite.run_and_report(self.scales, self.output,
+                                      self.baseline, self.tolerance))
+
+
 class CheckPylint(distutils.core.Command):
     user_options = [
         ("jobs=", "j", "use multiple processes to speed up Pylint"),
@@ -689,6 +755,7 @@ distutils.core.setup(
         'test_urls': TestURLFetch,
         'test_initrd_inject': TestInitrdInject,
         'test_dist': TestDist,
+        'benchmark': BenchmarkCommand,
     },
 
     distclass=VMMDistribution,
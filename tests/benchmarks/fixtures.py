@@ -0,0 +1,269 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+
+"""
+Generate test:/// driver XML with an arbitrary number of objects, for
+benchmarking code paths at a scale tests/testdriver.xml doesn't reach.
+
+    python3 -m tests.benchmarks.fixtures 1000 > /tmp/testdriver-1000.xml
+"""
+
+import sys
+
+
+_HEADER = """<node>
+  <cpu>
+    <nodes>1</nodes>
+    <sockets>4</sockets>
+    <cores>4</cores>
+    <threads>1</threads>
+    <active>16</active>
+    <mhz>4000</mhz>
+    <model>i686</model>
+  </cpu>
+  <memory>%(memory)d</memory>
+"""
+
+_DOMAIN = """
+<domain type='test' xmlns:test='http://libvirt.org/schemas/domain/test/1.0'>
+  <test:runstate>%(runstate)d</test:runstate>
+  <name>%(name)s</name>
+  <uuid>%(uuid)s</uuid>
+  <memory>1048576</memory>
+  <currentMemory>1048576</currentMemory>
+  <vcpu>2</vcpu>
+  <os>
+    <type arch='i686'>hvm</type>
+    <boot dev='hd'/>
+  </os>
+  <features>
+    <acpi/>
+    <apic/>
+  </features>
+  <clock offset='utc'/>
+  <on_poweroff>destroy</on_poweroff>
+  <on_reboot>restart</on_reboot>
+  <on_crash>destroy</on_crash>
+  <devices>
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='qcow2'/>
+      <source file='%(diskpath)s'/>
+      <target dev='vda' bus='virtio'/>
+    </disk>
+    <disk type='file' device='cdrom'>
+      <target dev='hda' bus='ide'/>
+      <readonly/>
+    </disk>
+    <controller type='usb' index='0' model='ich9-ehci1'/>
+    <controller type='virtio-serial' index='0'/>
+    <interface type='network'>
+      <mac address='%(mac)s'/>
+      <source network='%(network)s'/>
+      <model type='virtio'/>
+    </interface>
+    <serial type='pty'>
+      <target port='0'/>
+    </serial>
+    <console type='pty'>
+      <target type='serial' port='0'/>
+    </console>
+    <channel type='spicevmc'>
+      <target type='virtio' name='com.redhat.spice.0'/>
+    </channel>
+    <input type='tablet' bus='usb'/>
+    <graphics type='spice' autoport='yes'/>
+    <sound model='ich6'/>
+    <video>
+      <model type='qxl'/>
+    </video>
+    <redirdev bus='usb' type='spicevmc'/>
+    <memballoon model='virtio'/>
+    <rng model='virtio'>
+      <backend model='random'>/dev/urandom</backend>
+    </rng>
+  </devices>
+</domain>
+"""
+
+_NETWORK = """
+<network>
+  <name>%(name)s</name>
+  <uuid>%(uuid)s</uuid>
+  <forward mode='nat'/>
+  <bridge name='virbr%(idx)d' stp='on' delay='0'/>
+  <ip address='10.%(ipa)d.%(ipb)d.1' netmask='255.255.255.0'>
+    <dhcp>
+      <range start='10.%(ipa)d.%(ipb)d.2' end='10.%(ipa)d.%(ipb)d.254'/>
+    </dhcp>
+  </ip>
+</network>
+"""
+
+_POOL_START = """
+<pool type='dir'>
+  <name>%(name)s</name>
+  <uuid>%(uuid)s</uuid>
+  <capacity>1099511627776</capacity>
+  <allocation>0</allocation>
+  <available>1099511627776</available>
+  <source>
+  </source>
+  <target>
+    <path>/%(name)s</path>
+  </target>
+"""
+
+_VOLUME = """
+  <volume type='file'>
+    <name>%(name)s</name>
+    <capacity>10737418240</capacity>
+    <allocation>1073741824</allocation>
+    <target>
+      <format type='qcow2'/>
+    </target>
+  </volume>
+"""
+
+_NODEDEV_ROOT = """
+<device>
+  <name>computer</name>
+  <capability type='system'>
+    <hardware>
+      <vendor>Benchmark</vendor>
+    </hardware>
+  </capability>
+</device>
+"""
+
+_NODEDEV = """
+<device>
+  <name>pci_0000_%(bus)02x_%(slot)02x_%(function)x</name>
+  <parent>computer</parent>
+  <capability type='pci'>
+    <domain>0</domain>
+    <bus>%(bus)d</bus>
+    <slot>%(slot)d</slot>
+    <function>%(function)d</function>
+    <product id='0x10c9'>82576 Gigabit Network Connection</product>
+    <vendor id='0x8086'>Intel Corporation</vendor>
+  </capability>
+</device>
+"""
+
+
+def _uuid(kind, idx):
+    return "%08x-0000-4000-8000-%012x" % (kind, idx)
+
+
+def _mac(idx):
+    return "52:54:00:%02x:%02x:%02x" % (
+        (idx >> 16) & 0xff, (idx >> 8) & 0xff, idx & 0xff)
+
+
+def object_counts(scale):
+    """
+    Return the number of each object type generated for scale. Domains,
+    volumes and node devices scale linearly, networks and pools at a
+    tenth of that, which is roughly what large hosts look like.
+    """
+    return {
+        "domains": scale,
+        "networks": max(1, scale // 10),
+        "pools": max(1, scale // 10),
+        "volumes": scale,
+        "nodedevs": scale,
+    }
+
+
+def pool_name(idx):
+    return "bench-pool-%d" % idx
+
+
+def volume_name(idx):
+    return "bench-vol-%d.qcow2" % idx
+
+
+def volume_path(scale, idx):
+    """
+    Path of the idx'th generated volume, volumes are spread evenly
+    across the generated pools
+    """
+    pools = object_counts(scale)["pools"]
+    return "/%s/%s" % (pool_name(idx % pools), volume_name(idx))
+
+
+def domain_name(idx):
+    return "bench-vm-%d" % idx
+
+
+def domain_is_running(idx):
+    # Every other domain is running, the rest are shutoff
+    return idx % 2 == 0
+
+
+def make_testdriver_xml(scale):
+    """
+    Build test:/// driver XML with scale domains, volumes and node
+    devices, and scale / 10 networks and storage pools. Every domain
+    uses one of the volumes and one of the networks.
+    """
+    counts = object_counts(scale)
+    ret = [_HEADER % {"memory": 16 * 1024 * 1024 + scale * 1024 * 1024}]
+
+    for idx in range(counts["domains"]):
+        ret.append(_DOMAIN % {
+            "name": domain_name(idx),
+            "uuid": _uuid(1, idx),
+            "runstate": domain_is_running(idx) and 1 or 5,
+            "diskpath": volume_path(scale, idx % counts["volumes"]),
+            "mac": _mac(idx),
+            "network": "bench-net-%d" % (idx % counts["networks"]),
+        })
+
+    for idx in range(counts["networks"]):
+        ret.append(_NETWORK % {
+            "name": "bench-net-%d" % idx,
+            "uuid": _uuid(2, idx),
+            "idx": idx,
+            "ipa": idx // 256,
+            "ipb": idx % 256,
+        })
+
+    for poolidx in range(counts["pools"]):
+        ret.append(_POOL_START % {
+            "name": pool_name(poolidx),
+            "uuid": _uuid(3, poolidx),
+        })
+        for idx in range(poolidx, counts["volumes"], counts["pools"]):
+            ret.append(_VOLUME % {"name": volume_name(idx)})
+        ret.append("</pool>\n")
+
+    ret.append(_NODEDEV_ROOT)
+    for idx in range(counts["nodedevs"]):
+        ret.append(_NODEDEV % {
+            "bus": (idx >> 8) & 0xff,
+            "slot": (idx >> 3) & 0x1f,
+            "function": idx & 0x7,
+        })
+
+    ret.append("</node>\n")
+    return "".join(ret)
+
+
+if __name__ == "__main__":
+    sys.stdout.write(make_testdriver_xml(int(sys.argv[1])))
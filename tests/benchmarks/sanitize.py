@@ -0,0 +1,83 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+
+"""
+Time the _XML_SANITIZE filter over the nodedev and capabilities test
+XML, comparing against the previous per character implementation.
+Run from the top of the source tree with:
+
+    python3 -m tests.benchmarks.sanitize [--count N]
+"""
+
+import argparse
+import glob
+import string  # pylint: disable=deprecated-module
+import time
+
+from virtinst.xmlbuilder import sanitize_xml
+
+
+def _old_sanitize_xml(xml):
+    xml = xml.encode("ascii", "ignore").decode("ascii")
+    return "".join([c for c in xml if c in string.printable])
+
+
+def _load_xmls():
+    ret = []
+    for pattern in ["tests/nodedev-xml/*.xml",
+                    "tests/capabilities-xml/*.xml"]:
+        for f in sorted(glob.glob(pattern)):
+            ret.append(open(f).read())
+    return ret
+
+
+def run(count):
+    """
+    Sanitize every test XML document count times with both
+    implementations. Returns a list of (name, seconds) tuples.
+    """
+    xmls = _load_xmls()
+    for xml in xmls:
+        if sanitize_xml(xml) != _old_sanitize_xml(xml):
+            raise RuntimeError("sanitize_xml output differs from the "
+                               "reference implementation")
+
+    ret = []
+    for name, func in [("per-char", _old_sanitize_xml),
+                       ("regex", sanitize_xml)]:
+        start = time.time()
+        for ignore in range(count):
+            for xml in xmls:
+                func(xml)
+        ret.append((name, time.time() - start))
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the nodedev XML sanitizer")
+    parser.add_argument("--count", type=int, default=100,
+        help="Number of passes over the test XML files")
+    options = parser.parse_args()
+
+    for name, secs in run(options.count):
+        print("%-12s %d passes: %.3fs" % (name, options.count, secs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+
+"""
+Scale benchmarks. For every requested scale we generate test:/// driver
+XML with tests.benchmarks.fixtures, time a set of key code paths against
+it, and optionally compare the results with a saved JSON baseline.
+
+    python3 setup.py benchmark --scales 10,100,1000 --output new.json \
+        --baseline old.json
+
+or equivalently python3 -m tests.benchmarks.suite with the same options.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import virtinst
+from virtinst import cli
+from virtinst import OSDB
+from virtinst import pollhelpers
+from virtinst import util
+from virtinst import VirtualDisk
+
+import tests
+from tests.benchmarks import fixtures
+from tests.benchmarks import sanitize as sanitizebench
+from tests.benchmarks import xmlparse as xmlparsebench
+
+
+DEFAULT_SCALES = [10, 100, 1000]
+RESULTS_VERSION = 1
+
+# Only flag a regression if it's slower by at least this many seconds
+# as well, so sub millisecond noise doesn't count
+_MIN_REGRESSION_SECS = 0.005
+
+
+def _timeit(results, name, func):
+    start = time.time()
+    ret = func()
+    results[name] = round(time.time() - start, 6)
+    return ret
+
+
+def _run_cli(module, argv, conn):
+    """
+    Run one of the tests.virt* cli modules in process, the same way
+    tests/clitest.py does, raising an error if it fails
+    """
+    oldstdout = sys.stdout
+    oldstderr = sys.stderr
+    oldargv = sys.argv
+    out = io.StringIO()
+    ret = -1
+    try:
+        sys.stdout = out
+        sys.stderr = out
+        sys.argv = argv
+        try:
+            ret = module.main(conn=conn)
+        except SystemExit as e:
+            ret = e.code
+    finally:
+        sys.stdout = oldstdout
+        sys.stderr = oldstderr
+        sys.argv = oldargv
+
+    if ret:
+        raise RuntimeError("%s failed:\n%s" % (" ".join(argv),
+                                               out.getvalue()))
+
+
+###################
+# Benchmark cases #
+###################
+
+def _bench_poll(results, conn):
+    """
+    The polling vmmConnection does on startup and every tick. The GTK
+    object can't be run headless, so drive the same pollhelpers and
+    per object XMLDesc calls directly.
+    """
+    def build(obj, ignore):
+        return obj
+
+    fetchers = [pollhelpers.fetch_vms, pollhelpers.fetch_nets,
+                pollhelpers.fetch_pools, pollhelpers.fetch_nodedevs]
+
+    def populate():
+        ret = []
+        for fetcher in fetchers:
+            ignore, new, current = fetcher(conn, {}, build)
+            for obj in new:
+                obj.XMLDesc(0)
+            ret.append(dict((o.name(), o) for o in current))
+        return ret
+    maps = _timeit(results, "conn-populate", populate)
+
+    def tick():
+        for fetcher, origmap in zip(fetchers, maps):
+            ignore, ignore, current = fetcher(conn, origmap.copy(), build)
+            if fetcher is pollhelpers.fetch_vms:
+                for vm in current:
+                    if vm.isActive():
+                        vm.info()
+    _timeit(results, "conn-tick", tick)
+
+
+def _bench_guests(results, conn):
+    _timeit(results, "fetch-all", lambda: (
+        conn.fetch_all_guests(), conn.fetch_all_pools(),
+        conn.fetch_all_vols(), conn.fetch_all_nodedevs()))
+
+    xmls = [dom.XMLDesc(0) for dom in conn.listAllDomains()]
+    guests = _timeit(results, "guest-parse",
+        lambda: [virtinst.Guest(conn, parsexml=x) for x in xmls])
+    _timeit(results, "guest-get-xml",
+        lambda: [g.get_xml_config() for g in guests])
+
+
+def _bench_path_in_use(results, conn, scale):
+    paths = [fixtures.volume_path(scale, idx)
+             for idx in range(min(scale, 20))]
+    _timeit(results, "path-in-use-by",
+        lambda: [VirtualDisk.path_in_use_by(conn, p) for p in paths])
+
+
+def _bench_osdb(results):
+    ids = ["fedora26", "rhel7.4", "win10", "ubuntu17.04", "centos7.0",
+           "debian9", "opensuse42.3", "freebsd11.1", "generic"]
+    _timeit(results, "osdb-lookup", lambda: (
+        [OSDB.lookup_os(i) for i in ids],
+        OSDB.list_os(),
+        OSDB.list_os(typename="linux", only_supported=True)))
+
+
+def _bench_cli(results, uri, conn):
+    running = fixtures.domain_name(0)
+    shutoff = fixtures.domain_name(1)
+
+    _timeit(results, "virt-install-dry-run", lambda: _run_cli(
+        tests.virtinstall,
+        ["virt-install", "--connect", uri, "--name", "bench-new",
+         "--memory", "64", "--pxe", "--disk", "none",
+         "--noautoconsole", "--dry-run"], conn))
+    _timeit(results, "virt-xml-edit", lambda: _run_cli(
+        tests.virtxml,
+        ["virt-xml", "--connect", uri, running,
+         "--edit", "--vcpus", "4", "--print-diff"], conn))
+    _timeit(results, "virt-clone-print-xml", lambda: _run_cli(
+        tests.virtclone,
+        ["virt-clone", "--connect", uri, "--original", shutoff,
+         "--auto-clone", "--print-xml"], conn))
+
+
+def run_scale(scale, workdir):
+    """
+    Generate the fixture for scale and time every benchmark case
+    against it. Returns a {casename: seconds} dict.
+    """
+    xmlpath = os.path.join(workdir, "testdriver-%d.xml" % scale)
+    with open(xmlpath, "w") as f:
+        f.write(fixtures.make_testdriver_xml(scale))
+    uri = "__virtinst_test__test://%s,predictable" % xmlpath
+
+    results = {}
+    conn = _timeit(results, "conn-open",
+                   lambda: cli.getConnection(uri))
+    try:
+        _bench_poll(results, conn)
+        _bench_guests(results, conn)
+        _bench_path_in_use(results, conn, scale)
+        _bench_osdb(results)
+        _bench_cli(results, uri, conn)
+    finally:
+        conn.close()
+    return results
+
+
+def run_micro():
+    """
+    Results from the standalone micro benchmarks in this directory
+    """
+    results = {}
+    for name, secs in xmlparsebench.run(1000):
+        results["xmlparse-%s" % name] = round(secs, 6)
+    for name, secs in sanitizebench.run(100):
+        results["sanitize-%s" % name] = round(secs, 6)
+    return results
+
+
+def run(scales):
+    """
+    Run every scale benchmark plus the micro benchmarks, returning the
+    full JSON serializable results dict
+    """
+    ret = {
+        "version": RESULTS_VERSION,
+        "timestamp": int(time.time()),
+        "libvirt": util.local_libvirt_version(),
+        "scales": {},
+        "micro": run_micro(),
+    }
+
+    workdir = tempfile.mkdtemp(prefix="virtinst-benchmark-")
+    try:
+        for scale in scales:
+            logging.debug("Running benchmarks at scale=%d", scale)
+            ret["scales"][str(scale)] = run_scale(scale, workdir)
+    finally:
+        for f in os.listdir(workdir):
+            os.unlink(os.path.join(workdir, f))
+        os.rmdir(workdir)
+    return ret
+
+
+def _flatten(results):
+    ret = {}
+    for name, secs in results.get("micro", {}).items():
+        ret[("micro", name)] = secs
+    for scale, cases in results.get("scales", {}).items():
+        for name, secs in cases.items():
+            ret[(scale, name)] = secs
+    return ret
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against baseline. Returns a list of
+    (group, name, baseline secs, new secs) tuples for every case that
+    is more than tolerance (a fraction, 0.2 == 20%) slower.
+    """
+    if baseline.get("version") != RESULTS_VERSION:
+        raise ValueError("Baseline results version %s doesn't match %s" %
+                         (baseline.get("version"), RESULTS_VERSION))
+
+    new = _flatten(results)
+    old = _flatten(baseline)
+    regressions = []
+    for key in sorted(set(new) & set(old)):
+        if (new[key] > old[key] * (1 + tolerance) and
+            new[key] - old[key] > _MIN_REGRESSION_SECS):
+            regressions.append((key[0], key[1], old[key], new[key]))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    old = baseline and _flatten(baseline) or {}
+    lines = []
+    for key, secs in sorted(_flatten(results).items()):
+        line = "%-8s %-24s %10.4fs" % (key[0], key[1], secs)
+        if key in old and old[key]:
+            line += "  (%+.1f%%)" % ((secs - old[key]) * 100.0 / old[key])
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def run_and_report(scales=None, output=None, baseline=None, tolerance=0.2):
+    """
+    Run the benchmarks, print a summary, and write/compare JSON as
+    requested. Returns the process exit code: 1 on regressions.
+    """
+    results = run(scales or DEFAULT_SCALES)
+
+    basedata = None
+    if baseline:
+        with open(baseline) as f:
+            basedata = json.load(f)
+
+    print(format_results(results, basedata))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("\nWrote results to %s" % output)
+
+    if not basedata:
+        return 0
+
+    regressions = compare(results, basedata, tolerance)
+    if not regressions:
+        print("\nNo regressions against %s" % baseline)
+        return 0
+
+    print("\nRegressions against %s (tolerance %d%%):" %
+          (baseline, tolerance * 100))
+    for group, name, oldsecs, newsecs in regressions:
+        print("  %-8s %-24s %.4fs -> %.4fs" %
+              (group, name, oldsecs, newsecs))
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run virt-manager scale benchmarks")
+    parser.add_argument("--scales",
+        default=",".join(str(s) for s in DEFAULT_SCALES),
+        help="Comma separated object counts to generate")
+    parser.add_argument("--output", help="Write JSON results here")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+        help="Allowed slowdown against the baseline, as a fraction")
+    options = parser.parse_args()
+
+    tests.setup_logging()
+    tests.setup_cli_imports()
+    return run_and_report([int(s) for s in options.scales.split(",")],
+                          options.output, options.baseline,
+                          options.tolerance)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+"""
+Time parsing domain XML with virtinst.Guest. Run from the top of the
+source tree with:
+
+    python3 -m tests.benchmarks.xmlparse [--count N]
+"""
+
+import argparse
+import glob
+import time
+
+import virtinst
+
+from tests import utils
+
+
+def _load_domain_xmls():
+    ret = []
+    for f in sorted(glob.glob("tests/xmlparse-xml/*-in.xml")):
+        xml = open(f).read()
+        if xml.lstrip().startswith("<domain"):
+            ret.append(xml)
+    return ret
+
+
+# name -> callback run on every parsed Guest
+SCENARIOS = [
+    ("parse", lambda guest: None),
+    ("name", lambda guest: guest.name),
+    ("disks", lambda guest: guest.get_devices("disk")),
+    ("all-devices", lambda guest: guest.get_all_devices()),
+    ("get-xml", lambda guest: guest.get_xml_config()),
+]
+
+
+def run(count):
+    """
+    Parse count domain XML documents for every scenario, cycling through
+    the tests/xmlparse-xml inputs. Returns a list of
+    (scenario name, seconds) tuples.
+    """
+    conn = utils.URIs.open_testdefault_cached()
+    xmls = _load_domain_xmls()
+    docs = [xmls[i % len(xmls)] for i in range(count)]
+
+    ret = []
+    for name, cb in SCENARIOS:
+        start = time.time()
+        for xml in docs:
+            cb(virtinst.Guest(conn, parsexml=xml))
+        ret.append((name, time.time() - start))
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark virtinst domain XML parsing")
+    parser.add_argument("--count", type=int, default=1000,
+        help="Number of domain XML documents to parse per scenario")
+    options = parser.parse_args()
+
+    for name, secs in run(options.count):
+        print("%-12s %d docs: %.3fs (%.3fms/doc)" %
+              (name, options.count, secs, secs * 1000.0 / options.count))
+
+
+if __name__ == "__main__":
+    main()
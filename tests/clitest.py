@@ -19,6 +19,7 @@ import atexit
 from distutils.spawn import find_executable
 import io
 import logging
+import multiprocessing
 import os
 import shlex
 import shutil
@@ -27,6 +28,7 @@ import traceback
 import unittest
 
 from virtinst import support
+from virtinst import xmlbuilder
 
 from tests import virtinstall, virtclone, virtconvert, virtxml
 from tests import utils
@@ -220,6 +222,14 @@ class Command(object):
         tests.skipTest(skipmsg)
         return True
 
+    def uses_local_files(self):
+        """
+        Whether the command touches the shared files in /tmp, which
+        means it can't run concurrently with other such commands
+        """
+        return any([f in self.cmdstr for f in
+                    clean_files + [virtconv_out]])
+
     def run(self, tests):
         err = None
 
@@ -1000,6 +1010,10 @@ c.add_valid("-n clonetest --original-xml %(CLONE_DISK_XML)s --file %(EXISTIMG3)s
 c.add_invalid("--auto-clone")  # Just the auto flag
 c.add_invalid("--connect %(URI-TEST-FULL)s -o test-many-devices --auto-clone")  # VM is running, but --clone-running isn't passed
 c.add_invalid("--connect %(URI-TEST-FULL)s -o test-clone-simple -n newvm --file %(EXISTIMG1)s --clone-running")  # Should complain about overwriting existing file
+c.add_valid("--original-xml %(CLONE_STORAGE_XML)s --auto-clone --count 3 --print-xml")  # Batch clone w/ managed storage
+c.add_valid("--original-xml %(CLONE_DISK_XML)s --auto-clone --count 2 --name-template batch%%02d --print-xml")  # Batch clone w/ name template
+c.add_invalid("--original-xml %(CLONE_DISK_XML)s --auto-clone --count 2 --name-template batch")  # Name template without a number
+c.add_invalid("--original-xml %(CLONE_DISK_XML)s --auto-clone --count 2 -n newvm")  # --name and --count conflict
 
 
 c = vclon.add_category("general", "-n clonetest")
@@ -1048,6 +1062,9 @@ c.add_compare("%(OVF_IMG1)s --disk-format none --destination /tmp --print-xml",
 newidx = 0
 curtest = 0
 
+# Set in run_parallel worker processes
+_parallel_worker = False
+
 
 def setup():
     """
@@ -1072,19 +1089,21 @@ class CLITests(unittest.TestCase):
         global curtest
         curtest += 1
         # Only run this for first test
-        if curtest == 1:
+        if curtest == 1 and not _parallel_worker:
             setup()
 
     def tearDown(self):
         # Only run this on the last test
-        if curtest == newidx:
+        if curtest == newidx and not _parallel_worker:
             cleanup()
 
 
 def maketest(cmd):
     def cmdtemplate(self, _cmdobj):
         _cmdobj.run(self)
-    return lambda s: cmdtemplate(s, cmd)
+    ret = lambda s: cmdtemplate(s, cmd)
+    ret.cmd = cmd
+    return ret
 
 _cmdlist = []
 _cmdlist += vinst.cmds
@@ -1104,3 +1123,135 @@ for _cmd in _cmdlist:
     setattr(CLITests, _name, maketest(_cmd))
 
 atexit.register(cleanup)
+
+
+#####################
+# Parallel running #
+#####################
+
+# Number of tests handed to a worker at a time
+_CHUNK_SIZE = 8
+
+
+def _run_chunk(names):
+    """
+    Run the passed CLITests methods in a worker process, returning
+    a list of (name, status, message) tuples
+    """
+    global _parallel_worker
+    _parallel_worker = True
+
+    ret = []
+    for name in names:
+        result = unittest.TestResult()
+        CLITests(name).run(result)
+        problems = result.errors + result.failures
+        if problems:
+            ret.append((name, "fail", problems[0][1]))
+        elif result.skipped:
+            ret.append((name, "skip", result.skipped[0][1]))
+        else:
+            ret.append((name, "ok", None))
+
+    # checkprops runs in the parent, so report back which XML properties
+    # these tests touched. Workers are forked, so _allprops indexes match
+    # pylint: disable=protected-access
+    seen = set([id(p) for p in xmlbuilder._seenprops])
+    propidxs = [idx for idx, p in enumerate(xmlbuilder._allprops)
+                if id(p) in seen]
+    return ret, propidxs
+
+
+class _ReplayedCLITest(unittest.TestCase):
+    """
+    Reports the result of a CLITests method that ran in a worker
+    """
+    def __init__(self, name, status, msg):
+        unittest.TestCase.__init__(self, "runTest")
+        self._name = name
+        self._status = status
+        self._msg = msg
+
+    def id(self):
+        return "%s.CLITests.%s" % (__name__, self._name)
+
+    def __str__(self):
+        return "%s (%s.CLITests)" % (self._name, __name__)
+
+    def runTest(self):
+        if self._status == "skip":
+            self.skipTest(self._msg)
+        if self._status == "fail":
+            self.fail(self._msg)
+
+
+def _make_chunks(names, jobs):
+    """
+    Split the test names into one work list per worker. Every command
+    that uses the shared /tmp files goes into a list of its own, so
+    those run serially in test order. The rest is dealt out round robin
+    in _CHUNK_SIZE pieces to the other lists, so the local file list
+    doesn't also get a share on top. Lists only depend on the test list
+    and jobs, and each runs in its own fresh worker process, so runs
+    and regenerated compare files are reproducible.
+
+    Commands don't share a connection within a worker: --print-xml and
+    --dry-run still create pools through manage_path(), so a reused
+    connection leaks that state into later commands and the output
+    depends on scheduling. Every command opens its own connection.
+    """
+    local = []
+    other = []
+    for name in names:
+        if getattr(CLITests, name).cmd.uses_local_files():
+            local.append(name)
+        else:
+            other.append(name)
+
+    chunks = [[] for ignore in range(jobs)]
+    first = 0
+    if local:
+        chunks[0].extend(local)
+        if jobs > 1:
+            first = 1
+    for count, idx in enumerate(range(0, len(other), _CHUNK_SIZE)):
+        chunkidx = first + (count % (jobs - first))
+        chunks[chunkidx].extend(other[idx:idx + _CHUNK_SIZE])
+    return [c for c in chunks if c]
+
+
+def run_parallel(testcases, jobs):
+    """
+    Run the passed CLITests instances across jobs forked worker
+    processes. Returns a list of test cases that replay the results,
+    in the original order, for the regular unittest runner to report.
+    """
+    from virtinst import OSDB
+
+    names = [t._testMethodName for t in testcases]
+    if not names:
+        return []
+
+    # Load osinfo once here rather than in every worker
+    OSDB.list_os()
+    setup()
+
+    results = {}
+    # maxtasksperchild=1 means no work list sees state left behind
+    # by another one in the same process
+    pool = multiprocessing.get_context("fork").Pool(jobs,
+                                                    maxtasksperchild=1)
+    try:
+        for chunkresults, propidxs in pool.imap(
+                _run_chunk, _make_chunks(names, jobs), chunksize=1):
+            for name, status, msg in chunkresults:
+                results[name] = (status, msg)
+            for idx in propidxs:
+                # pylint: disable=protected-access
+                xmlbuilder._seenprops.append(xmlbuilder._allprops[idx])
+    finally:
+        pool.close()
+        pool.join()
+        cleanup()
+
+    return [_ReplayedCLITest(name, *results[name]) for name in names]
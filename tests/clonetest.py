@@ -142,6 +142,46 @@ class TestClone(unittest.TestCase):
         disks = ["%s/new1.img" % POOL1, "%s/new2.img" % DISKPOOL]
         self._clone("managed-storage", disks=disks)
 
+    def testCloneStorageLinked(self):
+        infile = os.path.join(clonexml_dir, "managed-storage-in.xml")
+        cloneobj = Cloner(utils.URIs.open_testdriver_cached())
+        cloneobj.original_xml = utils.read_file(infile)
+        cloneobj.linked_target = ["hda"]
+        cloneobj.skip_target = "hdb"
+        cloneobj = self._default_clone_values(cloneobj,
+                                              ["%s/new1.img" % POOL1])
+        cloneobj.setup_original()
+        cloneobj.setup_clone()
+
+        vol_install = cloneobj.clone_disks[0].get_vol_install()
+        self.assertEqual(vol_install.format, "qcow2")
+        self.assertEqual(vol_install.backing_store, P1_VOL1)
+        self.assertEqual(vol_install.allocation, 0)
+        self.assertTrue("<driver name=\"qemu\" type=\"qcow2\"/>" in
+                        cloneobj.clone_xml)
+        # Only overlay metadata is written, there's nothing to copy
+        # pylint: disable=protected-access
+        self.assertEqual(cloneobj._get_duplicate_size(), 0)
+
+    def testCloneBatch(self):
+        infile = os.path.join(clonexml_dir, "managed-storage-in.xml")
+        cloneobj = Cloner(utils.URIs.open_testdriver_cached())
+        cloneobj.original_xml = utils.read_file(infile)
+        cloneobj.setup_original()
+        clones = cloneobj.generate_batch(3, name_template="batch%02d")
+
+        self.assertEqual([c.clone_name for c in clones],
+                         ["batch01", "batch02", "batch03"])
+        self.assertEqual(len(set(c.clone_uuid for c in clones)), 3)
+        paths = sum([c.clone_paths for c in clones], [])
+        self.assertEqual(len(paths), 6)
+        self.assertEqual(len(set(paths)), 6)
+        for clone in clones:
+            self.assertTrue("<name>%s</name>" % clone.clone_name in
+                            clone.clone_xml)
+
+        self.assertRaises(ValueError, cloneobj.generate_batch, 2, "batch")
+
     def testCloneStorageCrossPool(self):
         conn = utils.URIs.open_test_remote()
         clone_disks_file = os.path.join(
@@ -0,0 +1,78 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+
+import unittest
+
+import cairo
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gdk
+
+from virtManager.graphwidgets import CellRendererSparkline
+
+
+def _render(renderer, rowkey, stamp, data, width, height=20):
+    """
+    Render one row like the manager does: data_array is only handed
+    over when is_cached() says the row's graph is out of date
+    """
+    if not renderer.is_cached(rowkey, stamp):
+        renderer.set_property("data_array", data)
+    renderer.set_property("cache_key", (rowkey, stamp))
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    area = Gdk.Rectangle()
+    area.x = 0
+    area.y = 0
+    area.width = width
+    area.height = height
+    renderer.do_render(cairo.Context(surface), None, area, area, 0)
+    surface.flush()
+    return bytes(surface.get_data())
+
+
+class TestSparklineCache(unittest.TestCase):
+    """
+    Tests for CellRendererSparkline's per row surface cache
+    """
+    def testResizeTwoRows(self):
+        rowa = [0.1, 0.9, 0.1, 0.9, 0.1]
+        rowb = [0.5, 0.5, 0.5, 0.5, 0.5]
+        renderer = CellRendererSparkline()
+        _render(renderer, "a", 1, rowa, 40)
+        _render(renderer, "b", 1, rowb, 40)
+
+        # A column resize re-renders both rows without new data, each
+        # must still be drawn from its own samples
+        gota = _render(renderer, "a", 1, rowa, 60)
+        gotb = _render(renderer, "b", 1, rowb, 60)
+        self.assertEqual(gota,
+            _render(CellRendererSparkline(), "a", 1, rowa, 60))
+        self.assertEqual(gotb,
+            _render(CellRendererSparkline(), "b", 1, rowb, 60))
+        self.assertNotEqual(gota, gotb)
+
+    def testNewSample(self):
+        renderer = CellRendererSparkline()
+        _render(renderer, "a", 1, [0.1] * 5, 40)
+        self.assertTrue(renderer.is_cached("a", 1))
+        self.assertFalse(renderer.is_cached("a", 2))
+
+        got = _render(renderer, "a", 2, [0.9] * 5, 40)
+        self.assertEqual(got,
+            _render(CellRendererSparkline(), "a", 2, [0.9] * 5, 40))
@@ -0,0 +1,102 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import time
+import unittest
+
+import libvirt
+
+from virtinst import jobmonitor
+from virtinst import progress
+
+
+class _FakeDomain(object):
+    def __init__(self, samples):
+        self.samples = samples
+
+    def name(self):
+        return "fake"
+
+    def jobStats(self, flags):
+        ignore = flags
+        return self.samples.pop(0)
+
+
+class TestJobMonitor(unittest.TestCase):
+    """
+    Tests for JobStats parsing and JobMonitor meter reporting
+    """
+    def testStats(self):
+        stats = jobmonitor.JobStats({
+            "type": libvirt.VIR_DOMAIN_JOB_UNBOUNDED,
+            "data_total": 1000, "data_processed": 400,
+            "data_remaining": 500, "memory_iteration": 3,
+            "memory_dirty_rate": 10, "memory_page_size": 4096,
+            "downtime": 250})
+        self.assertEqual(stats.get_total(), 1000)
+        self.assertEqual(stats.get_processed(), 500)
+        self.assertEqual(stats.memory_dirty_rate, 40960)
+        self.assertEqual(stats.is_converging(), None)
+
+        stats.throughput = 1024
+        self.assertFalse(stats.is_converging())
+        details = stats.format_details()
+        self.assertTrue("Expected downtime: 250 ms" in details)
+        self.assertTrue("may not converge" in details)
+        self.assertTrue(stats.format_summary().startswith("pass 3"))
+
+    def testEstimatedDowntime(self):
+        total = 1024 * 1024 * 1024 * 1024
+        samples = [{"type": libvirt.VIR_DOMAIN_JOB_UNBOUNDED,
+                    "data_total": total,
+                    "data_remaining": total - processed,
+                    "memory_remaining": total - processed}
+                   for processed in [0, 1024, 2048]]
+        monitor = jobmonitor.JobMonitor(_FakeDomain(samples))
+        for ignore in range(3):
+            stats = monitor.poll()
+            time.sleep(.01)
+
+        # Our guess never masquerades as libvirt's expected downtime
+        self.assertEqual(stats.downtime, None)
+        self.assertTrue(stats.estimated_downtime > 0)
+        details = stats.format_details()
+        self.assertTrue("Estimated downtime: ~" in details)
+        self.assertTrue("Expected downtime" not in details)
+
+    def testMonitor(self):
+        samples = [{"type": libvirt.VIR_DOMAIN_JOB_UNBOUNDED,
+                    "data_total": 0}]
+        for processed in [100, 200, 300]:
+            samples.append({"type": libvirt.VIR_DOMAIN_JOB_UNBOUNDED,
+                            "data_total": 1000,
+                            "data_remaining": 1000 - processed})
+        samples.append({"type": libvirt.VIR_DOMAIN_JOB_NONE})
+
+        meter = progress.BaseMeter()
+        meter.update_period = 0
+        monitor = jobmonitor.JobMonitor(_FakeDomain(samples), meter=meter,
+                                        text="Testing")
+        monitor.poll()
+        self.assertEqual(meter.size, None)
+        for ignore in range(3):
+            self.assertTrue(monitor.poll())
+        self.assertEqual(meter.size, 1000)
+        self.assertEqual(meter.text, "Testing")
+        self.assertEqual(meter.last_amount_read, 300)
+        self.assertTrue(meter.job_stats is monitor.get_latest())
+        self.assertEqual(monitor.poll(), None)
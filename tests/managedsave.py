@@ -0,0 +1,136 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import threading
+import time
+import unittest
+
+import libvirt
+
+from virtinst import ManagedSaveOrchestrator
+
+
+class _FakeDomain(object):
+    running = 0
+    maxrunning = 0
+    order = []
+    lock = threading.Lock()
+
+    def __init__(self, name, memory, autostart=False, fail=False):
+        self._name = name
+        self._memory = memory
+        self._autostart = autostart
+        self._fail = fail
+        self._aborted = False
+
+    def name(self):
+        return self._name
+    def info(self):
+        return [1, self._memory, self._memory, 1, 0]
+    def autostart(self):
+        return self._autostart
+    def jobStats(self, flags):
+        ignore = flags
+        return {"type": libvirt.VIR_DOMAIN_JOB_NONE}
+
+    def _work(self):
+        cls = _FakeDomain
+        with cls.lock:
+            cls.order.append(self._name)
+            cls.running += 1
+            cls.maxrunning = max(cls.maxrunning, cls.running)
+        time.sleep(.1)
+        with cls.lock:
+            cls.running -= 1
+        if self._fail:
+            raise RuntimeError("failed %s" % self._name)
+        if self._aborted:
+            err = libvirt.libvirtError("operation aborted %s" % self._name)
+            err.err = (libvirt.VIR_ERR_OPERATION_ABORTED, 0,
+                       str(err), 2, None, None, None, 0, 0)
+            raise err
+
+    def managedSave(self, flags):
+        ignore = flags
+        self._work()
+    def create(self):
+        self._work()
+    def abortJob(self):
+        self._aborted = True
+
+
+class TestManagedSave(unittest.TestCase):
+    """
+    Tests for ManagedSaveOrchestrator scheduling and reporting
+    """
+    def setUp(self):
+        _FakeDomain.order = []
+        _FakeDomain.maxrunning = 0
+
+    def testSave(self):
+        doms = [_FakeDomain("vm%d" % i, 1024) for i in range(6)]
+        doms[2] = _FakeDomain("vm2", 1024, fail=True)
+        orch = ManagedSaveOrchestrator(None, maxworkers=3)
+        phase = orch.save(doms)
+
+        self.assertEqual(_FakeDomain.maxrunning, 3)
+        self.assertEqual(phase.get_failed()[0][0], "vm2")
+        self.assertEqual(len(phase.get_succeeded()), 5)
+        self.assertEqual(phase.bytes, 5 * 1024 * 1024)
+        self.assertTrue(phase.elapsed > 0)
+        self.assertTrue("5 of 6 VMs" in phase.format_summary())
+
+    def testRestoreThrottle(self):
+        doms = [_FakeDomain("big", 4096),
+                _FakeDomain("small", 1024),
+                _FakeDomain("auto", 1024, autostart=True),
+                _FakeDomain("first", 1024)]
+        orch = ManagedSaveOrchestrator(None, maxworkers=4,
+            max_inflight_bytes=2048 * 1024)
+        phase = orch.restore(doms, priorities={"first": -1})
+
+        # 'big' is over the inflight limit, so it only starts alone
+        self.assertEqual(_FakeDomain.order[:2], ["first", "auto"])
+        self.assertEqual(_FakeDomain.maxrunning, 2)
+        self.assertEqual(list(phase.results.keys()),
+                         ["first", "auto", "big", "small"])
+        self.assertEqual(phase.get_failed(), [])
+
+    def testCancel(self):
+        doms = [_FakeDomain("vm%d" % i, 1024) for i in range(4)]
+        doms[1] = _FakeDomain("vm1", 1024, fail=True)
+        orch = ManagedSaveOrchestrator(None, maxworkers=2)
+        phases = []
+        t = threading.Thread(target=lambda: phases.append(orch.save(doms)))
+        t.start()
+        time.sleep(.05)
+        orch.cancel()
+        t.join(5)
+
+        # Aborted saves are reported as cancelled, not as failures, but
+        # a genuine failure during cancel still is one
+        phase = phases[0]
+        self.assertEqual(phase.cancelled, ["vm0"])
+        self.assertEqual(phase.skipped, ["vm2", "vm3"])
+        self.assertEqual([f[0] for f in phase.get_failed()], ["vm1"])
+        self.assertTrue("0 of 4 VMs" in phase.format_summary())
+
+        # A cancel before the run starts is honoured too
+        _FakeDomain.order = []
+        phase = orch.restore(doms)
+        self.assertEqual(_FakeDomain.order, [])
+        self.assertEqual(len(phase.skipped), 4)
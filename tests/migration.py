@@ -0,0 +1,64 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+import unittest
+
+import libvirt
+
+from virtinst import MigrationTuning
+
+
+class TestMigrationTuning(unittest.TestCase):
+    """
+    Tests for MigrationTuning flag and parameter building
+    """
+    def testDefault(self):
+        tuning = MigrationTuning()
+        self.assertTrue(tuning.is_default())
+        self.assertEqual(tuning.get_flags(), 0)
+        self.assertEqual(tuning.get_params(), {})
+        self.assertEqual(tuning.start_live_tuning(None), None)
+
+    def testFromString(self):
+        tuning = MigrationTuning.from_string(
+            "compression=xbzrle+mt,compression_threads=4,auto-converge=on,"
+            "postcopy-after=30,parallel=4,bandwidth=1000,downtime=300")
+        self.assertFalse(tuning.is_default())
+        self.assertEqual(tuning.compression, ["xbzrle", "mt"])
+        self.assertTrue(tuning.postcopy)
+        self.assertEqual(tuning.postcopy_after, 30)
+
+        flags = tuning.get_flags()
+        for name in ["VIR_MIGRATE_COMPRESSED", "VIR_MIGRATE_AUTO_CONVERGE",
+                     "VIR_MIGRATE_POSTCOPY", "VIR_MIGRATE_PARALLEL"]:
+            self.assertTrue(flags & getattr(libvirt, name))
+
+        params = tuning.get_params()
+        self.assertEqual(params[libvirt.VIR_MIGRATE_PARAM_COMPRESSION],
+                         ["xbzrle", "mt"])
+        self.assertEqual(params[libvirt.VIR_MIGRATE_PARAM_BANDWIDTH], 1000)
+        self.assertEqual(
+            params[libvirt.VIR_MIGRATE_PARAM_PARALLEL_CONNECTIONS], 4)
+
+    def testInvalid(self):
+        for optstr in ["compression=foo",
+                       "compression=xbzrle,compression-threads=2",
+                       "auto-converge=maybe",
+                       "downtime=-1",
+                       "frobnicate=1"]:
+            self.assertRaises(ValueError,
+                              MigrationTuning.from_string, optstr)
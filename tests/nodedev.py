@@ -18,10 +18,12 @@
 # MA 02110-1301 USA.
 
 import os.path
+import string  # pylint: disable=deprecated-module
 import unittest
 
 from virtinst import NodeDevice
 from virtinst import VirtualHostDevice
+from virtinst.xmlbuilder import sanitize_xml
 
 from tests import utils
 
@@ -120,6 +122,15 @@ class TestNodeDev(unittest.TestCase):
                 "name": "computer", "parent": None}
         self._testCompare(None, vals, funky_chars_xml)
 
+    def testSanitizeXML(self):
+        # Must match the original per character filter exactly
+        xml = "".join(chr(i) for i in range(0x3000))
+        expect = "".join([c for c in
+            xml.encode("ascii", "ignore").decode("ascii")
+            if c in string.printable])
+        self.assertEqual(sanitize_xml(xml), expect)
+        self.assertEqual(sanitize_xml(xml.encode("utf-8")), expect)
+
     def testNetDevice1(self):
         devname = "net_00_1c_25_10_b1_e4"
         vals = {"name": "net_00_1c_25_10_b1_e4", "parent": "pci_8086_1049",
@@ -0,0 +1,182 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+
+
+import csv
+import gzip
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from virtManager import statsrecorder
+from virtManager.statsrecorder import HOST_OBJECT
+
+
+def _sample(val):
+    return dict((f, float(val)) for f in statsrecorder.CSV_HEADER[2:])
+
+
+def _read_csv(path):
+    with gzip.open(path, "rt", newline="") as f:
+        return list(csv.reader(f))
+
+
+class TestStatsRecorder(unittest.TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp(prefix="virtmanager-stats")
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def _day(self, day):
+        # Noon local time, so the filename date is stable across TZs
+        return time.mktime((2018, 3, day, 12, 0, 0, 0, 0, -1))
+
+    def _history_files(self):
+        return sorted(f for f in os.listdir(self.outdir)
+                      if f.startswith("stats-"))
+
+    def testPrometheusEscaping(self):
+        uri = "test:///some\\path\"x\""
+        samples = {
+            HOST_OBJECT: (1.5, _sample(1)),
+            "vm\"with\\odd\nname": (2, _sample(2)),
+        }
+        text = statsrecorder.format_prometheus(uri, samples)
+        lines = text.splitlines()
+
+        self.assertTrue(text.endswith("\n"))
+        self.assertIn("# TYPE virt_manager_host_memory_kib gauge", lines)
+        self.assertIn('virt_manager_host_memory_kib'
+            '{uri="test:///some\\\\path\\"x\\""} 1.0 1500', lines)
+        self.assertIn('virt_manager_domain_memory_kib'
+            '{uri="test:///some\\\\path\\"x\\"",'
+            'domain="vm\\"with\\\\odd\\nname"} 2.0 2000', lines)
+        # Escaped newlines must not split a sample across lines
+        self.assertFalse([l for l in lines if l.startswith("name")])
+
+    def testPrometheusNoDomains(self):
+        text = statsrecorder.format_prometheus("test:///default",
+            {HOST_OBJECT: (1, _sample(0))})
+        self.assertNotIn("virt_manager_domain_", text)
+
+    def testRecordCSV(self):
+        recorder = statsrecorder.vmmStatsRecorder("test:///default",
+            self.outdir)
+        try:
+            ts = self._day(1)
+            recorder.record(ts, {HOST_OBJECT: _sample(1), "vm1": _sample(2)})
+            recorder.record(ts + 1, {HOST_OBJECT: _sample(3)})
+            path = recorder.get_history_path()
+        finally:
+            recorder.close()
+
+        self.assertEqual(os.path.basename(path), "stats-20180301.csv.gz")
+        rows = _read_csv(path)
+        self.assertEqual(rows[0], statsrecorder.CSV_HEADER)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][:3], ["%.3f" % ts, HOST_OBJECT, "1.00"])
+        self.assertEqual(rows[2][:3], ["%.3f" % ts, "vm1", "2.00"])
+        self.assertEqual(rows[3][:3], ["%.3f" % (ts + 1), HOST_OBJECT, "3.00"])
+
+    def testRecordAppend(self):
+        # A second session on the same day appends without a new header
+        ts = self._day(1)
+        for val in [1, 2]:
+            recorder = statsrecorder.vmmStatsRecorder("test:///default",
+                self.outdir)
+            try:
+                recorder.record(ts + val, {HOST_OBJECT: _sample(val)})
+            finally:
+                recorder.close()
+
+        rows = _read_csv(os.path.join(self.outdir, "stats-20180301.csv.gz"))
+        self.assertEqual(rows.count(statsrecorder.CSV_HEADER), 1)
+        self.assertEqual([r[2] for r in rows[1:]], ["1.00", "2.00"])
+
+    def testRecordRolloverRetention(self):
+        recorder = statsrecorder.vmmStatsRecorder("test:///default",
+            self.outdir, history_days=2)
+        try:
+            for day in [1, 2, 3]:
+                recorder.record(self._day(day), {HOST_OBJECT: _sample(day)})
+                self.assertTrue(recorder.get_history_path().endswith(
+                    "stats-201803%02d.csv.gz" % day))
+            # Rolling over to the 4th drops everything from the 2nd back
+            recorder.record(self._day(4), {HOST_OBJECT: _sample(4)})
+        finally:
+            recorder.close()
+
+        self.assertEqual(self._history_files(),
+            ["stats-20180303.csv.gz", "stats-20180304.csv.gz"])
+        for day in [3, 4]:
+            rows = _read_csv(os.path.join(self.outdir,
+                "stats-201803%02d.csv.gz" % day))
+            self.assertEqual(rows[0], statsrecorder.CSV_HEADER)
+            self.assertEqual([r[2] for r in rows[1:]], ["%d.00" % day])
+
+    def testRecordNoRetention(self):
+        recorder = statsrecorder.vmmStatsRecorder("test:///default",
+            self.outdir)
+        try:
+            for day in [1, 10, 20]:
+                recorder.record(self._day(day), {HOST_OBJECT: _sample(day)})
+        finally:
+            recorder.close()
+        self.assertEqual(len(self._history_files()), 3)
+
+    def testInactiveDropped(self):
+        recorder = statsrecorder.vmmStatsRecorder("test:///default",
+            self.outdir, record_history=False)
+        try:
+            recorder.record(1, {HOST_OBJECT: _sample(1),
+                                "vm1": _sample(1), "vm2": _sample(1)})
+            # vm1 wasn't sampled but is still running, vm2 shut off
+            recorder.record(2, {HOST_OBJECT: _sample(2), "vm2": _sample(0)},
+                            active=["vm1"])
+            text = recorder.get_prometheus_text()
+        finally:
+            recorder.close()
+
+        self.assertIsNone(recorder.get_history_path())
+        self.assertIn('domain="vm1"} 1.0 1000', text)
+        self.assertNotIn('domain="vm2"', text)
+
+    def testLongSocketPath(self):
+        longdir = os.path.join(self.outdir, "x" * 120)
+        os.mkdir(longdir)
+        recorder = statsrecorder.vmmStatsRecorder("test:///default",
+            self.outdir, record_history=False,
+            socket_path=os.path.join(longdir, "stats.sock"))
+        try:
+            path = recorder.get_socket_path()
+            self.assertIsNone(recorder.get_socket_error())
+            self.assertTrue(path)
+            self.assertFalse(path.startswith(longdir))
+            self.assertTrue(os.path.exists(path))
+            # The fallback lives in a private directory, and the socket
+            # is never accessible to anyone else
+            self.assertEqual(
+                stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        finally:
+            recorder.close()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
@@ -17,9 +17,12 @@
 
 import logging
 import os
+import threading
+import time
 import unittest
 
 from virtinst import StoragePool, StorageVolume
+from virtinst.storage import _AllocationPoller
 
 from tests import utils
 
@@ -109,6 +112,61 @@ def createVol(conn, poolobj, volname=None, input_vol=None, clone_vol=None):
     return vol_inst.install(meter=False)
 
 
+class _RecordingMeter(object):
+    def __init__(self):
+        self.updates = 0
+        self.late_updates = 0
+        self.ended = False
+
+    def start(self, size=None, text=None):
+        ignore = size
+        ignore = text
+
+    def update(self, amount_read, now=None):
+        ignore = amount_read
+        ignore = now
+        if self.ended:
+            self.late_updates += 1
+        self.updates += 1
+
+    def end(self, amount_read, now=None):
+        ignore = amount_read
+        ignore = now
+        self.ended = True
+
+
+class _FakeVol(object):
+    def info(self):
+        return [0, 10 * 1024 * 1024, 5 * 1024 * 1024]
+
+
+class _SlowPool(object):
+    """
+    Wrap a pool so every createXML call blocks until all the parallel
+    installs have registered with the poller and it has had time to
+    report some progress
+    """
+    def __init__(self, pool, count):
+        self._pool = pool
+        self._barrier = threading.Barrier(count)
+        self.pollers = []
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def storageVolLookupByName(self, name):
+        ignore = name
+        return _FakeVol()
+
+    def createXML(self, xml, flags):
+        # pylint: disable=protected-access
+        self._barrier.wait()
+        self.pollers.append(list(_AllocationPoller._pollers.values()))
+        time.sleep(_AllocationPoller.MIN_INTERVAL * 4)
+        self._barrier.wait()
+        return self._pool.createXML(xml, flags)
+
+
 class TestStorage(unittest.TestCase):
     @property
     def conn(self):
@@ -202,6 +260,62 @@ class TestStorage(unittest.TestCase):
                 StoragePool.TYPE_GLUSTER, "pool-gluster")
         removePool(poolobj)
 
+    def testParallelAllocationPoller(self):
+        # pylint: disable=protected-access
+        conn = self.conn
+        count = 4
+        poolobj = createPool(conn, StoragePool.TYPE_DIR, "pool-dir-parallel")
+        slowpool = _SlowPool(poolobj, count)
+        key = (conn.uri, poolobj.name())
+        meters = []
+        errors = []
+
+        def _install(idx):
+            try:
+                vol_inst = StorageVolume(conn)
+                vol_inst.pool = poolobj
+                vol_inst._pool = slowpool
+                vol_inst.name = "parallel-vol%d" % idx
+                vol_inst.capacity = 10 * 1024 * 1024
+                vol_inst.allocation = 5 * 1024 * 1024
+                meter = _RecordingMeter()
+                meters.append(meter)
+                vol_inst.install(meter=meter)
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            threads = [threading.Thread(target=_install, args=(idx,))
+                       for idx in range(count)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(30)
+
+            self.assertEqual(errors, [])
+            self.assertEqual(len(slowpool.pollers), count)
+            for pollers in slowpool.pollers:
+                self.assertEqual(len(pollers), 1)
+                self.assertTrue(pollers[0] is slowpool.pollers[0][0])
+            poller = slowpool.pollers[0][0]
+
+            # The poller thread exits and unregisters once every
+            # install has stopped watching
+            for ignore in range(100):
+                if key not in _AllocationPoller._pollers:
+                    break
+                time.sleep(.1)
+            self.assertTrue(key not in _AllocationPoller._pollers)
+            self.assertTrue(poller._thread is None)
+
+            time.sleep(_AllocationPoller.MIN_INTERVAL * 2)
+            for meter in meters:
+                self.assertTrue(meter.ended)
+                self.assertTrue(meter.updates > 0)
+                self.assertEqual(meter.late_updates, 0)
+        finally:
+            removePool(poolobj)
+
 
     ##############################
     # Tests for pool-sources API #
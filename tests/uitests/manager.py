@@ -61,6 +61,33 @@ class Manager(uiutils.UITestCase):
 
         self._testVMLifecycle()
 
+    def testVMBulkLifecycle(self):
+        """
+        Multi select a few VMs and start/stop them all at once
+        """
+        manager = self.app.topwin
+        run = manager.find("Run", "push button")
+        shutdown = manager.find("Shut Down", "push button")
+        smenu = manager.find("Menu", "toggle button")
+        force = manager.find("Force Off", "menu item")
+
+        manager.find("test-clone-simple", "table cell").click()
+        dogtail.rawinput.holdKey("Control_L")
+        manager.find("test-state-shutoff", "table cell").click()
+        dogtail.rawinput.releaseKey("Control_L")
+
+        run.click()
+        uiutils.check_in_loop(lambda: not run.sensitive, timeout=5)
+        self.assertTrue(shutdown.sensitive)
+
+        smenu.click()
+        force.click()
+        alert = self.app.root.find("vmm dialog", "alert")
+        alert.find_fuzzy("force poweroff 2 virtual machines", "label")
+        alert.find("Yes", "push button").click()
+        uiutils.check_in_loop(lambda: run.sensitive, timeout=5)
+        self.assertFalse(shutdown.sensitive)
+
     def testManagerColumns(self):
         # Enable all stat options
         self.app.root.find("Edit", "menu").click()
@@ -33,3 +33,32 @@ class VMMMigrate(uiutils.UITestCase):
         alert.find("Close", "push button").click()
         mig.find("Cancel", "push button").click()
         uiutils.check_in_loop(lambda: not mig.showing)
+
+    def testMigrateAll(self):
+        # Add an additional connection
+        self.app.root.find("File", "menu").click()
+        self.app.root.find("Add Connection...", "menu item").click()
+        win = self.app.root.find_fuzzy("Add Connection", "dialog")
+        win.find_fuzzy("Hypervisor", "combo box").click()
+        win.find_fuzzy("Custom URI", "menu item").click()
+        win.find("uri-entry", "text").text = "test:///default"
+        win.find("Connect", "push button").click()
+
+        uiutils.check_in_loop(lambda: win.showing is False)
+        c = self.app.root.find_fuzzy("testdriver.xml", "table cell")
+        c.click(button=3)
+        self.app.root.find("conn-migrate", "menu item").click()
+
+        mig = self.app.root.find("Migrate the virtual machine", "frame")
+        mig.find("Advanced", "toggle button").click_expander()
+        mig.find_fuzzy("Parallel migrations", "spin button")
+        mig.find("Migrate", "push button").click()
+
+        # The test driver can't migrate, so every VM should fail and
+        # be offered for retry
+        cell = mig.find_fuzzy("Failed", "table cell")
+        cell.click()
+        uiutils.check_in_loop(
+            lambda: mig.find("Retry VM", "push button").sensitive)
+        mig.find("Cancel", "push button").click()
+        uiutils.check_in_loop(lambda: not mig.showing)
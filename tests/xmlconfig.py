@@ -19,6 +19,8 @@ import os
 import tempfile
 import unittest
 
+import libvirt
+
 import virtinst
 from virtinst import VirtualDisk
 from virtcli import CLIConfig
@@ -343,3 +345,97 @@ class TestXMLMisc(unittest.TestCase):
                 self.assertFalse(_is_dir_searchable(uid, username, tmpdir))
         finally:
             os.environ["VIRTINST_TEST_SUITE"] = oldtest
+
+    def testFetchCacheEvents(self):
+        # Test fetch_all_* cache counters and event driven patching
+        # pylint: disable=protected-access
+        conn = virtinst.cli.getConnection(utils.uri_test_default)
+        try:
+            self.assertEqual(len(conn.fetch_all_guests()), 1)
+            self.assertEqual(len(conn.fetch_all_guests()), 1)
+            stats = conn.fetch_cache_stats()
+            self.assertEqual([stats["hits"], stats["misses"]], [1, 1])
+
+            # Refreshing a single VM keeps the rest of the cache intact
+            dom = conn.lookupByName("test")
+            conn._domain_cache_event(conn, dom,
+                libvirt.VIR_DOMAIN_EVENT_DEFINED, 0, None)
+            self.assertEqual([g.name for g in conn.fetch_all_guests()],
+                             ["test"])
+
+            conn._domain_cache_event(conn, dom,
+                libvirt.VIR_DOMAIN_EVENT_UNDEFINED, 0, None)
+            self.assertEqual(conn.fetch_all_guests(), [])
+            self.assertEqual(conn.fetch_cache_stats()["patches"], 2)
+            self.assertEqual(conn.fetch_cache_stats()["misses"], 1)
+        finally:
+            conn.close()
+
+    def testParallelDiskSetup(self):
+        # New disks are created in parallel, and everything created is
+        # removed again if any disk fails
+        # pylint: disable=protected-access
+        conn = virtinst.cli.getConnection(utils.uri_test_full)
+        try:
+            pool = conn.storagePoolLookupByName("default-pool")
+            guest = conn.caps.lookup_virtinst_guest()
+
+            def _make_disks():
+                disks = []
+                for idx in range(3):
+                    d = virtinst.VirtualDisk(conn)
+                    d.path = "/dev/default-pool/parallel-%d.img" % idx
+                    d.set_vol_install(VirtualDisk.build_vol_install(conn,
+                        os.path.basename(d.path), pool, .001, False))
+                    d.validate()
+                    disks.append(d)
+                return disks
+
+            def _fail(meter):
+                ignore = meter
+                raise RuntimeError("Fake disk failure")
+
+            disks = _make_disks()
+            disks[1].setup = _fail
+            self.assertRaises(RuntimeError, guest._setup_disks, disks, None)
+            self.assertEqual([d for d in disks if d.storage_was_created], [])
+            self.assertEqual([v for v in pool.listVolumes()
+                              if v.startswith("parallel-")], [])
+
+            disks = _make_disks()
+            guest._setup_disks(disks, None)
+            self.assertEqual(sorted([v for v in pool.listVolumes()
+                                     if v.startswith("parallel-")]),
+                ["parallel-0.img", "parallel-1.img", "parallel-2.img"])
+        finally:
+            conn.close()
+
+    def testGenerateNameListing(self):
+        # Listing names up front must give the same answer as per name
+        # lookups, and fall back to lookups if listing fails
+        from virtinst import util
+        used = ["fedora", "fedora-2", "fedora-3", "fedora-05", "fedora-6"]
+
+        def collide(name):
+            return name in used
+
+        def listfail():
+            raise RuntimeError("listing not supported")
+
+        for kwargs in [{}, {"start_num": 2}, {"force_num": True},
+                       {"sep": "", "force_num": True}]:
+            expect = util.generate_name("fedora", collide,
+                                        lib_collision=False, **kwargs)
+            self.assertEqual(util.generate_name("fedora", None,
+                listnames_cb=lambda: used, **kwargs), expect)
+            self.assertEqual(util.generate_name("fedora", collide,
+                lib_collision=False, listnames_cb=listfail, **kwargs),
+                expect)
+
+        self.assertEqual(util.generate_name("fedora", None,
+            start_num=2, collidelist=["fedora-4"],
+            listnames_cb=lambda: used), "fedora-5")
+
+        cloner = virtinst.Cloner(self.conn)
+        cloner.original_guest = "test"
+        self.assertEqual(cloner.generate_clone_name(), "test-clone")
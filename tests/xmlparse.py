@@ -1422,6 +1422,62 @@ class XMLParseTest(unittest.TestCase):
 
         utils.diff_compare(guest.get_xml_config(), outfile)
 
+    def testLazyDeviceParse(self):
+        # Looking up a single device type shouldn't change the device
+        # objects we hand out once the whole device list is parsed
+        guest = self._get_test_content("change-disk")[0]
+        self.assertEqual(
+            guest.count_children_for_class(virtinst.VirtualDisk), 5)
+
+        disks = guest.get_devices("disk")
+        self.assertEqual(len(disks), 5)
+        alldevs = guest.get_all_devices()
+        for disk in disks:
+            self.assertTrue(disk in alldevs)
+        self.assertEqual([d for d in alldevs if d in disks], disks)
+
+        guest.remove_device(disks[0])
+        self.assertEqual(len(guest.get_devices("disk")), 4)
+        self.assertEqual(disks[1].get_xml_id(), "./devices/disk[1]")
+
+        guest = self._get_test_content("change-disk")[0]
+        roundtrip = virtinst.Guest(self.conn,
+                                   parsexml=guest.get_xml_config())
+        self.assertEqual(len(roundtrip.get_all_devices()),
+                         len(guest.get_all_devices()))
+
+    def testDeviceIndex(self):
+        guest = self._get_test_content("change-nics")[0]
+        view = guest.get_devices_view("interface")
+        self.assertTrue(isinstance(view, tuple))
+        self.assertTrue(view is guest.get_devices_view("interface"))
+        self.assertEqual(list(view), guest.get_devices("interface"))
+
+        nic = guest.find_device_by_mac("22:22:33:44:55:66")
+        self.assertTrue(nic is view[1])
+        self.assertTrue(guest.find_device_by_mac("22:22:33:44:55:6A") is None)
+        nic.macaddr = "22:22:33:44:55:6a"
+        self.assertTrue(guest.find_device_by_mac("22:22:33:44:55:6A") is nic)
+
+        # Views handed out earlier aren't changed by device removal
+        guest.remove_device(nic)
+        self.assertTrue(nic in view)
+        self.assertFalse(nic in guest.get_devices_view("interface"))
+        self.assertTrue(guest.find_device_by_mac("22:22:33:44:55:6a") is None)
+
+        guest = self._get_test_content("change-addr")[0]
+        self.assertEqual(guest.find_device_by_alias("channel0"),
+                         guest.get_devices("channel")[0])
+        self.assertEqual(guest.find_device_by_target("hda"),
+                         guest.get_devices("disk")[0])
+
+        disk = virtinst.VirtualDisk(self.conn)
+        disk.path = "/dev/null"
+        disk.target = "sdz"
+        guest.add_device(disk)
+        self.assertTrue(guest.find_device_by_target("sdz") is disk)
+        self.assertTrue(guest.get_devices_view("disk")[-1] is disk)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -863,17 +863,14 @@ class vmmAddHardware(vmmGObjectUI):
         devlist = self.widget("host-device")
         model = devlist.get_model()
         model.clear()
-        subdevs = []
-
-        if subtype:
-            subdevs = self.conn.filter_nodedevs(subtype, subcap)
 
         devs = self.conn.filter_nodedevs(devtype, devcap)
         for dev in devs:
             prettyname = dev.xmlobj.pretty_name()
 
-            for subdev in subdevs:
-                if dev.xmlobj.name == subdev.xmlobj.parent:
+            if subtype:
+                for subdev in self.conn.list_nodedev_children(
+                        dev.xmlobj.name, subtype, subcap):
                     prettyname += " (%s)" % subdev.xmlobj.pretty_name()
 
             model.append([prettyname, dev.xmlobj])
@@ -33,13 +33,14 @@ from .baseclass import vmmGObjectUI
 
 
 class vmmMeter(virtinst.progress.BaseMeter):
-    def __init__(self, cb_pulse, cb_fraction, cb_done):
+    def __init__(self, cb_pulse, cb_fraction, cb_done, cb_job_stats=None):
         virtinst.progress.BaseMeter.__init__(self)
         self.started = False
 
         self._vmm_pulse = cb_pulse
         self._vmm_fraction = cb_fraction
         self._vmm_done = cb_done
+        self._vmm_job_stats = cb_job_stats
 
 
     def _do_start(self, now=None):
@@ -83,6 +84,10 @@ class vmmMeter(virtinst.progress.BaseMeter):
             self._vmm_done(out, text)
         self.started = False
 
+    def _do_job_stats(self, stats):
+        if self._vmm_job_stats:
+            self._vmm_job_stats(stats)
+
 
 def cb_wrapper(callback, asyncjob, *args, **kwargs):
     try:
@@ -251,9 +256,23 @@ class vmmAsyncJob(vmmGObjectUI):
         if not self._meter:
             self._meter = vmmMeter(self._pbar_pulse,
                                    self._pbar_fraction,
-                                   self._pbar_done)
+                                   self._pbar_done,
+                                   self._pbar_job_stats)
         return self._meter
 
+    def set_progress(self, frac, progress, stage=None):
+        """
+        Report progress for jobs that don't map to a byte count meter.
+        Safe to call from the job thread
+        """
+        self._pbar_fraction(frac, progress, stage)
+
+    def get_job_stats(self):
+        """
+        Latest virtinst.jobmonitor.JobStats reported for this job, if any
+        """
+        return self._meter and self._meter.job_stats or None
+
     def set_error(self, error, details):
         self._error_info = (error, details)
 
@@ -353,6 +372,14 @@ class vmmAsyncJob(vmmGObjectUI):
         self.widget("pbar").set_text(progress)
         self.widget("pbar").set_fraction(1)
 
+    @idle_wrapper
+    def _pbar_job_stats(self, stats):
+        if not self.builder or self.job_canceled:
+            return
+        text = stats.format_details()
+        self.widget("job-stats").set_text(text)
+        self.widget("job-stats").set_visible(bool(text))
+
     @idle_wrapper
     def details_enable(self):
         self._details_widget = Vte.Terminal()
@@ -34,9 +34,10 @@ from .asyncjob import vmmAsyncJob
 from .storagebrowse import vmmStorageBrowser
 
 STORAGE_COMBO_CLONE = 0
-STORAGE_COMBO_SHARE = 1
-STORAGE_COMBO_SEP = 2
-STORAGE_COMBO_DETAILS = 3
+STORAGE_COMBO_LINK = 1
+STORAGE_COMBO_SHARE = 2
+STORAGE_COMBO_SEP = 3
+STORAGE_COMBO_DETAILS = 4
 
 STORAGE_INFO_ORIG_PATH = 0
 STORAGE_INFO_NEW_PATH = 1
@@ -51,6 +52,8 @@ STORAGE_INFO_DEFINFO = 9
 STORAGE_INFO_FAILINFO = 10
 STORAGE_INFO_COMBO = 11
 STORAGE_INFO_MANUAL_PATH = 12
+STORAGE_INFO_CAN_LINK = 13
+STORAGE_INFO_DO_LINK = 14
 
 NETWORK_INFO_LABEL = 0
 NETWORK_INFO_ORIG_MAC = 1
@@ -404,6 +407,8 @@ class vmmCloneVM(vmmGObjectUI):
             storage_row.insert(STORAGE_INFO_FAILINFO, failinfo)
             storage_row.insert(STORAGE_INFO_COMBO, None)
             storage_row.insert(STORAGE_INFO_MANUAL_PATH, False)
+            storage_row.insert(STORAGE_INFO_CAN_LINK, False)
+            storage_row.insert(STORAGE_INFO_DO_LINK, False)
 
             skip_targets = all_targets[:]
             skip_targets.remove(force_target)
@@ -443,6 +448,8 @@ class vmmCloneVM(vmmGObjectUI):
                 continue
 
             storage_row[STORAGE_INFO_CAN_CLONE] = True
+            # Linked clones need a managed volume as backing store
+            storage_row[STORAGE_INFO_CAN_LINK] = bool(vol)
 
             # If we cannot create default clone_path don't even try to do that
             if not default:
@@ -505,6 +512,8 @@ class vmmCloneVM(vmmGObjectUI):
         size = disk[STORAGE_INFO_SIZE]
         can_clone = disk[STORAGE_INFO_CAN_CLONE]
         do_clone = disk[STORAGE_INFO_DO_CLONE]
+        can_link = disk[STORAGE_INFO_CAN_LINK]
+        do_link = disk[STORAGE_INFO_DO_LINK]
         can_share = disk[STORAGE_INFO_CAN_SHARE]
         is_default = disk[STORAGE_INFO_DO_DEFAULT]
         definfo = disk[STORAGE_INFO_DEFINFO]
@@ -559,6 +568,9 @@ class vmmCloneVM(vmmGObjectUI):
                          [(_("Clone this disk") +
                            (size and " (%s)" % size or "")),
                           can_clone, False])
+            model.insert(STORAGE_COMBO_LINK,
+                         [_("Create linked clone of this disk"),
+                          can_link, False])
             model.insert(STORAGE_COMBO_SHARE,
                          [_("Share disk with %s") % orig_name, can_share,
                           False])
@@ -566,7 +578,9 @@ class vmmCloneVM(vmmGObjectUI):
             model.insert(STORAGE_COMBO_DETAILS,
                          [_("Details..."), True, False])
 
-            if (can_clone and is_default) or do_clone:
+            if do_link:
+                option_combo.set_active(STORAGE_COMBO_LINK)
+            elif (can_clone and is_default) or do_clone:
                 option_combo.set_active(STORAGE_COMBO_CLONE)
             else:
                 option_combo.set_active(STORAGE_COMBO_SHARE)
@@ -655,15 +669,23 @@ class vmmCloneVM(vmmGObjectUI):
 
         if idx == STORAGE_COMBO_CLONE:
             row[STORAGE_INFO_DO_CLONE] = True
+            row[STORAGE_INFO_DO_LINK] = False
+            return
+        elif idx == STORAGE_COMBO_LINK:
+            row[STORAGE_INFO_DO_CLONE] = True
+            row[STORAGE_INFO_DO_LINK] = True
             return
         elif idx == STORAGE_COMBO_SHARE:
             row[STORAGE_INFO_DO_CLONE] = False
+            row[STORAGE_INFO_DO_LINK] = False
             return
         elif idx != STORAGE_COMBO_DETAILS:
             return
 
         do_clone = row[STORAGE_INFO_DO_CLONE]
-        if do_clone:
+        if do_clone and row[STORAGE_INFO_DO_LINK]:
+            src.set_active(STORAGE_COMBO_LINK)
+        elif do_clone:
             src.set_active(STORAGE_COMBO_CLONE)
         else:
             src.set_active(STORAGE_COMBO_SHARE)
@@ -784,6 +806,7 @@ class vmmCloneVM(vmmGObjectUI):
         cd.clone_macs = clonemacs
 
         skip_targets = []
+        linked_targets = []
         new_paths = []
         warn_str = ""
         for target in self.target_list:
@@ -794,6 +817,8 @@ class vmmCloneVM(vmmGObjectUI):
 
             if do_clone:
                 new_paths.append(new_path)
+                if self.storage_list[target][STORAGE_INFO_DO_LINK]:
+                    linked_targets.append(target)
             else:
                 skip_targets.append(target)
                 if not path or path == '-':
@@ -805,6 +830,7 @@ class vmmCloneVM(vmmGObjectUI):
                 warn_str += "%s: %s\n" % (target, path)
 
         cd.skip_target = skip_targets
+        cd.linked_target = linked_targets
         cd.setup_original()
         cd.clone_paths = new_paths
 
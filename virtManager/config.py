@@ -442,6 +442,23 @@ class vmmConfig(object):
     def on_stats_enable_memory_poll_changed(self, cb, row=None):
         return self.conf.notify_add("/stats/enable-memory-poll", cb, row)
 
+    # Stats history recording and socket export
+    def get_stats_record_history(self):
+        return self.conf.get("/stats/record-history")
+    def set_stats_record_history(self, val):
+        self.conf.set("/stats/record-history", val)
+    def get_stats_history_days(self):
+        days = self.conf.get("/stats/history-days")
+        if days < 0:
+            return 0
+        return days
+    def set_stats_history_days(self, val):
+        self.conf.set("/stats/history-days", val)
+    def get_stats_export_socket(self):
+        return self.conf.get("/stats/export-socket")
+    def set_stats_export_socket(self, val):
+        self.conf.set("/stats/export-socket", val)
+
     # VM Console preferences
     def on_console_accels_changed(self, cb):
         return self.conf.notify_add("/console/enable-accels", cb)
@@ -475,6 +492,11 @@ class vmmConfig(object):
     def set_auto_usbredir(self, state):
         self.conf.set("/console/auto-redirect", state)
 
+    def get_console_serial_log(self):
+        return bool(self.conf.get("/console/serial-log"))
+    def set_console_serial_log(self, val):
+        self.conf.set("/console/serial-log", val)
+
     # Show VM details toolbar
     def get_details_show_toolbar(self):
         res = self.conf.get("/details/show-toolbar")
@@ -640,6 +662,12 @@ class vmmConfig(object):
 
         self.conf.set("/connections/autoconnect", uris)
 
+    # Number of threads used to initialize objects on connection open
+    def get_conn_init_workers(self):
+        return max(1, self.conf.get("/connections/init-workers"))
+    def set_conn_init_workers(self, val):
+        self.conf.set("/connections/init-workers", val)
+
 
     # Default directory location dealings
     def _get_default_dir_key(self, _type):
@@ -33,11 +33,14 @@ from virtinst import util
 
 from . import connectauth
 from .baseclass import vmmGObject
+from .consolecapture import vmmConsoleCapture
 from .domain import vmmDomain
 from .interface import vmmInterface
 from .libvirtenummap import LibvirtEnumMap
 from .network import vmmNetwork
 from .nodedev import vmmNodeDevice
+from .statsrecorder import vmmStatsRecorder
+from .statsrecorder import sample_connection, sample_domain, HOST_OBJECT
 from .storagepool import vmmStoragePool
 
 
@@ -159,6 +162,166 @@ class _ObjectList(vmmGObject):
             return self._objects[:]
 
 
+class _StatsScheduler(object):
+    """
+    Decides which VMs get their stats sampled on a given tick. VMs that
+    some window is displaying are sampled every tick. Other running VMs
+    are sampled on a per VM deadline that backs off while the VM is idle,
+    and shutoff VMs aren't sampled at all after their final sample.
+    """
+    MAX_BACKOFF = 8
+    IDLE_CPU_PERCENT = 5.0
+
+    def __init__(self):
+        # owner -> set of VM connkeys, or None meaning all VMs
+        self._watchers = {}
+        # connkey -> (deadline, backoff multiplier)
+        self._deadlines = {}
+        # connkeys of shutoff VMs that already recorded an idle sample
+        self._sampled_shutoff = set()
+
+    def set_watch(self, owner, connkeys):
+        if connkeys is not None:
+            connkeys = set(connkeys)
+        self._watchers[owner] = connkeys
+
+    def clear_watch(self, owner):
+        self._watchers.pop(owner, None)
+
+    def is_watched(self, connkey):
+        for connkeys in list(self._watchers.values()):
+            if connkeys is None or connkey in connkeys:
+                return True
+        return False
+
+    def forget(self, connkey):
+        self._deadlines.pop(connkey, None)
+        self._sampled_shutoff.discard(connkey)
+
+    def should_sample(self, vm, now, interval):
+        connkey = vm.get_connkey()
+        if not vm.is_active():
+            # Record one sample so graphs drop to zero, then stop
+            if connkey in self._sampled_shutoff:
+                return False
+            self._sampled_shutoff.add(connkey)
+            self._deadlines.pop(connkey, None)
+            return True
+        self._sampled_shutoff.discard(connkey)
+
+        if self.is_watched(connkey):
+            self._deadlines[connkey] = (now + interval, 1)
+            return True
+
+        deadline, backoff = self._deadlines.get(connkey, (0, 1))
+        # Allow some slack so timer jitter doesn't skip a whole tick
+        if now + (interval / 2.0) < deadline:
+            return False
+
+        if vm.guest_cpu_time_percentage() < self.IDLE_CPU_PERCENT:
+            backoff = min(backoff * 2, self.MAX_BACKOFF)
+        else:
+            backoff = 1
+        self._deadlines[connkey] = (now + (interval * backoff), backoff)
+        return True
+
+
+def _is_usb_root_hub(xmlobj):
+    """
+    usb_device lookups hide these, they can't be assigned to a VM
+    """
+    return (xmlobj.device_type == "usb_device" and
+        (("Linux Foundation" in str(xmlobj.vendor_name) or
+         ("Linux" in str(xmlobj.vendor_name) and
+          xmlobj.vendor_id == "0x1d6b")) and
+         ("root hub" in str(xmlobj.product_name) or
+          ("host controller" in str(xmlobj.product_name).lower() and
+           str(xmlobj.product_id).startswith("0x000")))))
+
+
+class _NodeDevIndex(object):
+    """
+    Index of node devices by device type, capability type, vendor and
+    product IDs, and parent device, so lookups don't need to scan and
+    parse every node device on the host. Kept up to date as node devices
+    are added, removed, and emit state-changed for XML updates.
+
+    Each index maps to a dict of {connkey: vmmNodeDevice}, which keeps
+    the order devices were added in.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # connkey -> (vmmNodeDevice, list of index keys it's stored under)
+        self._entries = {}
+        self._index = {}
+
+    def _keys_for_device(self, xmlobj):
+        keys = [("all",), ("type", xmlobj.device_type)]
+        capability_type = getattr(xmlobj, "capability_type", None)
+        if capability_type:
+            keys.append(("cap", capability_type))
+        vendor_id = getattr(xmlobj, "vendor_id", None)
+        product_id = getattr(xmlobj, "product_id", None)
+        if vendor_id or product_id:
+            keys.append(("ids", xmlobj.device_type, vendor_id, product_id))
+        if xmlobj.parent:
+            keys.append(("parent", xmlobj.parent))
+        return keys
+
+    def _remove(self, connkey):
+        obj, keys = self._entries.pop(connkey, (None, []))
+        for key in keys:
+            self._index[key].pop(connkey, None)
+            if not self._index[key]:
+                del self._index[key]
+
+    def update(self, obj):
+        """
+        (Re)index the passed vmmNodeDevice from its cached XML
+        """
+        connkey = obj.get_connkey()
+        try:
+            xmlobj = obj.get_xmlobj(refresh_if_nec=False)
+            keys = self._keys_for_device(xmlobj)
+            hidden = _is_usb_root_hub(xmlobj)
+        except Exception:
+            # Libvirt nodedev XML fetching can be busted
+            # https://bugzilla.redhat.com/show_bug.cgi?id=1225771
+            logging.debug("Error indexing nodedev %s", connkey, exc_info=True)
+            keys = []
+            hidden = False
+
+        if hidden:
+            keys.append(("hidden",))
+
+        with self._lock:
+            self._remove(connkey)
+            self._entries[connkey] = (obj, keys)
+            for key in keys:
+                self._index.setdefault(key, {})[connkey] = obj
+
+    def remove(self, obj):
+        with self._lock:
+            self._remove(obj.get_connkey())
+
+    def lookup(self, *keys):
+        """
+        Return the devices stored under every one of the passed index
+        keys in the order they were added. USB root hubs are left out of
+        usb_device lookups.
+        """
+        hidden = {}
+        with self._lock:
+            if [k for k in keys if k[0] in ["type", "ids"] and
+                k[1] == "usb_device"]:
+                hidden = self._index.get(("hidden",), {})
+            matches = [self._index.get(key, {}) for key in keys]
+            matches.sort(key=len)
+            return [o for connkey, o in matches[0].items() if
+                    connkey not in hidden and
+                    all([connkey in m for m in matches[1:]])]
+
+
 class vmmConnection(vmmGObject):
     __gsignals__ = {
         "vm-added": (vmmGObject.RUN_FIRST, None, [str]),
@@ -175,6 +338,7 @@ class vmmConnection(vmmGObject):
         "resources-sampled": (vmmGObject.RUN_FIRST, None, []),
         "state-changed": (vmmGObject.RUN_FIRST, None, []),
         "open-completed": (vmmGObject.RUN_FIRST, None, [object]),
+        "init-progress": (vmmGObject.RUN_FIRST, None, [int, int]),
     }
 
     (_STATE_DISCONNECTED,
@@ -196,6 +360,7 @@ class vmmConnection(vmmGObject):
         self.connect_error = None
 
         self._init_object_count = None
+        self._init_object_total = None
         self._init_object_event = None
 
         self._network_capable = None
@@ -215,8 +380,13 @@ class vmmConnection(vmmGObject):
         self._xml_flags = {}
 
         self._objects = _ObjectList()
+        self._nodedev_index = _NodeDevIndex()
 
         self._stats = []
+        self._stats_scheduler = _StatsScheduler()
+        self._stats_recorder = None
+        self._stats_recorder_config = (False, False, None)
+        self._console_capture = None
         self._hostinfo = None
 
         self.add_gsettings_handle(
@@ -589,6 +759,17 @@ class vmmConnection(vmmGObject):
     def is_connecting(self):
         return self._state == self._STATE_CONNECTING
 
+    def get_init_progress(self):
+        """
+        Return (loaded, total) object counts while the connection is
+        doing its initial object population, None otherwise
+        """
+        total = self._init_object_total
+        count = self._init_object_count
+        if total is None or count is None:
+            return None
+        return (max(0, total - count), total)
+
     def get_state_text(self):
         if self.is_disconnected():
             return _("Disconnected")
@@ -634,47 +815,29 @@ class vmmConnection(vmmGObject):
     # nodedev helper functions #
     ############################
 
-    def filter_nodedevs(self, devtype=None, devcap=None):
-        retdevs = []
-        for dev in self.list_nodedevs():
-            try:
-                xmlobj = dev.get_xmlobj()
-            except libvirt.libvirtError as e:
-                # Libvirt nodedev XML fetching can be busted
-                # https://bugzilla.redhat.com/show_bug.cgi?id=1225771
-                if e.get_error_code() != libvirt.VIR_ERR_NO_NODE_DEVICE:
-                    logging.debug("Error fetching nodedev XML", exc_info=True)
-                continue
-
-            if devtype and xmlobj.device_type != devtype:
-                continue
+    def _nodedev_index_keys(self, devtype, devcap):
+        keys = [("all",)]
+        if devtype:
+            keys.append(("type", devtype))
+        if devcap:
+            keys.append(("cap", devcap))
+        return keys
 
-            if devcap:
-                if (not hasattr(xmlobj, "capability_type") or
-                    xmlobj.capability_type != devcap):
-                    continue
-
-            if (devtype == "usb_device" and
-                (("Linux Foundation" in str(xmlobj.vendor_name) or
-                 ("Linux" in str(xmlobj.vendor_name) and
-                  xmlobj.vendor_id == "0x1d6b")) and
-                 ("root hub" in str(xmlobj.product_name) or
-                  ("host controller" in str(xmlobj.product_name).lower() and
-                   str(xmlobj.product_id).startswith("0x000"))))):
-                continue
-
-            retdevs.append(dev)
+    def filter_nodedevs(self, devtype=None, devcap=None):
+        return self._nodedev_index.lookup(
+            *self._nodedev_index_keys(devtype, devcap))
 
-        return retdevs
+    def list_nodedev_children(self, parent, devtype=None, devcap=None):
+        """
+        Return the node devices whose parent is the passed nodedev name,
+        filtered like filter_nodedevs
+        """
+        return self._nodedev_index.lookup(("parent", parent),
+            *self._nodedev_index_keys(devtype, devcap))
 
     def get_nodedev_count(self, devtype, vendor, product):
-        count = 0
-        devs = self.filter_nodedevs(devtype)
-
-        for dev in devs:
-            if (vendor == dev.xmlobj.vendor_id and
-                product == dev.xmlobj.product_id):
-                count += 1
+        count = len(self._nodedev_index.lookup(
+            ("ids", devtype, vendor, product)))
 
         logging.debug("There are %d node devices with "
                       "vendorId: %s, productId: %s",
@@ -966,6 +1129,14 @@ class vmmConnection(vmmGObject):
             self._node_device_cb_ids = []
 
         self._stats = []
+        self._stats_scheduler = _StatsScheduler()
+        if self._stats_recorder:
+            self._stats_recorder.close()
+            self._stats_recorder = None
+        self._stats_recorder_config = (False, False, None)
+        if self._console_capture:
+            self._console_capture.cleanup()
+            self._console_capture = None
 
         if self._init_object_event:
             self._init_object_event.clear()
@@ -979,6 +1150,7 @@ class vmmConnection(vmmGObject):
                 logging.debug("Failed to cleanup %s: %s", obj, e)
         self._objects.cleanup()
         self._objects = _ObjectList()
+        self._nodedev_index = _NodeDevIndex()
 
         closeret = self._backend.close()
         if closeret == 1 and self.config.test_leak_debug:
@@ -1102,6 +1274,7 @@ class vmmConnection(vmmGObject):
         self._init_object_event.wait()
         self._init_object_event = None
         self._init_object_count = None
+        self._init_object_total = None
 
     def _open_thread(self):
         ConnectError = None
@@ -1160,6 +1333,12 @@ class vmmConnection(vmmGObject):
                 continue
 
             logging.debug("%s=%s removed", class_name, name)
+            if class_name == "domain":
+                self._stats_scheduler.forget(obj.get_connkey())
+                if self._stats_recorder:
+                    self._stats_recorder.forget(obj.get_name())
+            elif class_name == "nodedev":
+                self._nodedev_index.remove(obj)
             self._remove_object_signal(obj)
             obj.cleanup()
 
@@ -1199,10 +1378,15 @@ class vmmConnection(vmmGObject):
             elif class_name == "interface":
                 self.emit("interface-added", obj.get_connkey())
             elif class_name == "nodedev":
+                self._nodedev_index.update(obj)
+                obj.connect("state-changed", self._nodedev_index.update)
                 self.emit("nodedev-added", obj.get_connkey())
         finally:
             if self._init_object_event:
                 self._init_object_count -= 1
+                progress = self.get_init_progress()
+                if progress:
+                    self.emit("init-progress", *progress)
                 if self._init_object_count <= 0:
                     self._init_object_event.set()
 
@@ -1241,6 +1425,50 @@ class vmmConnection(vmmGObject):
         return pollhelpers.fetch_vms(self._backend, keymap,
                     (lambda obj, key: vmmDomain(self, obj, key)))
 
+    def _sort_new_vms(self, new_vms):
+        """
+        Order the passed VMs so running ones are initialized first, using
+        a single listing call rather than a per VM state lookup
+        """
+        if len(new_vms) < 2:
+            return new_vms
+
+        try:
+            flags = getattr(libvirt, "VIR_CONNECT_LIST_DOMAINS_ACTIVE", 1)
+            active = set(dom.name() for dom in
+                         self._backend.listAllDomains(flags))
+        except Exception as e:
+            logging.debug("Error listing active domains: %s", e)
+            return new_vms
+
+        return sorted(new_vms, key=lambda vm: vm.get_connkey() not in active)
+
+    def _init_new_objects(self, newlist):
+        """
+        Fetch the initial libvirt state for the passed objects, using a
+        bounded pool of worker threads. Objects are handed out in list
+        order, so the caller controls priority.
+        """
+        if not newlist:
+            return
+
+        newlist = newlist[:]
+        lock = threading.Lock()
+
+        def cb():
+            while True:
+                with lock:
+                    if not newlist:
+                        return
+                    obj = newlist.pop(0)
+                obj.connect_once("initialized", self._new_object_cb)
+                obj.init_libvirt_state()
+
+        workers = min(len(newlist), self.config.get_conn_init_workers())
+        for idx in range(workers):
+            self._start_thread(cb,
+                "refreshing xml for new objects %d" % (idx + 1))
+
     def _poll(self, initial_poll,
             pollvm, pollnet, pollpool, polliface, pollnodedev):
         """
@@ -1267,32 +1495,20 @@ class vmmConnection(vmmGObject):
         new_ifaces = _process_objects(self._update_interfaces(polliface))
         new_nodedevs = _process_objects(self._update_nodedevs(pollnodedev))
 
-        # Kick off one thread per object type to handle the initial
-        # XML fetching. Going any more fine grained then this probably
-        # won't be that useful due to libvirt's locking structure.
-        #
         # Would prefer to start refreshing some objects before all polling
         # is complete, but we need init_object_count to be fully accurate
         # before we start initializing objects
 
+        if initial_poll:
+            self._init_object_total = self._init_object_count
         if initial_poll and self._init_object_count == 0:
             # If the connection doesn't have any objects, new_object_cb
             # is never called and the event is never set, so let's do it here
             self._init_object_event.set()
 
-        for newlist in [new_vms, new_nets, new_pools,
-                new_ifaces, new_nodedevs]:
-            if not newlist:
-                continue
-
-            def cb(lst):
-                for obj in lst:
-                    obj.connect_once("initialized", self._new_object_cb)
-                    obj.init_libvirt_state()
-
-            self._start_thread(cb,
-                "refreshing xml for new %s" % newlist[0].class_name(),
-                args=(newlist,))
+        # VMs go first so the manager list fills as soon as possible
+        self._init_new_objects(self._sort_new_vms(new_vms) + new_nets +
+            new_pools + new_ifaces + new_nodedevs)
 
         return gone_objects, preexisting_objects
 
@@ -1336,9 +1552,19 @@ class vmmConnection(vmmGObject):
 
         # Only tick() pre-existing objects, since new objects will be
         # initialized asynchronously and tick() would be redundant
+        now = time.time()
+        interval = self.config.get_stats_update_interval()
+        sampled_vms = []
         for obj in preexisting_objects:
             try:
+                obj_stats_update = stats_update
                 if obj.reports_stats() and stats_update:
+                    obj_stats_update = self._stats_scheduler.should_sample(
+                        obj, now, interval)
+                    if obj_stats_update:
+                        sampled_vms.append(obj)
+
+                if obj_stats_update:
                     pass
                 elif obj.__class__ is vmmDomain and not pollvm:
                     continue
@@ -1351,7 +1577,7 @@ class vmmConnection(vmmGObject):
                 elif obj.__class__ is vmmNodeDevice and not pollnodedev:
                     continue
 
-                obj.tick(stats_update=stats_update)
+                obj.tick(stats_update=obj_stats_update)
             except Exception as e:
                 logging.exception("Tick for %s failed", obj)
                 if (isinstance(e, libvirt.libvirtError) and
@@ -1364,10 +1590,77 @@ class vmmConnection(vmmGObject):
                                   "Ignoring.")
 
         if stats_update:
-            self._recalculate_stats(
-                [o for o in preexisting_objects if o.reports_stats()])
+            stats_objects = [o for o in preexisting_objects
+                             if o.reports_stats()]
+            self._recalculate_stats(stats_objects)
+            self._record_stats(sampled_vms, stats_objects)
             self.idle_emit("resources-sampled")
 
+        self.idle_add(self._update_console_capture)
+
+    def _update_console_capture(self):
+        if not self._backend.is_open():
+            return
+
+        if self.get_console_capture_mode() == "off":
+            if self._console_capture:
+                self._console_capture.cleanup()
+                self._console_capture = None
+            return
+
+        try:
+            if not self._console_capture:
+                self._console_capture = vmmConsoleCapture(self)
+            self._console_capture.update()
+        except Exception:
+            logging.debug("Error updating console capture for %s",
+                          self.get_uri(), exc_info=True)
+
+    def get_console_capture(self):
+        """
+        Return the vmmConsoleCapture for this connection, or None if
+        console capture is disabled
+        """
+        return self._console_capture
+
+    def _update_stats_recorder(self):
+        record = self.config.get_stats_record_history()
+        export = self.config.get_stats_export_socket()
+        days = self.config.get_stats_history_days()
+
+        if (record, export, days) == self._stats_recorder_config:
+            return self._stats_recorder
+
+        if self._stats_recorder:
+            self._stats_recorder.close()
+            self._stats_recorder = None
+        self._stats_recorder_config = (record, export, days)
+        if not record and not export:
+            return None
+
+        outdir = self.get_cache_dir()
+        socket_path = export and os.path.join(outdir, "stats.sock") or None
+        self._stats_recorder = vmmStatsRecorder(self.get_uri(), outdir,
+            record_history=record, socket_path=socket_path,
+            history_days=days)
+        return self._stats_recorder
+
+    def _record_stats(self, sampled_vms, vms):
+        try:
+            recorder = self._update_stats_recorder()
+            if not recorder or not self._stats:
+                return
+
+            samples = {HOST_OBJECT: sample_connection(self)}
+            for vm in sampled_vms:
+                samples[vm.get_name()] = sample_domain(vm)
+            active = [vm.get_name() for vm in vms if vm.is_active()]
+            recorder.record(self._stats[0]["timestamp"], samples,
+                            active=active)
+        except Exception:
+            logging.debug("Error recording stats for %s",
+                          self.get_uri(), exc_info=True)
+
     def _recalculate_stats(self, vms):
         if not self._backend.is_open():
             return
@@ -1380,6 +1673,7 @@ class vmmConnection(vmmGObject):
 
         mem = 0
         cpuTime = 0
+        pcentHostCpu = 0
         rdRate = 0
         wrRate = 0
         rxRate = 0
@@ -1391,7 +1685,10 @@ class vmmConnection(vmmGObject):
             if not vm.is_active():
                 continue
 
+            # VMs are sampled at different rates, so sum the per VM
+            # percentages rather than raw cpu time deltas
             cpuTime += vm.cpu_time()
+            pcentHostCpu += vm.host_cpu_time_percentage()
             mem += vm.stats_memory()
             rdRate += vm.disk_read_rate()
             wrRate += vm.disk_write_rate()
@@ -1401,17 +1698,8 @@ class vmmConnection(vmmGObject):
             netMaxRate = max(netMaxRate, vm.network_traffic_max_rate())
             diskMaxRate = max(diskMaxRate, vm.disk_io_max_rate())
 
-        pcentHostCpu = 0
         pcentMem = mem * 100.0 / self.host_memory_size()
 
-        if len(self._stats) > 0:
-            prevTimestamp = self._stats[0]["timestamp"]
-            host_cpus = self.host_active_processor_count()
-
-            pcentHostCpu = ((cpuTime) * 100.0 /
-                            ((now - prevTimestamp) *
-                             1000.0 * 1000.0 * 1000.0 * host_cpus))
-
         pcentHostCpu = max(0.0, min(100.0, pcentHostCpu))
         pcentMem = max(0.0, min(100.0, pcentMem))
 
@@ -1432,6 +1720,21 @@ class vmmConnection(vmmGObject):
         self._stats.insert(0, newStats)
 
 
+    def set_stats_watch(self, owner, vms):
+        """
+        Tell the stats sampler that 'owner' (typically a window) is
+        displaying stats for the passed vmmDomain list, so they are
+        sampled at the full update interval. vms=None means all VMs
+        on this connection.
+        """
+        connkeys = None
+        if vms is not None:
+            connkeys = [vm.get_connkey() for vm in vms]
+        self._stats_scheduler.set_watch(owner, connkeys)
+
+    def clear_stats_watch(self, owner):
+        self._stats_scheduler.clear_watch(owner)
+
     def schedule_priority_tick(self, **kwargs):
         from .engine import vmmEngine
         vmmEngine.get_instance().schedule_priority_tick(self, kwargs)
@@ -1504,6 +1807,8 @@ class vmmConnection(vmmGObject):
 
     def stats_memory(self):
         return self._get_record_helper("memory")
+    def stats_memory_percentage(self):
+        return self._get_record_helper("memoryPercent")
     def host_cpu_time_percentage(self):
         return self._get_record_helper("cpuHostPercent")
     def guest_cpu_time_percentage(self):
@@ -1514,6 +1819,14 @@ class vmmConnection(vmmGObject):
     def disk_io_rate(self):
         return (self._get_record_helper("diskRdRate") +
                 self._get_record_helper("diskWrRate"))
+    def disk_read_rate(self):
+        return self._get_record_helper("diskRdRate")
+    def disk_write_rate(self):
+        return self._get_record_helper("diskWrRate")
+    def network_rx_rate(self):
+        return self._get_record_helper("netRxRate")
+    def network_tx_rate(self):
+        return self._get_record_helper("netTxRate")
 
     def network_traffic_max_rate(self):
         return self._get_record_helper("netMaxRate")
@@ -1546,3 +1859,26 @@ class vmmConnection(vmmGObject):
             *args, **kwargs)
     def _config_pretty_name_changed_cb(self):
         self.emit("state-changed")
+
+    def get_console_capture_mode(self):
+        return self.config.get_perconn(self.get_uri(), "/console-capture")
+    def set_console_capture_mode(self, value):
+        self.config.set_perconn(self.get_uri(), "/console-capture", value)
+
+    def get_managedsave_workers(self):
+        return max(1, self.config.get_perconn(self.get_uri(),
+                                              "/managedsave-workers"))
+    def set_managedsave_workers(self, value):
+        self.config.set_perconn(self.get_uri(), "/managedsave-workers", value)
+    def get_managedsave_inflight_bytes(self):
+        """
+        Memory budget for parallel saves in bytes, or None for no limit
+        """
+        mib = self.config.get_perconn(self.get_uri(),
+                                      "/managedsave-inflight-mib")
+        if mib <= 0:
+            return None
+        return mib * 1024 * 1024
+    def set_managedsave_inflight_mib(self, value):
+        self.config.set_perconn(self.get_uri(),
+                                "/managedsave-inflight-mib", value)
@@ -0,0 +1,396 @@
+#
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import glob
+import gzip
+import logging
+import os
+import re
+import time
+
+import libvirt
+
+from .baseclass import vmmGObject
+
+
+# Uncompressed bytes per log segment, and segments kept per VM
+_SEGMENT_SIZE = 256 * 1024
+_SEGMENT_COUNT = 8
+# Bytes of recent output kept in memory for console scrollback
+_TAIL_SIZE = 64 * 1024
+# Seconds to wait before retrying a console that failed to open
+_RETRY_INTERVAL = 30
+
+
+class _RingLog(object):
+    """
+    Size capped console log, written as gzip compressed segments
+    NAME.<seq>.log.gz. Only the newest _SEGMENT_COUNT segments are kept.
+    The most recent output is also kept in memory for scrollback.
+    """
+    def __init__(self, dirname, name):
+        self._dirname = dirname
+        self._name = name
+        self._fileobj = None
+        self._segsize = 0
+        self._tail = bytearray()
+
+        # Total bytes recorded since we were created, so callers can ask
+        # for only the output they haven't seen
+        self.position = 0
+
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, 0o755)
+        self._seq = self._scan()
+        self._load_tail()
+
+    def _path(self, seq):
+        return os.path.join(self._dirname, "%s.%d.log.gz" % (self._name, seq))
+
+    def _list_segments(self):
+        ret = []
+        pattern = re.compile(r"^%s\.([0-9]+)\.log\.gz$" % re.escape(self._name))
+        for path in glob.glob(os.path.join(self._dirname, "*.log.gz")):
+            match = pattern.match(os.path.basename(path))
+            if match:
+                ret.append(int(match.group(1)))
+        return sorted(ret)
+
+    def _scan(self):
+        segments = self._list_segments()
+        return segments and segments[-1] or 0
+
+    def _load_tail(self):
+        """
+        Fill the scrollback from the segments left by a previous run
+        """
+        data = b""
+        for seq in reversed(self._list_segments()):
+            try:
+                with gzip.open(self._path(seq), "rb") as f:
+                    data = f.read() + data
+            except Exception as e:
+                # Segments from a crashed run may be truncated
+                logging.debug("Error reading console log %s: %s",
+                              self._path(seq), e)
+            if len(data) >= _TAIL_SIZE:
+                break
+        self._tail = bytearray(data[-_TAIL_SIZE:])
+
+    def _new_segment(self):
+        self.close()
+        self._seq += 1
+        self._fileobj = gzip.open(self._path(self._seq), "wb")
+        self._segsize = 0
+
+        for seq in self._list_segments():
+            if seq > self._seq - _SEGMENT_COUNT:
+                break
+            os.unlink(self._path(seq))
+
+    def write(self, data):
+        if not self._fileobj or self._segsize >= _SEGMENT_SIZE:
+            self._new_segment()
+        self._fileobj.write(data)
+        self._segsize += len(data)
+        self.position += len(data)
+
+        self._tail += data
+        # Trim in batches so we aren't shifting the buffer on every write
+        if len(self._tail) > _TAIL_SIZE * 2:
+            del self._tail[:-_TAIL_SIZE]
+
+    def get_scrollback(self, since=None):
+        """
+        Return recent output. If since is a previous position value,
+        only return output recorded after that point.
+        """
+        tail = bytes(self._tail[-_TAIL_SIZE:])
+        if since is None:
+            return tail
+        missed = self.position - since
+        if missed <= 0:
+            return b""
+        return tail[-missed:]
+
+    def flush(self):
+        if self._fileobj:
+            self._fileobj.flush()
+
+    def close(self):
+        if self._fileobj:
+            self._fileobj.close()
+        self._fileobj = None
+
+
+class _ConsoleCapture(object):
+    """
+    Non-blocking console stream for a single VM serial device, feeding
+    a _RingLog
+    """
+    def __init__(self, vm, devname, log):
+        self.vm = vm
+        self.devname = devname
+        self.log = log
+        self.stream = None
+        self.suspended = False
+        self.retry_time = 0
+
+    def is_open(self):
+        return self.stream is not None
+
+    def open(self):
+        logging.debug("Capturing console for vm=%s alias=%s",
+                      self.vm.get_name(), self.devname)
+
+        stream = self.vm.conn.get_backend().newStream(
+            libvirt.VIR_STREAM_NONBLOCK)
+        self.vm.open_console(self.devname, stream)
+        self.stream = stream
+        self.stream.eventAddCallback((libvirt.VIR_STREAM_EVENT_READABLE |
+                                      libvirt.VIR_STREAM_EVENT_ERROR |
+                                      libvirt.VIR_STREAM_EVENT_HANGUP),
+                                     self._event_on_stream, None)
+
+    def close(self):
+        if self.stream:
+            try:
+                self.stream.eventRemoveCallback()
+            except Exception:
+                logging.debug("Error removing stream callback",
+                              exc_info=True)
+            try:
+                self.stream.finish()
+            except Exception:
+                logging.debug("Error finishing stream", exc_info=True)
+        self.stream = None
+
+    def _event_on_stream(self, stream, events, opaque):
+        ignore = stream
+        ignore = opaque
+
+        if (events & libvirt.VIR_EVENT_HANDLE_ERROR or
+            events & libvirt.VIR_EVENT_HANDLE_HANGUP):
+            logging.debug("Console capture for %s received ERROR/HANGUP",
+                          self.vm.get_name())
+            self.close()
+            return
+
+        try:
+            got = self.stream.recv(1024 * 100)
+        except Exception:
+            logging.debug("Error receiving console capture data",
+                          exc_info=True)
+            self.close()
+            return
+
+        if got == -2:
+            # This is basically EAGAIN
+            return
+        if len(got) == 0:
+            self.close()
+            return
+
+        try:
+            self.log.write(got)
+        except Exception:
+            logging.debug("Error writing console capture log",
+                          exc_info=True)
+
+
+class vmmConsoleCapture(vmmGObject):
+    """
+    Keep console streams open in the background for running VMs on a
+    connection, recording their output to compressed ring logs in the
+    connection cache dir. All streams are serviced from the libvirt
+    event loop like the interactive console.
+
+    Which VMs are captured depends on the connection's console-capture
+    setting: 'off', 'all', or 'selected', which only captures VMs with
+    their own console-capture setting enabled.
+
+    Only the VM's first serial device is captured. Since libvirt only
+    allows one console stream per device, an open serial console widget
+    on that device suspends capture and hands us the data it receives
+    instead, so the log stays continuous. Consoles on other devices, or
+    on VMs we aren't capturing, are left alone.
+
+    Once cleaned up, for example when capture is switched off, every
+    method is a no-op, so consoles still holding a reference don't
+    recreate logs.
+    """
+    def __init__(self, conn):
+        vmmGObject.__init__(self)
+
+        self.conn = conn
+        self._captures = {}
+        self._logdir = os.path.join(conn.get_cache_dir(), "console-capture")
+
+    def _cleanup(self):
+        for capture in self._captures.values():
+            capture.close()
+            capture.log.close()
+        self._captures = {}
+        self.conn = None
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _get_devname(self, vm):
+        devs = vm.get_serial_devs()
+        return devs and devs[0].alias.name or None
+
+    def _get_capture(self, vm, create=True):
+        key = vm.get_connkey()
+        capture = self._captures.get(key)
+        if capture and capture.devname != self._get_devname(vm):
+            # The first serial device changed, start over
+            capture.close()
+            capture.log.close()
+            del self._captures[key]
+            capture = None
+        if not capture and create:
+            log = _RingLog(self._logdir, vm.get_name())
+            capture = _ConsoleCapture(vm, self._get_devname(vm), log)
+            self._captures[key] = capture
+        return capture
+
+    def _get_console_capture(self, vm, devname):
+        """
+        Return the existing capture an interactive console on devname
+        shares with us, or None
+        """
+        if self.conn is None:
+            return None
+        capture = self._get_capture(vm, create=False)
+        if not capture or capture.devname != devname:
+            return None
+        return capture
+
+    def _want_capture(self, vm, mode):
+        if mode == "all":
+            pass
+        elif mode == "selected":
+            if not vm.get_console_capture():
+                return False
+        else:
+            return False
+
+        return (vm.is_active() and
+                bool(vm.remote_console_supported) and
+                bool(vm.get_serial_devs()))
+
+
+    ##############
+    # Public API #
+    ##############
+
+    def update(self):
+        """
+        Open and close capture streams to match the VM list and current
+        settings. Called periodically from the main loop.
+        """
+        if self.conn is None:
+            return
+        mode = self.conn.get_console_capture_mode()
+        vms = dict([(vm.get_connkey(), vm) for vm in self.conn.list_vms()])
+
+        for key, capture in list(self._captures.items()):
+            if key not in vms:
+                capture.close()
+                capture.log.close()
+                del self._captures[key]
+
+        now = time.time()
+        for vm in vms.values():
+            want = self._want_capture(vm, mode)
+            capture = self._captures.get(vm.get_connkey())
+            if not want:
+                if capture:
+                    capture.close()
+                continue
+
+            capture = self._get_capture(vm)
+            if capture.suspended or capture.is_open():
+                capture.log.flush()
+                continue
+            if now < capture.retry_time:
+                continue
+
+            try:
+                capture.open()
+            except Exception as e:
+                logging.debug("Error opening console capture for %s: %s",
+                              vm.get_name(), e)
+                capture.close()
+                capture.retry_time = now + _RETRY_INTERVAL
+
+    def suspend(self, vm, devname):
+        """
+        Stop capturing so the caller can open a console on devname
+        itself. Returns the capture log position, see get_scrollback,
+        or None if we aren't capturing that VM and device, in which case
+        the caller shouldn't hand us its data.
+        """
+        if self.conn is None:
+            return None
+        mode = self.conn.get_console_capture_mode()
+        if (not self._want_capture(vm, mode) or
+            devname != self._get_devname(vm)):
+            return None
+
+        capture = self._get_capture(vm)
+        capture.close()
+        capture.suspended = True
+        return capture.log.position
+
+    def resume(self, vm, devname):
+        """
+        Resume capturing after the caller closed its console. Returns the
+        log position, which can later be passed to get_scrollback to only
+        get output recorded since.
+        """
+        capture = self._get_console_capture(vm, devname)
+        if not capture:
+            return None
+        capture.suspended = False
+        capture.log.flush()
+        self.idle_add(self.update)
+        return capture.log.position
+
+    def record(self, vm, devname, data):
+        """
+        Record data received by an interactive console for the VM
+        """
+        capture = self._get_console_capture(vm, devname)
+        if not capture:
+            return
+        try:
+            capture.log.write(data)
+        except Exception:
+            logging.debug("Error writing console capture log",
+                          exc_info=True)
+
+    def get_scrollback(self, vm, devname, since=None):
+        capture = self._get_console_capture(vm, devname)
+        if not capture:
+            return b""
+        return capture.log.get_scrollback(since)
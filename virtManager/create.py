@@ -1946,11 +1946,13 @@ class vmmCreate(vmmGObjectUI):
             basename += "-%s" % _pretty_arch(self._guest.os.arch)
             force_num = False
 
+        backend = self.conn.get_backend()
         return util.generate_name(basename,
-            self.conn.get_backend().lookupByName,
+            backend.lookupByName,
             start_num=force_num and 1 or 2, force_num=force_num,
             sep=not force_num and "-" or "",
-            collidelist=[vm.get_name() for vm in self.conn.list_vms()])
+            collidelist=[vm.get_name() for vm in self.conn.list_vms()],
+            listnames_cb=lambda: [d.name() for d in backend.listAllDomains()])
 
 
     def _validate_install_page(self):
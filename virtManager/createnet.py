@@ -202,13 +202,10 @@ class vmmCreateNetwork(vmmGObjectUI):
 
         devprettynames = []
         ifnames = []
-        for pcidev in self.conn.filter_nodedevs("pci"):
-            if pcidev.xmlobj.capability_type != "virt_functions":
-                continue
+        for pcidev in self.conn.filter_nodedevs("pci", "virt_functions"):
             devdesc = pcidev.xmlobj.pretty_name()
-            for netdev in self.conn.filter_nodedevs("net"):
-                if pcidev.xmlobj.name != netdev.xmlobj.parent:
-                    continue
+            for netdev in self.conn.list_nodedev_children(
+                    pcidev.xmlobj.name, "net"):
                 ifname = netdev.xmlobj.interface
                 devprettyname = "%s (%s)" % (ifname, devdesc)
                 devprettynames.append(devprettyname)
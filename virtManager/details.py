@@ -652,6 +652,7 @@ class vmmDetails(vmmGObjectUI):
             return
 
         vmmEngine.get_instance().increment_window_counter()
+        self.vm.conn.set_stats_watch(self, [self.vm])
         self.refresh_vm_state()
 
     def customize_finish(self, src):
@@ -703,6 +704,7 @@ class vmmDetails(vmmGObjectUI):
             except Exception:
                 logging.error("Failure when disconnecting from desktop server")
 
+        self.vm.conn.clear_stats_watch(self)
         self.emit("closed")
         vmmEngine.get_instance().decrement_window_counter()
         return 1
@@ -21,13 +21,14 @@
 import logging
 import os
 import time
-import threading
 
 import libvirt
 
 from virtinst import DomainCapabilities
 from virtinst import DomainSnapshot
 from virtinst import Guest
+from virtinst import jobmonitor
+from virtinst import migration
 from virtinst import util
 from virtinst import VirtualController
 from virtinst import VirtualDisk
@@ -94,43 +95,15 @@ def _find_device(guest, origdev):
 
 
 def start_job_progress_thread(vm, meter, progtext):
-    current_thread = threading.currentThread()
-
-    def jobinfo_cb():
-        while True:
-            time.sleep(.5)
-
-            if not current_thread.isAlive():
-                return False
-
-            try:
-                jobinfo = vm.job_info()
-                data_total      = float(jobinfo[3])
-                # data_processed  = float(jobinfo[4])
-                data_remaining  = float(jobinfo[5])
-
-                # data_total is 0 if the job hasn't started yet
-                if not data_total:
-                    continue
-
-                if not meter.started:
-                    meter.start(size=data_total,
-                                text=progtext)
-
-                progress = data_total - data_remaining
-                meter.update(progress)
-            except Exception:
-                logging.exception("Error calling jobinfo")
-                return False
-
-        return True
-
-    if vm.getjobinfo_supported:
-        t = threading.Thread(target=jobinfo_cb,
-                             name="job progress reporting",
-                             args=())
-        t.daemon = True
-        t.start()
+    """
+    Report the progress of the domain job started by the calling thread
+    to meter, along with memory/disk transfer stats, until the calling
+    thread exits
+    """
+    if not vm.getjobinfo_supported:
+        return
+    jobmonitor.JobMonitor(vm.get_backend(), meter=meter,
+                          text=progtext).start()
 
 
 class vmmInspectionData(object):
@@ -225,6 +198,7 @@ class vmmDomain(vmmLibvirtObject):
         self.cloning = False
 
         self._stats = []
+        self._stats_serial = 0
         self._stats_rates = {
             "diskRdRate":   10.0,
             "diskWrRate":   10.0,
@@ -1110,6 +1084,13 @@ class vmmDomain(vmmLibvirtObject):
     def abort_job(self):
         self._backend.abortJob()
 
+    def migrate_set_max_downtime(self, downtime):
+        migration.set_max_downtime(self._backend, downtime)
+    def migrate_set_max_bandwidth(self, bandwidth):
+        migration.set_max_bandwidth(self._backend, bandwidth)
+    def migrate_start_postcopy(self):
+        migration.start_postcopy(self._backend)
+
     def open_console(self, devname, stream, flags=0):
         return self._backend.openConsole(devname, stream, flags)
 
@@ -1143,13 +1124,16 @@ class vmmDomain(vmmLibvirtObject):
     def revert_to_snapshot(self, snap):
         self._backend.revertToSnapshot(snap.get_backend())
 
-    def create_snapshot(self, xml, redefine=False):
+    def create_snapshot(self, xml, redefine=False, meter=None):
         flags = 0
         if redefine:
             flags = (flags | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_REDEFINE)
 
         if not redefine:
             logging.debug("Creating snapshot flags=%s xml=\n%s", flags, xml)
+        if meter and self.is_active():
+            # Saving the memory state of a running VM is reported as a job
+            start_job_progress_thread(self, meter, _("Saving domain memory"))
         self._backend.snapshotCreateXML(xml, flags)
 
 
@@ -1492,7 +1476,12 @@ class vmmDomain(vmmLibvirtObject):
 
 
     def migrate(self, destconn, dest_uri=None,
-            tunnel=False, unsafe=False, temporary=False, meter=None):
+            tunnel=False, unsafe=False, temporary=False, meter=None,
+            tuning=None):
+        """
+        :param tuning: virtinst.MigrationTuning instance, for bandwidth,
+            compression, auto-converge, post-copy etc.
+        """
         self._install_abort = True
 
         flags = 0
@@ -1509,10 +1498,15 @@ class vmmDomain(vmmLibvirtObject):
         if unsafe:
             flags |= libvirt.VIR_MIGRATE_UNSAFE
 
+        if tuning:
+            tuning.validate()
+            flags |= tuning.get_flags()
+
         libvirt_destconn = destconn.get_backend().get_conn_for_api_arg()
         logging.debug("Migrating: conn=%s flags=%s uri=%s tunnel=%s "
-            "unsafe=%s temporary=%s",
-            destconn, flags, dest_uri, tunnel, unsafe, temporary)
+            "unsafe=%s temporary=%s tuning=%s",
+            destconn, flags, dest_uri, tunnel, unsafe, temporary,
+            tuning and tuning.get_params())
 
         if meter:
             start_job_progress_thread(self, meter, _("Migrating domain"))
@@ -1520,6 +1514,11 @@ class vmmDomain(vmmLibvirtObject):
         params = {}
         if dest_uri and not tunnel:
             params[libvirt.VIR_MIGRATE_PARAM_URI] = dest_uri
+        if tuning:
+            params.update(tuning.get_params())
+
+        if tuning:
+            tuning.start_live_tuning(self._backend)
 
         if tunnel:
             self._backend.migrateToURI3(dest_uri, params, flags)
@@ -1616,8 +1615,17 @@ class vmmDomain(vmmLibvirtObject):
     # Stats accessors #
     ###################
 
+    def stats_serial(self):
+        """
+        Counter bumped every time a new stats sample is recorded. Lets
+        the UI skip recomputing graphs for VMs whose stats didn't change
+        """
+        return self._stats_serial
+
     def stats_memory(self):
         return self._get_record_helper("curmem")
+    def stats_memory_percentage(self):
+        return self._get_record_helper("currMemPercent")
     def cpu_time(self):
         return self._get_record_helper("cpuTime")
     def host_cpu_time_percentage(self):
@@ -1754,6 +1762,16 @@ class vmmDomain(vmmLibvirtObject):
         return self.config.set_pervm(self.get_uuid(), "/console-password",
                                      ("", -1))
 
+    def get_console_capture(self):
+        return self.config.get_pervm(self.get_uuid(), "/console-capture")
+    def set_console_capture(self, value):
+        self.config.set_pervm(self.get_uuid(), "/console-capture", value)
+
+    def get_restore_priority(self):
+        return self.config.get_pervm(self.get_uuid(), "/restore-priority")
+    def set_restore_priority(self, value):
+        self.config.set_pervm(self.get_uuid(), "/restore-priority", value)
+
 
     def _on_config_sample_network_traffic_changed(self, ignore=None):
         self._enable_net_poll = self.config.get_stats_enable_net_poll()
@@ -1784,7 +1802,8 @@ class vmmDomain(vmmLibvirtObject):
             self._stats_net_skip = []
             return rx, tx
 
-        for netdev in self.get_network_devices(refresh_if_nec=False):
+        xmlobj = self.get_xmlobj(refresh_if_nec=False)
+        for netdev in xmlobj.get_devices_view("interface"):
             dev = netdev.target_dev
             if not dev:
                 continue
@@ -1834,7 +1853,8 @@ class vmmDomain(vmmLibvirtObject):
                 self._summary_disk_stats_skip = True
 
         # did not work, iterate over all disks
-        for disk in self.get_disk_devices(refresh_if_nec=False):
+        xmlobj = self.get_xmlobj(refresh_if_nec=False)
+        for disk in xmlobj.get_devices_view("disk"):
             dev = disk.target
             if not dev:
                 continue
@@ -1965,6 +1985,7 @@ class vmmDomain(vmmLibvirtObject):
             self._set_max_rate(newStats, r + "Rate")
 
         self._stats.insert(0, newStats)
+        self._stats_serial += 1
 
 
 ########################
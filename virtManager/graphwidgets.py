@@ -16,6 +16,9 @@
 # MA 02110-1301 USA.
 #
 
+import cairo
+
+from gi.repository import Gdk
 from gi.repository import GObject
 from gi.repository import Gtk
 
@@ -107,6 +110,10 @@ class CellRendererSparkline(Gtk.CellRenderer):
         'reversed': (GObject.TYPE_BOOLEAN, "Reverse data",
                      "Process data from back to front.",
                      0, GObject.PARAM_READWRITE),
+        'cache_key': (GObject.TYPE_PYOBJECT, "Cache key",
+                      "(rowkey, stamp) tuple identifying the data_array "
+                      "contents, used to reuse previously drawn graphs",
+                      GObject.PARAM_READWRITE),
     }
 
     def __init__(self):
@@ -117,6 +124,28 @@ class CellRendererSparkline(Gtk.CellRenderer):
         self.filled = True
         self.reversed = False
         self.rgb = None
+        self.cache_key = None
+
+        # rowkey -> (stamp, width, height, xalign, cairo surface,
+        #            data_array the surface was drawn from)
+        self._surface_cache = {}
+
+    def is_cached(self, rowkey, stamp):
+        """
+        Return True if we have a rendered graph for rowkey matching stamp,
+        meaning the caller doesn't need to recompute data_array. If the
+        cell size changed since, the graph is redrawn from the data_array
+        stored with the cached surface, never from whatever data_array
+        the renderer was last given for another row.
+        """
+        cached = self._surface_cache.get(rowkey)
+        return bool(cached and cached[0] == stamp)
+
+    def invalidate_cache(self, rowkey=None):
+        if rowkey is None:
+            self._surface_cache = {}
+        else:
+            self._surface_cache.pop(rowkey, None)
 
     def do_render(self, cr, widget, background_area, cell_area,
                   flags):
@@ -131,6 +160,40 @@ class CellRendererSparkline(Gtk.CellRenderer):
         ignore = background_area
         ignore = flags
 
+        if self.cache_key is None:
+            self._render_graph(cr, cell_area)
+            return
+
+        # Graphs only change when the row's data changes, so draw them
+        # once to an offscreen surface and repaint that on every expose
+        rowkey, stamp = self.cache_key
+        xalign = self.get_property("xalign")
+        cached = self._surface_cache.get(rowkey)
+        data_array = self.data_array
+        if cached and cached[0] == stamp:
+            # The caller skipped setting data_array for this row
+            data_array = cached[5]
+        if (not cached or
+            cached[0:4] != (stamp, cell_area.width, cell_area.height,
+                            xalign)):
+            self.data_array = data_array
+            surface = cr.get_target().create_similar(
+                cairo.CONTENT_COLOR_ALPHA,
+                max(1, cell_area.width), max(1, cell_area.height))
+            area = Gdk.Rectangle()
+            area.x = 0
+            area.y = 0
+            area.width = cell_area.width
+            area.height = cell_area.height
+            self._render_graph(cairo.Context(surface), area)
+            cached = (stamp, cell_area.width, cell_area.height,
+                      xalign, surface, data_array)
+            self._surface_cache[rowkey] = cached
+
+        cr.set_source_surface(cached[4], cell_area.x, cell_area.y)
+        cr.paint()
+
+    def _render_graph(self, cr, cell_area):
         # Indent of the gray border around the graph
         BORDER_PADDING = 2
         # Indent of graph from border
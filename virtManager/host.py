@@ -266,6 +266,8 @@ class vmmHost(vmmGObjectUI):
             return
 
         vmmEngine.get_instance().increment_window_counter()
+        # Host graphs aggregate every VM's stats
+        self.conn.set_stats_watch(self, None)
 
     def is_visible(self):
         return self.topwin.get_visible()
@@ -278,6 +280,7 @@ class vmmHost(vmmGObjectUI):
         self.confirm_changes()
 
         self.topwin.hide()
+        self.conn.clear_stats_watch(self)
         vmmEngine.get_instance().decrement_window_counter()
 
         return 1
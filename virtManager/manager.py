@@ -30,7 +30,6 @@ import libvirt
 from virtinst import util
 
 from . import vmmenu
-from . import uiutil
 from .baseclass import vmmGObjectUI
 from .connmanager import vmmConnectionManager
 from .engine import vmmEngine
@@ -90,6 +89,12 @@ def _get_inspection_icon_pixbuf(vm, w, h):
         return None
 
 
+def _get_sparkline_cell(col):
+    for child in col.get_cells():
+        if isinstance(child, CellRendererSparkline):
+            return child
+
+
 class vmmManager(vmmGObjectUI):
     @classmethod
     def get_instance(cls, parentobj):
@@ -112,8 +117,8 @@ class vmmManager(vmmGObjectUI):
         self.prev_position = None
         self._window_size = None
 
-        self.vmmenu = vmmenu.VMActionMenu(self, self.current_vm)
-        self.shutdownmenu = vmmenu.VMShutdownMenu(self, self.current_vm)
+        self.vmmenu = vmmenu.VMActionMenu(self, self.selected_vms)
+        self.shutdownmenu = vmmenu.VMShutdownMenu(self, self.selected_vms)
         self.connmenu = Gtk.Menu()
         self.connmenu_items = {}
 
@@ -161,6 +166,12 @@ class vmmManager(vmmGObjectUI):
         self.guestcpucol = None
         self.hostcpucol = None
         self.spacer_txt = None
+
+        # Map of conn/vm handle -> Gtk.TreeRowReference, and a cache of
+        # decoded inspection icons, so lookups don't walk the whole model
+        self._row_refs = {}
+        self._os_icon_cache = {}
+        self._stats_watch_queued = False
         self.init_vmlist()
 
         self.init_stats()
@@ -170,6 +181,16 @@ class vmmManager(vmmGObjectUI):
         self.update_current_selection()
         self.widget("vm-list").get_selection().connect(
             "changed", self.update_current_selection)
+        # The set of on screen VMs only changes when the list scrolls,
+        # resizes, expands/collapses, or rows come and go
+        self.widget("vm-list").get_vadjustment().connect(
+            "value-changed", self._queue_stats_watch)
+        self.widget("vm-list").get_vadjustment().connect(
+            "changed", self._queue_stats_watch)
+        self.widget("vm-list").connect(
+            "row-expanded", self._queue_stats_watch)
+        self.widget("vm-list").connect(
+            "row-collapsed", self._queue_stats_watch)
 
         self.max_disk_rate = 10.0
         self.max_net_rate = 10.0
@@ -204,6 +225,7 @@ class vmmManager(vmmGObjectUI):
             self.prev_position = None
 
         vmmEngine.get_instance().increment_window_counter()
+        self._update_stats_watch()
 
     def close(self, src_ignore=None, src2_ignore=None):
         if not self.is_visible():
@@ -213,6 +235,7 @@ class vmmManager(vmmGObjectUI):
         self.prev_position = self.topwin.get_position()
         self.topwin.hide()
         vmmEngine.get_instance().decrement_window_counter()
+        self._update_stats_watch()
 
         return 1
 
@@ -318,6 +341,13 @@ class vmmManager(vmmGObjectUI):
         add_to_menu("disconnect", Gtk.STOCK_DISCONNECT, None,
                       self.close_conn)
         self.connmenu.add(Gtk.SeparatorMenuItem())
+        add_to_menu("migrate", _("_Migrate all VMs..."), None,
+                    self.migrate_conn_vms)
+        add_to_menu("saveall", _("_Save all running VMs"), None,
+                    self.save_conn_vms)
+        add_to_menu("restoreall", _("_Restore saved VMs"), None,
+                    self.restore_conn_vms)
+        self.connmenu.add(Gtk.SeparatorMenuItem())
         add_to_menu("delete", Gtk.STOCK_DELETE, None, self.do_delete)
         self.connmenu.add(Gtk.SeparatorMenuItem())
         add_to_menu("details", _("D_etails"), None, self.show_host)
@@ -342,6 +372,7 @@ class vmmManager(vmmGObjectUI):
 
         model = Gtk.TreeStore(*rowtypes)
         vmlist.set_model(model)
+        vmlist.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
         vmlist.set_tooltip_column(ROW_HINT)
         vmlist.set_headers_visible(True)
         vmlist.set_level_indentation(
@@ -372,6 +403,12 @@ class vmmManager(vmmGObjectUI):
         nameCol.add_attribute(name_txt, 'markup', ROW_MARKUP)
         nameCol.add_attribute(name_txt, 'foreground', ROW_COLOR)
 
+        # VM row markup and icons are only built when a row is drawn,
+        # which is only done for rows that are actually visible
+        nameCol.set_cell_data_func(status_icon, self._vm_status_icon_data)
+        nameCol.set_cell_data_func(inspection_os_icon, self._vm_os_icon_data)
+        nameCol.set_cell_data_func(name_txt, self._vm_markup_data)
+
         self.spacer_txt = Gtk.CellRendererText()
         self.spacer_txt.set_property("ypad", 4)
         self.spacer_txt.set_property("visible", False)
@@ -420,8 +457,23 @@ class vmmManager(vmmGObjectUI):
     def model(self):
         return self.widget("vm-list").get_model()
 
+    def selected_rows(self):
+        model, paths = self.widget("vm-list").get_selection(
+            ).get_selected_rows()
+        return [model[path] for path in paths]
+
     def current_row(self):
-        return uiutil.get_list_selected_row(self.widget("vm-list"))
+        """
+        The selected row, or None if there are zero or several selected
+        """
+        rows = self.selected_rows()
+        if len(rows) != 1:
+            return None
+        return rows[0]
+
+    def selected_vms(self):
+        return [row[ROW_HANDLE] for row in self.selected_rows()
+                if row[ROW_IS_VM]]
 
     def current_vm(self):
         row = self.current_row()
@@ -440,20 +492,27 @@ class vmmManager(vmmGObjectUI):
         return handle.conn
 
     def get_row(self, conn_or_vm):
-        def _walk(rowiter):
-            while rowiter:
-                row = self.model[rowiter]
-                if row[ROW_HANDLE] == conn_or_vm:
-                    return row
-                if self.model.iter_has_child(rowiter):
-                    ret = _walk(self.model.iter_nth_child(rowiter, 0))
-                    if ret:
-                        return ret
-                rowiter = self.model.iter_next(rowiter)
-
-        if not len(self.model):
+        rowref = self._row_refs.get(conn_or_vm)
+        if not rowref or not rowref.valid():
             return None
-        return _walk(self.model.get_iter_first())
+        return self.model[rowref.get_path()]
+
+    def _add_row(self, parent, handle, row):
+        rowiter = self.model.append(parent, row)
+        self._row_refs[handle] = Gtk.TreeRowReference.new(
+            self.model, self.model.get_path(rowiter))
+        self._queue_stats_watch()
+        return rowiter
+
+    def _remove_row(self, rowiter):
+        handle = self.model[rowiter][ROW_HANDLE]
+        self._row_refs.pop(handle, None)
+        self._os_icon_cache.pop(handle, None)
+        self._queue_stats_watch()
+        for col in [self.guestcpucol, self.hostcpucol, self.memcol,
+                    self.diskcol, self.netcol]:
+            _get_sparkline_cell(col).invalidate_cache(id(handle))
+        self.model.remove(rowiter)
 
 
     ####################
@@ -514,6 +573,11 @@ class vmmManager(vmmGObjectUI):
             self.show_host(_src)
 
     def do_delete(self, ignore=None):
+        vms = self.selected_vms()
+        if len(vms) > 1:
+            vmmenu.VMBulkActionUI.delete(self, vms)
+            return
+
         conn = self.current_conn()
         vm = self.current_vm()
         if vm is None:
@@ -544,15 +608,29 @@ class vmmManager(vmmGObjectUI):
         # update function fix things for us
         self.set_pause_state(not do_pause)
 
-        if do_pause:
+        vms = self.selected_vms()
+        if len(vms) > 1:
+            if do_pause:
+                vmmenu.VMBulkActionUI.suspend(self, vms)
+            else:
+                vmmenu.VMBulkActionUI.resume(self, vms)
+        elif do_pause:
             vmmenu.VMActionUI.suspend(self, self.current_vm())
         else:
             vmmenu.VMActionUI.resume(self, self.current_vm())
 
     def start_vm(self, ignore):
-        vmmenu.VMActionUI.run(self, self.current_vm())
+        vms = self.selected_vms()
+        if len(vms) > 1:
+            vmmenu.VMBulkActionUI.run(self, vms)
+        else:
+            vmmenu.VMActionUI.run(self, self.current_vm())
     def poweroff_vm(self, _src):
-        vmmenu.VMActionUI.shutdown(self, self.current_vm())
+        vms = self.selected_vms()
+        if len(vms) > 1:
+            vmmenu.VMBulkActionUI.shutdown(self, vms)
+        else:
+            vmmenu.VMActionUI.shutdown(self, self.current_vm())
 
     def close_conn(self, ignore):
         conn = self.current_conn()
@@ -565,6 +643,16 @@ class vmmManager(vmmGObjectUI):
             conn.open()
             return True
 
+    def migrate_conn_vms(self, ignore):
+        from .migrate import vmmMigrateDialog
+        vmmMigrateDialog.show_evacuate(self, self.current_conn())
+
+    def save_conn_vms(self, ignore):
+        vmmenu.VMBulkActionUI.save_all(self, self.current_conn())
+
+    def restore_conn_vms(self, ignore):
+        vmmenu.VMBulkActionUI.restore_all(self, self.current_conn())
+
 
     ####################################
     # VM add/remove management methods #
@@ -577,7 +665,7 @@ class vmmManager(vmmGObjectUI):
 
         vm_row = self._build_row(None, vm)
         conn_row = self.get_row(conn)
-        self.model.append(conn_row.iter, vm_row)
+        self._add_row(conn_row.iter, vm, vm_row)
 
         vm.connect("state-changed", self.vm_changed)
         vm.connect("resources-sampled", self.vm_row_updated)
@@ -592,7 +680,7 @@ class vmmManager(vmmGObjectUI):
             rowiter = self.model.iter_nth_child(parent, rowidx)
             vm = self.model[rowiter][ROW_HANDLE]
             if vm.get_connkey() == connkey:
-                self.model.remove(rowiter)
+                self._remove_row(rowiter)
                 break
 
     def _build_conn_hint(self, conn):
@@ -607,7 +695,13 @@ class vmmManager(vmmGObjectUI):
         if conn.is_disconnected():
             text += " - " + _("Not Connected")
         elif conn.is_connecting():
-            text += " - " + _("Connecting...")
+            progress = conn.get_init_progress()
+            if progress and progress[1]:
+                text += " - " + (_("Connecting (%(loaded)d of %(total)d "
+                                   "loaded)...") %
+                                 {"loaded": progress[0], "total": progress[1]})
+            else:
+                text += " - " + _("Connecting...")
 
         markup = "<span size='smaller'>%s</span>" % text
         return markup
@@ -635,13 +729,13 @@ class vmmManager(vmmGObjectUI):
             color = self._build_conn_color(conn)
             os_icon = None
         else:
+            # markup and icons are filled in by the cell data funcs
             name = vm.get_name_or_title()
-            status = vm.run_status()
-            markup = self._build_vm_markup(name, status)
-            status_icon = vm.run_status_icon_name()
+            markup = None
+            status_icon = None
             hint = vm.get_description()
             color = None
-            os_icon = _get_inspection_icon_pixbuf(vm, 16, 16)
+            os_icon = None
 
         row = []
         row.insert(ROW_HANDLE, conn or vm)
@@ -666,12 +760,13 @@ class vmmManager(vmmGObjectUI):
             return
 
         conn_row = self._build_row(conn, None)
-        self.model.append(None, conn_row)
+        self._add_row(None, conn, conn_row)
 
         conn.connect("vm-added", self.vm_added)
         conn.connect("vm-removed", self.vm_removed)
         conn.connect("resources-sampled", self.conn_row_updated)
         conn.connect("state-changed", self.conn_state_changed)
+        conn.connect("init-progress", self.conn_init_progress)
 
         for vm in conn.list_vms():
             self.vm_added(conn, vm.get_connkey())
@@ -687,9 +782,9 @@ class vmmManager(vmmGObjectUI):
 
         child = self.model.iter_children(conn_row.iter)
         while child is not None:
-            self.model.remove(child)
+            self._remove_row(child)
             child = self.model.iter_children(conn_row.iter)
-        self.model.remove(conn_row.iter)
+        self._remove_row(conn_row.iter)
 
 
     #############################
@@ -708,16 +803,11 @@ class vmmManager(vmmGObjectUI):
             return
 
         try:
-            if vm == self.current_vm():
+            if vm in self.selected_vms():
                 self.update_current_selection()
 
-            name = vm.get_name_or_title()
-            status = vm.run_status()
-
-            row[ROW_SORT_KEY] = name
-            row[ROW_STATUS_ICON] = vm.run_status_icon_name()
+            row[ROW_SORT_KEY] = vm.get_name_or_title()
             row[ROW_IS_VM_RUNNING] = vm.is_active()
-            row[ROW_MARKUP] = self._build_vm_markup(name, status)
 
             desc = vm.get_description()
             row[ROW_HINT] = util.xml_escape(desc)
@@ -733,9 +823,7 @@ class vmmManager(vmmGObjectUI):
         if row is None:
             return
 
-        new_icon = _get_inspection_icon_pixbuf(vm, 16, 16)
-        row[ROW_INSPECTION_OS_ICON] = new_icon
-
+        self._os_icon_cache.pop(vm, None)
         self.vm_row_updated(vm)
 
     def set_initial_selection(self, uri):
@@ -744,6 +832,7 @@ class vmmManager(vmmGObjectUI):
         cli --connect $URI
         """
         sel = self.widget("vm-list").get_selection()
+        sel.unselect_all()
         for row in self.model:
             if not row[ROW_IS_CONN]:
                 continue
@@ -764,12 +853,71 @@ class vmmManager(vmmGObjectUI):
         if not conn.is_active():
             child = self.model.iter_children(row.iter)
             while child is not None:
-                self.model.remove(child)
+                self._remove_row(child)
                 child = self.model.iter_children(row.iter)
 
         self.conn_row_updated(conn)
         self.update_current_selection()
 
+    def conn_init_progress(self, conn, loaded, total):
+        ignore = loaded
+        ignore = total
+        row = self.get_row(conn)
+        if row is None:
+            return
+        row[ROW_MARKUP] = self._build_conn_markup(conn, row[ROW_SORT_KEY])
+
+    def _queue_stats_watch(self, *args, **kwargs):
+        """
+        Coalesce stats watch updates, a burst of row or scroll changes
+        only walks the VM list once
+        """
+        ignore = args
+        ignore = kwargs
+        if self._stats_watch_queued:
+            return
+        self._stats_watch_queued = True
+        self.idle_add(self._update_stats_watch)
+
+    def _update_stats_watch(self, *args, **kwargs):
+        """
+        Tell each connection which VMs have stats graphs on screen, so
+        only those are sampled at the full rate
+        """
+        ignore = args
+        ignore = kwargs
+        self._stats_watch_queued = False
+        vmlist = self.widget("vm-list")
+
+        start = end = None
+        if self.is_visible() and any([c.get_visible() for c in
+                [self.netcol, self.diskcol, self.memcol,
+                 self.guestcpucol, self.hostcpucol]]):
+            vrange = vmlist.get_visible_range()
+            if vrange:
+                start, end = vrange[-2:]
+
+        visible = {}
+        for handle, rowref in list(self._row_refs.items()):
+            if not rowref.valid():
+                continue
+            row = self.model[rowref.get_path()]
+            if row[ROW_IS_CONN]:
+                visible.setdefault(handle, [])
+                continue
+            if start is None or end is None:
+                continue
+
+            path = rowref.get_path()
+            parent = path.copy()
+            parent.up()
+            if (start.compare(path) <= 0 and path.compare(end) <= 0 and
+                vmlist.row_expanded(parent)):
+                visible.setdefault(handle.conn, []).append(handle)
+
+        for conn, vms in visible.items():
+            conn.set_stats_watch(self, vms)
+
     def conn_row_updated(self, conn):
         row = self.get_row(conn)
 
@@ -792,19 +940,21 @@ class vmmManager(vmmGObjectUI):
     def update_current_selection(self, ignore=None):
         vm = self.current_vm()
         conn = self.current_conn()
+        # With several VMs selected, the toolbar acts on all of them
+        vms = self.selected_vms()
 
         show_open = bool(vm)
         show_details = bool(vm)
         host_details = bool(vm or conn)
-        can_delete = bool(vm or conn)
+        can_delete = bool(vms or conn)
 
-        show_run = bool(vm and vm.is_runable())
-        is_paused = bool(vm and vm.is_paused())
+        show_run = any([v.is_runable() for v in vms])
+        is_paused = bool(vms) and all([v.is_paused() for v in vms])
         if is_paused:
-            show_pause = bool(vm and vm.is_unpauseable())
+            show_pause = any([v.is_unpauseable() for v in vms])
         else:
-            show_pause = bool(vm and vm.is_pauseable())
-        show_shutdown = bool(vm and vm.is_stoppable())
+            show_pause = any([v.is_pauseable() for v in vms])
+        show_shutdown = any([v.is_stoppable() for v in vms])
 
         if vm and vm.managedsave_supported:
             self.change_run_text(vm.has_managed_save())
@@ -812,7 +962,7 @@ class vmmManager(vmmGObjectUI):
         self.widget("vm-open").set_sensitive(show_open)
         self.widget("vm-run").set_sensitive(show_run)
         self.widget("vm-shutdown").set_sensitive(show_shutdown)
-        self.widget("vm-shutdown").get_menu().update_widget_states(vm)
+        self.widget("vm-shutdown").get_menu().update_widget_states(vms)
 
         self.set_pause_state(is_paused)
         self.widget("vm-pause").set_sensitive(show_pause)
@@ -831,8 +981,10 @@ class vmmManager(vmmGObjectUI):
         if Gdk.keyval_name(event.keyval) != "Menu":
             return False
 
-        model, treeiter = self.widget("vm-list").get_selection().get_selected()
-        self.popup_vm_menu(model, treeiter, event)
+        rows = self.selected_rows()
+        if not rows:
+            return True
+        self.popup_vm_menu(self.model, rows[-1].iter, event)
         return True
 
     def popup_vm_menu_button(self, vmlist, event):
@@ -845,13 +997,21 @@ class vmmManager(vmmGObjectUI):
         path = tup[0]
 
         self.popup_vm_menu(self.model, self.model.get_iter(path), event)
-        return False
+
+        # Don't let the default handler reset a multiple selection
+        # when right clicking on one of its rows
+        sel = vmlist.get_selection()
+        return bool(sel.path_is_selected(path) and
+                    sel.count_selected_rows() > 1)
 
     def popup_vm_menu(self, model, _iter, event):
         if model.iter_parent(_iter) is not None:
             # Popup the vm menu
             vm = model[_iter][ROW_HANDLE]
-            self.vmmenu.update_widget_states(vm)
+            vms = self.selected_vms()
+            if vm not in vms:
+                vms = [vm]
+            self.vmmenu.update_widget_states(vms)
             self.vmmenu.popup(None, None, None, None, 0, event.time)
         else:
             # Pop up connection menu
@@ -863,6 +1023,10 @@ class vmmManager(vmmGObjectUI):
             self.connmenu_items["disconnect"].set_sensitive(not (disconn or
                                                                  conning))
             self.connmenu_items["connect"].set_sensitive(disconn)
+            self.connmenu_items["migrate"].set_sensitive(conn.is_active())
+            self.connmenu_items["saveall"].set_sensitive(conn.is_active())
+            self.connmenu_items["restoreall"].set_sensitive(
+                conn.is_active())
             self.connmenu_items["delete"].set_sensitive(disconn)
 
             self.connmenu.popup(None, None, None, None, 0, event.time)
@@ -939,10 +1103,7 @@ class vmmManager(vmmGObjectUI):
             widget.set_tooltip_text(tool_text)
 
     def _toggle_graph_helper(self, do_show, col, datafunc, menu):
-        img = -1
-        for child in col.get_cells():
-            if isinstance(child, CellRendererSparkline):
-                img = child
+        img = _get_sparkline_cell(col)
         datafunc = do_show and datafunc or None
 
         col.set_cell_data_func(img, datafunc, None)
@@ -953,6 +1114,7 @@ class vmmManager(vmmGObjectUI):
             [self.netcol, self.diskcol, self.memcol,
              self.guestcpucol, self.hostcpucol]])
         self.spacer_txt.set_property("visible", not any_visible)
+        self._update_stats_watch()
 
     def toggle_network_traffic_visible_widget(self):
         self._toggle_graph_helper(
@@ -997,44 +1159,62 @@ class vmmManager(vmmGObjectUI):
     def toggle_stats_visible_network(self, src):
         self.toggle_stats_visible(src, COL_NETWORK)
 
-    def guest_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
-        obj = model[_iter][ROW_HANDLE]
-        if obj is None or not hasattr(obj, "conn"):
+    def _vm_markup_data(self, column_ignore, cell, model, _iter, data):
+        if not model[_iter][ROW_IS_VM]:
             return
+        vm = model[_iter][ROW_HANDLE]
+        cell.set_property("markup", self._build_vm_markup(
+            model[_iter][ROW_SORT_KEY], vm.run_status()))
 
-        data = obj.guest_cpu_time_vector(GRAPH_LEN)
-        cell.set_property('data_array', data)
-
-    def host_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
-        obj = model[_iter][ROW_HANDLE]
-        if obj is None or not hasattr(obj, "conn"):
+    def _vm_status_icon_data(self, column_ignore, cell, model, _iter, data):
+        if not model[_iter][ROW_IS_VM]:
             return
+        vm = model[_iter][ROW_HANDLE]
+        cell.set_property("icon-name", vm.run_status_icon_name())
 
-        data = obj.host_cpu_time_vector(GRAPH_LEN)
-        cell.set_property('data_array', data)
+    def _vm_os_icon_data(self, column_ignore, cell, model, _iter, data):
+        if not model[_iter][ROW_IS_VM]:
+            return
+        vm = model[_iter][ROW_HANDLE]
+        if vm not in self._os_icon_cache:
+            self._os_icon_cache[vm] = _get_inspection_icon_pixbuf(vm, 16, 16)
+        cell.set_property("pixbuf", self._os_icon_cache[vm])
 
-    def memory_usage_img(self, column_ignore, cell, model, _iter, data):
+    def _set_graph_data(self, cell, model, _iter, datafunc, maxrate=None):
         obj = model[_iter][ROW_HANDLE]
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        data = obj.stats_memory_vector(GRAPH_LEN)
-        cell.set_property('data_array', data)
+        # Only rebuild the data vector when the VM recorded a new sample,
+        # otherwise the renderer repaints its cached graph
+        rowkey = id(obj)
+        stamp = (obj.stats_serial(), maxrate)
+        if not cell.is_cached(rowkey, stamp):
+            cell.set_property('data_array', datafunc(obj))
+        cell.set_property('cache_key', (rowkey, stamp))
 
-    def disk_io_img(self, column_ignore, cell, model, _iter, data):
-        obj = model[_iter][ROW_HANDLE]
-        if obj is None or not hasattr(obj, "conn"):
-            return
+    def guest_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
+        self._set_graph_data(cell, model, _iter,
+            lambda obj: obj.guest_cpu_time_vector(GRAPH_LEN))
 
-        d1, d2 = obj.disk_io_vectors(GRAPH_LEN, self.max_disk_rate)
-        data = [(x + y) / 2 for x, y in zip(d1, d2)]
-        cell.set_property('data_array', data)
+    def host_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
+        self._set_graph_data(cell, model, _iter,
+            lambda obj: obj.host_cpu_time_vector(GRAPH_LEN))
 
-    def network_traffic_img(self, column_ignore, cell, model, _iter, data):
-        obj = model[_iter][ROW_HANDLE]
-        if obj is None or not hasattr(obj, "conn"):
-            return
+    def memory_usage_img(self, column_ignore, cell, model, _iter, data):
+        self._set_graph_data(cell, model, _iter,
+            lambda obj: obj.stats_memory_vector(GRAPH_LEN))
+
+    def disk_io_img(self, column_ignore, cell, model, _iter, data):
+        def datafunc(obj):
+            d1, d2 = obj.disk_io_vectors(GRAPH_LEN, self.max_disk_rate)
+            return [(x + y) / 2 for x, y in zip(d1, d2)]
+        self._set_graph_data(cell, model, _iter, datafunc,
+                             self.max_disk_rate)
 
-        d1, d2 = obj.network_traffic_vectors(GRAPH_LEN, self.max_net_rate)
-        data = [(x + y) / 2 for x, y in zip(d1, d2)]
-        cell.set_property('data_array', data)
+    def network_traffic_img(self, column_ignore, cell, model, _iter, data):
+        def datafunc(obj):
+            d1, d2 = obj.network_traffic_vectors(GRAPH_LEN, self.max_net_rate)
+            return [(x + y) / 2 for x, y in zip(d1, d2)]
+        self._set_graph_data(cell, model, _iter, datafunc,
+                             self.max_net_rate)
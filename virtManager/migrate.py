@@ -25,6 +25,7 @@ from gi.repository import Gdk
 from gi.repository import Gtk
 from gi.repository import Pango
 
+from virtinst import MigrationTuning
 from virtinst import util
 
 from . import uiutil
@@ -32,6 +33,7 @@ from .asyncjob import vmmAsyncJob
 from .baseclass import vmmGObjectUI
 from .connmanager import vmmConnectionManager
 from .domain import vmmDomain
+from .migratequeue import vmmMigrateQueue, vmmMigrateJob
 
 
 NUM_COLS = 3
@@ -39,21 +41,44 @@ NUM_COLS = 3
  COL_URI,
  COL_CAN_MIGRATE) = range(NUM_COLS)
 
+(QUEUE_COL_JOB,
+ QUEUE_COL_NAME,
+ QUEUE_COL_STATUS,
+ QUEUE_COL_PERCENT) = range(4)
+
 
 class vmmMigrateDialog(vmmGObjectUI):
     @classmethod
     def show_instance(cls, parentobj, vm):
+        """
+        :param vm: vmmDomain to migrate, or a list of them to migrate
+            through a vmmMigrateQueue
+        """
         try:
             if not cls._instance:
                 cls._instance = vmmMigrateDialog()
-            cls._instance.show(parentobj.topwin, vm)
+            cls._instance.show(parentobj.topwin, util.listify(vm))
         except Exception as e:
             parentobj.err.show_err(
                     _("Error launching migrate dialog: %s") % str(e))
 
+    @classmethod
+    def show_evacuate(cls, parentobj, conn):
+        """
+        Offer to migrate every running VM off of conn
+        """
+        vms = [vm for vm in conn.list_vms() if vm.is_stoppable()]
+        if not vms:
+            parentobj.err.show_err(
+                _("There are no running VMs to migrate on this connection."))
+            return
+        cls.show_instance(parentobj, vms)
+
     def __init__(self):
         vmmGObjectUI.__init__(self, "migrate.ui", "vmm-migrate")
         self.vm = None
+        self._vms = []
+        self._queue = None
 
         self.builder.connect_signals({
             "on_vmm_migrate_delete_event": self._delete_event,
@@ -64,6 +89,11 @@ class vmmMigrateDialog(vmmGObjectUI):
             "on_migrate_set_address_toggled": self._set_address_toggled,
             "on_migrate_set_port_toggled": self._set_port_toggled,
             "on_migrate_mode_changed": self._mode_changed,
+            "on_migrate_postcopy_toggled": self._postcopy_toggled,
+
+            "on_migrate_queue_selection_changed": self._queue_selection_changed,
+            "on_migrate_queue_cancel_clicked": self._queue_cancel_clicked,
+            "on_migrate_queue_retry_clicked": self._queue_retry_clicked,
         })
         self.bind_escape_key_close()
         self._cleanup_on_app_close()
@@ -72,7 +102,9 @@ class vmmMigrateDialog(vmmGObjectUI):
 
 
     def _cleanup(self):
+        self._set_queue(None)
         self.vm = None
+        self._vms = []
 
     @property
     def _connobjs(self):
@@ -87,30 +119,70 @@ class vmmMigrateDialog(vmmGObjectUI):
     # Public API #
     ##############
 
-    def show(self, parent, vm):
+    def show(self, parent, vms):
         logging.debug("Showing migrate wizard")
-        self._set_vm(vm)
+        if self._queue and self._queue.is_running():
+            # Don't clobber a running queue, just bring it up
+            self.topwin.present()
+            return
+
+        self._set_queue(None)
+        self._set_vms(vms)
         self._reset_state()
         self.topwin.set_transient_for(parent)
         self.topwin.present()
 
     def close(self, ignore1=None, ignore2=None):
+        if self._queue and self._queue.is_running():
+            if not self.err.yes_no(
+                    _("Migrations are still in progress."),
+                    _("Closing this window will cancel all queued and "
+                      "running migrations. Are you sure?")):
+                return 1
+
         logging.debug("Closing migrate wizard")
         self.topwin.hide()
-        self._set_vm(None)
+        self._set_queue(None)
+        self._set_vms([])
         return 1
 
     def _vm_removed(self, _conn, connkey):
-        if self.vm.get_connkey() == connkey:
+        if self._queue:
+            # Migrated VMs disappear from the source, the queue
+            # tracks them from here
+            return
+
+        self._vms = [vm for vm in self._vms if vm.get_connkey() != connkey]
+        if not self._vms:
             self.close()
+        elif self.vm.get_connkey() == connkey:
+            self.vm = self._vms[0]
 
-    def _set_vm(self, newvm):
+    def _set_vms(self, newvms):
         oldvm = self.vm
         if oldvm:
             oldvm.conn.disconnect_by_obj(self)
-        if newvm:
-            newvm.conn.connect("vm-removed", self._vm_removed)
-        self.vm = newvm
+        if newvms:
+            newvms[0].conn.connect("vm-removed", self._vm_removed)
+        self._vms = newvms[:]
+        self.vm = newvms and newvms[0] or None
+
+    def _set_queue(self, queue):
+        oldqueue = self._queue
+        self._queue = queue
+        if oldqueue:
+            oldqueue.disconnect_by_obj(self)
+            if oldqueue.is_running():
+                # Let the canceled migrations wind down before freeing it
+                oldqueue.connect("finished", lambda q: q.cleanup())
+                oldqueue.cancel_all()
+            else:
+                oldqueue.cleanup()
+
+        if queue:
+            queue.connect("job-changed", self._queue_job_changed)
+            queue.connect("progress", self._queue_progress)
+            queue.connect("finished", self._queue_finished)
 
 
     ################
@@ -157,6 +229,46 @@ class vmmMigrateDialog(vmmGObjectUI):
         combo.set_model(model)
         uiutil.init_combo_text_column(combo, 0)
 
+        # Compression combo
+        combo = self.widget("migrate-compression")
+        # label, methods
+        model = Gtk.ListStore(str, object)
+        model.append([_("None"), []])
+        model.append([_("XBZRLE"), [MigrationTuning.COMPRESSION_XBZRLE]])
+        model.append([_("Multithreaded"), [MigrationTuning.COMPRESSION_MT]])
+        model.append([_("XBZRLE and multithreaded"),
+                      [MigrationTuning.COMPRESSION_XBZRLE,
+                       MigrationTuning.COMPRESSION_MT]])
+        combo.set_model(model)
+        uiutil.init_combo_text_column(combo, 0)
+
+        # Queue order combo
+        combo = self.widget("migrate-order")
+        # id, label
+        model = Gtk.ListStore(str, str)
+        for orderid, label in vmmMigrateQueue.get_order_choices():
+            model.append([orderid, label])
+        combo.set_model(model)
+        uiutil.init_combo_text_column(combo, 1)
+
+        # Queue progress list
+        model = Gtk.ListStore(object, str, str, int)
+        qlist = self.widget("migrate-queue-list")
+        qlist.set_model(model)
+        col = Gtk.TreeViewColumn(_("VM"), Gtk.CellRendererText(),
+                                 text=QUEUE_COL_NAME)
+        col.set_expand(True)
+        qlist.append_column(col)
+        text = Gtk.CellRendererText()
+        text.set_property("ellipsize", Pango.EllipsizeMode.END)
+        col = Gtk.TreeViewColumn(_("Status"), text, text=QUEUE_COL_STATUS)
+        col.set_expand(True)
+        qlist.append_column(col)
+        col = Gtk.TreeViewColumn(_("Progress"), Gtk.CellRendererProgress(),
+                                 value=QUEUE_COL_PERCENT)
+        col.set_min_width(100)
+        qlist.append_column(col)
+
         self.widget("migrate-dest").emit("changed")
 
         self.widget("migrate-mode").set_tooltip_text(
@@ -167,8 +279,13 @@ class vmmMigrateDialog(vmmGObjectUI):
             self.widget("migrate-temporary-label").get_tooltip_text())
 
     def _reset_state(self):
-        title_str = ("<span size='large' color='white'>%s '%s'</span>" %
-                     (_("Migrate"), util.xml_escape(self.vm.get_name())))
+        is_multi = len(self._vms) > 1
+        if is_multi:
+            title_str = ("<span size='large' color='white'>%s</span>" %
+                util.xml_escape(_("Migrate %d VMs") % len(self._vms)))
+        else:
+            title_str = ("<span size='large' color='white'>%s '%s'</span>" %
+                (_("Migrate"), util.xml_escape(self.vm.get_name())))
         self.widget("header-label").set_markup(title_str)
 
         self.widget("migrate-advanced-expander").set_expanded(False)
@@ -179,7 +296,10 @@ class vmmMigrateDialog(vmmGObjectUI):
 
         hostname = self.conn.libvirt_gethostname()
         srctext = "%s (%s)" % (hostname, self.conn.get_pretty_desc())
-        self.widget("migrate-label-name").set_text(self.vm.get_name_or_title())
+        names = ", ".join([vm.get_name_or_title() for vm in self._vms])
+        self.widget("migrate-label-name").set_text(names)
+        self.widget("migrate-label-name").set_tooltip_text(
+            is_multi and names or None)
         self.widget("migrate-label-src").set_text(srctext)
         self.widget("migrate-label-src").set_tooltip_text(self.conn.get_uri())
 
@@ -190,6 +310,23 @@ class vmmMigrateDialog(vmmGObjectUI):
         self.widget("migrate-mode").set_active(0)
         self.widget("migrate-unsafe").set_active(False)
         self.widget("migrate-temporary").set_active(False)
+        self.widget("migrate-bandwidth").set_value(0)
+        self.widget("migrate-parallel").set_value(2)
+        self.widget("migrate-order").set_active(0)
+        self.widget("migrate-compression").set_active(0)
+        self.widget("migrate-auto-converge").set_active(False)
+        self.widget("migrate-postcopy").set_active(False)
+        self.widget("migrate-postcopy").toggled()
+        self.widget("migrate-postcopy-after").set_value(30)
+        self.widget("migrate-connections").set_value(0)
+        self.widget("migrate-downtime").set_value(0)
+        uiutil.set_grid_row_visible(self.widget("migrate-parallel"), is_multi)
+        uiutil.set_grid_row_visible(self.widget("migrate-order"), is_multi)
+
+        self.widget("table2").set_sensitive(True)
+        self.widget("migrate-advanced-expander").set_sensitive(True)
+        self.widget("migrate-queue-box").set_visible(False)
+        self.widget("migrate-queue-list").get_model().clear()
 
         if self.conn.is_xen():
             # Default xen port is 8002
@@ -229,7 +366,8 @@ class vmmMigrateDialog(vmmGObjectUI):
         if not can_migrate:
             tooltip = _("A valid destination connection must be selected.")
 
-        self.widget("config-box").set_visible(can_migrate)
+        self.widget("config-box").set_visible(can_migrate and
+                                              not self._queue)
         self.widget("migrate-finish").set_sensitive(can_migrate)
         self.widget("migrate-finish").set_tooltip_text(tooltip)
 
@@ -288,6 +426,9 @@ class vmmMigrateDialog(vmmGObjectUI):
     def _is_tunnel_selected(self):
         return uiutil.get_list_selection(self.widget("migrate-mode"), column=1)
 
+    def _postcopy_toggled(self, src):
+        self.widget("migrate-postcopy-after").set_sensitive(src.get_active())
+
     def _mode_changed(self, src):
         ignore = src
         is_tunnel = self._is_tunnel_selected()
@@ -351,6 +492,24 @@ class vmmMigrateDialog(vmmGObjectUI):
     # migrate handling #
     ####################
 
+    def _build_tuning(self):
+        tuning = MigrationTuning()
+        tuning.bandwidth = int(self.widget("migrate-bandwidth").get_value())
+        tuning.compression = uiutil.get_list_selection(
+            self.widget("migrate-compression"), column=1) or []
+        tuning.auto_converge = self.widget("migrate-auto-converge").get_active()
+        if self.widget("migrate-postcopy").get_active():
+            tuning.postcopy = True
+            tuning.postcopy_after = int(
+                self.widget("migrate-postcopy-after").get_value())
+        tuning.parallel_connections = int(
+            self.widget("migrate-connections").get_value())
+        tuning.downtime = int(self.widget("migrate-downtime").get_value())
+        tuning.validate()
+        if tuning.is_default():
+            return None
+        return tuning
+
     def _build_regular_migrate_uri(self):
         address = None
         if self.widget("migrate-address").get_visible():
@@ -391,6 +550,9 @@ class vmmMigrateDialog(vmmGObjectUI):
             tunnel = self._is_tunnel_selected()
             unsafe = self.widget("migrate-unsafe").get_active()
             temporary = self.widget("migrate-temporary").get_active()
+            tuning = self._build_tuning()
+            parallel = int(self.widget("migrate-parallel").get_value())
+            order = uiutil.get_list_selection(self.widget("migrate-order"))
 
             if tunnel:
                 uri = self.widget("migrate-tunnel-uri").get_text()
@@ -403,6 +565,11 @@ class vmmMigrateDialog(vmmGObjectUI):
                                details=details)
             return
 
+        if len(self._vms) > 1:
+            self._start_queue(destconn, uri, tunnel, unsafe, temporary,
+                              tuning, parallel, order)
+            return
+
         self.set_finish_cursor()
 
         cancel_cb = None
@@ -414,7 +581,7 @@ class vmmMigrateDialog(vmmGObjectUI):
 
         progWin = vmmAsyncJob(
             self._async_migrate,
-            [self.vm, destconn, uri, tunnel, unsafe, temporary],
+            [self.vm, destconn, uri, tunnel, unsafe, temporary, tuning],
             self._finish_cb, [destconn],
             _("Migrating VM '%s'") % self.vm.get_name(),
             (_("Migrating VM '%s' to %s. This may take a while.") %
@@ -438,7 +605,8 @@ class vmmMigrateDialog(vmmGObjectUI):
         return
 
     def _async_migrate(self, asyncjob,
-            origvm, origdconn, migrate_uri, tunnel, unsafe, temporary):
+            origvm, origdconn, migrate_uri, tunnel, unsafe, temporary,
+            tuning):
         meter = asyncjob.get_meter()
 
         srcconn = origvm.conn
@@ -451,4 +619,90 @@ class vmmMigrateDialog(vmmGObjectUI):
                       srcconn.get_uri(), dstconn.get_uri())
 
         vm.migrate(dstconn, migrate_uri, tunnel, unsafe, temporary,
-            meter=meter)
+            meter=meter, tuning=tuning)
+
+
+    ##########################
+    # Migrate queue handling #
+    ##########################
+
+    def _start_queue(self, destconn, uri, tunnel, unsafe, temporary,
+                     tuning, parallel, order):
+        queue = vmmMigrateQueue(self.conn, destconn, uri,
+            tunnel=tunnel, unsafe=unsafe, temporary=temporary,
+            tuning=tuning, parallel=parallel, order=order)
+        self._set_queue(queue)
+        queue.add_vms(self._vms)
+
+        model = self.widget("migrate-queue-list").get_model()
+        model.clear()
+        for job in queue.get_jobs():
+            model.append([job, job.name, job.get_state_desc(), 0])
+
+        self.widget("table2").set_sensitive(False)
+        self.widget("config-box").set_visible(False)
+        self.widget("migrate-advanced-expander").set_sensitive(False)
+        self.widget("migrate-queue-box").set_visible(True)
+        self.widget("migrate-finish").set_sensitive(False)
+        self._queue_selection_changed(None)
+        self._queue_progress(queue)
+
+        logging.debug("Starting migrate queue of %d VMs to %s, "
+                      "parallel=%s order=%s", len(self._vms),
+                      destconn.get_uri(), parallel, order)
+        queue.start()
+
+    def _selected_queue_job(self):
+        row = uiutil.get_list_selected_row(self.widget("migrate-queue-list"))
+        return row and row[QUEUE_COL_JOB] or None
+
+    def _queue_selection_changed(self, src):
+        ignore = src
+        job = self._selected_queue_job()
+        self.widget("migrate-queue-cancel").set_sensitive(
+            bool(job and not job.is_finished()))
+        self.widget("migrate-queue-retry").set_sensitive(
+            bool(job and job.state in [vmmMigrateJob.STATE_FAILED,
+                                       vmmMigrateJob.STATE_CANCELLED]))
+
+    def _queue_cancel_clicked(self, src):
+        ignore = src
+        job = self._selected_queue_job()
+        if job and self._queue:
+            self._queue.cancel_job(job)
+
+    def _queue_retry_clicked(self, src):
+        ignore = src
+        job = self._selected_queue_job()
+        if job and self._queue:
+            self._queue.retry_job(job)
+
+    def _queue_job_changed(self, queue, job):
+        ignore = queue
+        for row in self.widget("migrate-queue-list").get_model():
+            if row[QUEUE_COL_JOB] is job:
+                row[QUEUE_COL_STATUS] = job.get_state_desc()
+                row[QUEUE_COL_PERCENT] = int(job.get_fraction() * 100)
+                if job.details:
+                    logging.debug("Migration of %s failed:\n%s",
+                                  job.name, job.details)
+        self._queue_selection_changed(None)
+
+    def _queue_progress(self, queue):
+        for row in self.widget("migrate-queue-list").get_model():
+            row[QUEUE_COL_PERCENT] = int(
+                row[QUEUE_COL_JOB].get_fraction() * 100)
+
+        fraction, finished, total = queue.get_progress()
+        pbar = self.widget("migrate-queue-progress")
+        pbar.set_fraction(fraction)
+        pbar.set_text(_("%(finished)d of %(total)d VMs finished") %
+                      {"finished": finished, "total": total})
+
+    def _queue_finished(self, queue):
+        jobs = queue.get_jobs()
+        failed = [j for j in jobs if j.state != vmmMigrateJob.STATE_DONE]
+        logging.debug("Migrate queue finished, %d of %d failed or "
+                      "cancelled", len(failed), len(jobs))
+        if not failed:
+            self.close()
@@ -0,0 +1,392 @@
+#
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import logging
+import threading
+import time
+import traceback
+
+import libvirt
+
+from .baseclass import vmmGObject
+from .domain import vmmDomain
+
+
+class vmmMigrateJob(object):
+    """
+    State of a single VM in a vmmMigrateQueue
+    """
+    STATE_QUEUED = "queued"
+    STATE_RUNNING = "running"
+    STATE_DONE = "done"
+    STATE_FAILED = "failed"
+    STATE_CANCELLED = "cancelled"
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.name = vm.get_name()
+        self.memory = vm.get_memory()
+        self.dirty_rate = None
+
+        self.state = self.STATE_QUEUED
+        self.error = None
+        self.details = None
+        self.data_total = 0
+        self.data_processed = 0
+        self.cancel_requested = False
+        self.can_poll = None
+
+    def reset(self):
+        self.state = self.STATE_QUEUED
+        self.error = None
+        self.details = None
+        self.data_total = 0
+        self.data_processed = 0
+        self.cancel_requested = False
+
+    def is_finished(self):
+        return self.state in [self.STATE_DONE, self.STATE_FAILED,
+                              self.STATE_CANCELLED]
+
+    def get_fraction(self):
+        if self.state == self.STATE_DONE:
+            return 1.0
+        if not self.data_total:
+            return 0.0
+        return min(1.0, float(self.data_processed) / self.data_total)
+
+    def get_state_desc(self):
+        if self.state == self.STATE_QUEUED:
+            return _("Queued")
+        if self.state == self.STATE_RUNNING:
+            if self.cancel_requested:
+                return _("Cancelling")
+            return _("Migrating")
+        if self.state == self.STATE_DONE:
+            return _("Done")
+        if self.state == self.STATE_CANCELLED:
+            return _("Cancelled")
+        return _("Failed: %s") % self.error
+
+
+class vmmMigrateQueue(vmmGObject):
+    """
+    Migrate a set of VMs from one connection to another, running at most
+    'parallel' migrations at once.
+
+    Scheduling and all state changes happen in the main loop. Every
+    migration runs in its own thread, and a single thread polls jobInfo
+    for all running migrations to feed the progress numbers.
+    """
+    __gsignals__ = {
+        "job-changed": (vmmGObject.RUN_FIRST, None, [object]),
+        "progress": (vmmGObject.RUN_FIRST, None, []),
+        "finished": (vmmGObject.RUN_FIRST, None, []),
+    }
+
+    # Smallest guests first, so most VMs are off the host quickly
+    ORDER_MEMORY = "memory"
+    # Largest guests first, so the long migrations overlap the short ones
+    ORDER_MEMORY_DESC = "memory-desc"
+    # Lowest memory dirty rate first, those are most likely to converge
+    ORDER_DIRTY_RATE = "dirty-rate"
+
+    PROGRESS_INTERVAL = .5
+    DIRTY_RATE_CALC_SECONDS = 1
+
+    @staticmethod
+    def get_order_choices():
+        return [(vmmMigrateQueue.ORDER_MEMORY,
+                 _("Smallest memory first")),
+                (vmmMigrateQueue.ORDER_MEMORY_DESC,
+                 _("Largest memory first")),
+                (vmmMigrateQueue.ORDER_DIRTY_RATE,
+                 _("Lowest memory dirty rate first"))]
+
+    def __init__(self, srcconn, destconn, dest_uri,
+                 tunnel=False, unsafe=False, temporary=False,
+                 tuning=None, parallel=2, order=ORDER_MEMORY):
+        """
+        :param tuning: virtinst.MigrationTuning applied to every migration,
+            its bandwidth is the per migration cap
+        """
+        vmmGObject.__init__(self)
+
+        self._srcconn = srcconn
+        self._destconn = destconn
+        self._dest_uri = dest_uri
+        self._tunnel = tunnel
+        self._unsafe = unsafe
+        self._temporary = temporary
+        self._tuning = tuning
+        self._parallel = max(1, int(parallel))
+        self._order = order
+
+        self._jobs = []
+        self._started = False
+        self._poll_running = False
+        self._lock = threading.Lock()
+
+    def _cleanup(self):
+        self._srcconn = None
+        self._destconn = None
+        self._jobs = []
+
+
+    ##############
+    # Public API #
+    ##############
+
+    def add_vms(self, vms):
+        for vm in vms:
+            self._jobs.append(vmmMigrateJob(vm))
+        if self._started:
+            self._schedule()
+
+    def get_jobs(self):
+        return self._jobs[:]
+
+    def is_running(self):
+        return bool([j for j in self._jobs if not j.is_finished()])
+
+    def get_progress(self):
+        """
+        Return (fraction, finished job count, total job count) for the
+        whole queue. Each VM weighs in with its memory size, since that's
+        roughly what has to be transferred.
+        """
+        total = 0
+        done = 0.0
+        for job in self._jobs:
+            weight = max(job.memory, 1)
+            total += weight
+            done += weight * job.get_fraction()
+        fraction = total and (done / total) or 0.0
+        finished = len([j for j in self._jobs if j.is_finished()])
+        return fraction, finished, len(self._jobs)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+
+        if self._order == self.ORDER_DIRTY_RATE:
+            # Sampling takes a moment, do it off the main loop and
+            # only start scheduling once we have the numbers
+            self._start_thread(self._sample_dirty_rates,
+                               "Migrate dirty rate sampling")
+        else:
+            self._schedule()
+
+    def cancel_job(self, job):
+        if job.is_finished():
+            return
+        if job.state == vmmMigrateJob.STATE_QUEUED:
+            job.state = vmmMigrateJob.STATE_CANCELLED
+            self._job_changed(job)
+            self._check_finished()
+            return
+
+        job.cancel_requested = True
+        self._job_changed(job)
+        try:
+            job.vm.abort_job()
+        except Exception:
+            logging.debug("Error aborting migration of %s",
+                          job.name, exc_info=True)
+
+    def cancel_all(self):
+        # Cancel queued jobs first so nothing new starts as the running
+        # ones wind down
+        for job in sorted(self._jobs,
+                key=lambda j: j.state != vmmMigrateJob.STATE_QUEUED):
+            self.cancel_job(job)
+
+    def retry_job(self, job):
+        if job.state not in [vmmMigrateJob.STATE_FAILED,
+                             vmmMigrateJob.STATE_CANCELLED]:
+            return
+        job.reset()
+        self._job_changed(job)
+        self._schedule()
+
+
+    ##############
+    # Scheduling #
+    ##############
+
+    def _sort_key(self, job):
+        if self._order == self.ORDER_MEMORY_DESC:
+            return (-job.memory,)
+        if self._order == self.ORDER_DIRTY_RATE:
+            # VMs we couldn't sample go last, smallest first
+            if job.dirty_rate is None:
+                return (1, 0, job.memory)
+            return (0, job.dirty_rate, job.memory)
+        return (job.memory,)
+
+    def _sample_dirty_rates(self):
+        """
+        Have libvirt measure the memory dirty rate of every queued VM.
+        Needs libvirt 7.2.0 or later, everything else falls back to
+        memory size ordering.
+        """
+        stats_flag = getattr(libvirt, "VIR_DOMAIN_STATS_DIRTYRATE", None)
+        sampled = []
+        for job in self._jobs:
+            if stats_flag is None:
+                break
+            try:
+                job.vm.get_backend().startDirtyRateCalc(
+                    self.DIRTY_RATE_CALC_SECONDS, 0)
+                sampled.append(job)
+            except Exception as e:
+                logging.debug("Can't sample dirty rate of %s: %s",
+                              job.name, e)
+
+        if sampled:
+            time.sleep(self.DIRTY_RATE_CALC_SECONDS + .5)
+            try:
+                ret = self._srcconn.get_backend().domainListGetStats(
+                    [job.vm.get_backend() for job in sampled], stats_flag)
+                for job, (ignore, stats) in zip(sampled, ret):
+                    job.dirty_rate = stats.get(
+                        "dirtyrate.megabytes_per_second")
+            except Exception:
+                logging.debug("Error fetching dirty rate stats",
+                              exc_info=True)
+
+        logging.debug("Sampled migrate dirty rates: %s",
+                      [(j.name, j.dirty_rate) for j in self._jobs])
+        self.idle_add(self._schedule)
+
+    def _schedule(self):
+        if not self._started or self._srcconn is None:
+            return
+
+        running = [j for j in self._jobs
+                   if j.state == vmmMigrateJob.STATE_RUNNING]
+        queued = sorted([j for j in self._jobs
+                         if j.state == vmmMigrateJob.STATE_QUEUED],
+                        key=self._sort_key)
+
+        for job in queued[:max(0, self._parallel - len(running))]:
+            job.state = vmmMigrateJob.STATE_RUNNING
+            self._job_changed(job)
+            self._start_thread(self._migrate_thread,
+                               "Migrating %s" % job.name, args=(job,))
+
+        if running or queued:
+            self._start_progress_poll()
+        self._check_finished()
+
+    def _check_finished(self):
+        if self._srcconn is None:
+            return
+        if self._jobs and not self.is_running():
+            self._destconn.schedule_priority_tick(pollvm=True)
+            self._srcconn.schedule_priority_tick(pollvm=True)
+            self.emit("progress")
+            self.emit("finished")
+
+    def _job_changed(self, job):
+        self.emit("job-changed", job)
+        self.emit("progress")
+
+    def _migrate_thread(self, job):
+        error = None
+        details = None
+        try:
+            # Like the single VM migrate path, use a private vmmDomain
+            # so the tick thread doesn't trip over our backend
+            backend = self._srcconn.get_backend().lookupByName(job.name)
+            vm = vmmDomain(self._srcconn, backend, backend.UUID())
+
+            logging.debug("Queued migrate of vm=%s from %s to %s",
+                          job.name, self._srcconn.get_uri(),
+                          self._destconn.get_uri())
+            vm.migrate(self._destconn, self._dest_uri, self._tunnel,
+                       self._unsafe, self._temporary,
+                       tuning=self._tuning)
+        except Exception as e:
+            error = str(e)
+            details = "".join(traceback.format_exc())
+            logging.debug("Queued migrate of %s failed: %s", job.name, e)
+
+        self.idle_add(self._migrate_finished, job, error, details)
+
+    def _migrate_finished(self, job, error, details):
+        if job.cancel_requested:
+            job.state = vmmMigrateJob.STATE_CANCELLED
+        elif error:
+            job.state = vmmMigrateJob.STATE_FAILED
+        else:
+            job.state = vmmMigrateJob.STATE_DONE
+        job.error = error
+        job.details = details
+        self._job_changed(job)
+        self._schedule()
+
+
+    #####################
+    # Progress handling #
+    #####################
+
+    def _start_progress_poll(self):
+        with self._lock:
+            if self._poll_running:
+                return
+            self._poll_running = True
+        self._start_thread(self._progress_thread,
+                           "Migrate queue progress")
+
+    def _poll_job(self, job):
+        if job.can_poll is None:
+            job.can_poll = job.vm.getjobinfo_supported
+        if not job.can_poll:
+            return
+
+        try:
+            jobinfo = job.vm.job_info()
+        except Exception as e:
+            logging.debug("Error calling jobinfo for %s: %s", job.name, e)
+            return
+
+        # data_total is 0 if the job hasn't started yet
+        if jobinfo[3]:
+            job.data_total = jobinfo[3]
+            job.data_processed = jobinfo[3] - jobinfo[5]
+
+    def _progress_thread(self):
+        while True:
+            time.sleep(self.PROGRESS_INTERVAL)
+            with self._lock:
+                running = [j for j in self._jobs
+                           if j.state == vmmMigrateJob.STATE_RUNNING]
+                if not running:
+                    self._poll_running = False
+                    return
+
+            try:
+                for job in running:
+                    self._poll_job(job)
+            except Exception:
+                logging.debug("Error polling migrate progress",
+                              exc_info=True)
+            self.idle_emit("progress")
@@ -18,6 +18,7 @@
 # MA 02110-1301 USA.
 #
 
+import collections
 import os
 import termios
 import tty
@@ -143,14 +144,186 @@ class LocalConsoleConnection(ConsoleConnection):
         return True
 
 
+# Stop reading from the console stream once this much data is waiting to
+# be fed to the terminal, and start again when it drains below the low mark
+_STREAM_HIGH_WATER = 4 * 1024 * 1024
+_STREAM_LOW_WATER = 1024 * 1024
+# Most data we feed the terminal in a single main loop iteration
+_TERMINAL_FEED_SIZE = 256 * 1024
+# Most data we hand to a single stream send() call
+_STREAM_SEND_SIZE = 64 * 1024
+
+# Console log tee rotation settings
+_LOG_MAX_SIZE = 1024 * 1024
+_LOG_BACKUPS = 3
+
+
+class _ChunkBuffer(object):
+    """
+    FIFO byte buffer that keeps data as a deque of chunks, so appending
+    and consuming never copies all the pending data
+    """
+    def __init__(self):
+        self._chunks = collections.deque()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, data):
+        if not data:
+            return
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+
+    def peek(self, maxsize):
+        """
+        Return up to maxsize bytes from the front of the buffer, without
+        consuming them
+        """
+        if not self._chunks:
+            return b""
+        if len(self._chunks[0]) >= maxsize:
+            return self._chunks[0][:maxsize]
+
+        ret = bytearray()
+        for chunk in self._chunks:
+            ret += chunk[:maxsize - len(ret)]
+            if len(ret) >= maxsize:
+                break
+        return bytes(ret)
+
+    def consume(self, count):
+        self._size -= count
+        while count and self._chunks:
+            chunk = self._chunks[0]
+            if len(chunk) > count:
+                self._chunks[0] = chunk[count:]
+                break
+            self._chunks.popleft()
+            count -= len(chunk)
+
+    def clear(self):
+        self._chunks.clear()
+        self._size = 0
+
+
+class _RotatingConsoleLog(object):
+    """
+    Append raw console output to a file, rotating it to path.1 ... path.N
+    when it grows past maxsize
+    """
+    def __init__(self, path, maxsize=_LOG_MAX_SIZE, backups=_LOG_BACKUPS):
+        self._path = path
+        self._maxsize = maxsize
+        self._backups = backups
+        self._fileobj = None
+        self._size = 0
+
+    def _rotate(self):
+        self.close()
+        for idx in reversed(range(1, self._backups)):
+            src = "%s.%d" % (self._path, idx)
+            if os.path.exists(src):
+                os.rename(src, "%s.%d" % (self._path, idx + 1))
+        os.rename(self._path, self._path + ".1")
+
+    def write(self, data):
+        if self._fileobj and self._size + len(data) > self._maxsize:
+            self._rotate()
+        if not self._fileobj:
+            dirname = os.path.dirname(self._path)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname, 0o755)
+            self._fileobj = open(self._path, "ab")
+            self._size = self._fileobj.tell()
+
+        self._fileobj.write(data)
+        self._size += len(data)
+
+    def flush(self):
+        if self._fileobj:
+            self._fileobj.flush()
+
+    def close(self):
+        if self._fileobj:
+            self._fileobj.close()
+        self._fileobj = None
+
+
 class LibvirtConsoleConnection(ConsoleConnection):
     def __init__(self, vm):
         ConsoleConnection.__init__(self, vm)
 
         self.stream = None
+        self._stream_events = None
+        self._reading_paused = False
+
+        self._to_terminal = _ChunkBuffer()
+        self._to_stream = _ChunkBuffer()
+        self._display_pending = False
+        self._log = None
+
+        # Background console capture, if it was running for this VM
+        self._capture = None
+        self._capture_devname = None
+        self._capture_position = None
+
+    def _update_stream_events(self):
+        """
+        Only listen for READABLE while the terminal is keeping up, and
+        for WRITABLE while we have something to send
+        """
+        if not self.stream:
+            return
+
+        pending = len(self._to_terminal)
+        if pending >= _STREAM_HIGH_WATER:
+            self._reading_paused = True
+        elif pending < _STREAM_LOW_WATER:
+            self._reading_paused = False
+
+        events = (libvirt.VIR_STREAM_EVENT_ERROR |
+                  libvirt.VIR_STREAM_EVENT_HANGUP)
+        if not self._reading_paused:
+            events |= libvirt.VIR_STREAM_EVENT_READABLE
+        if self._to_stream:
+            events |= libvirt.VIR_STREAM_EVENT_WRITABLE
+
+        if events == self._stream_events:
+            return
+        self._stream_events = events
+        self.stream.eventUpdateCallback(events)
+
+    def _log_data(self, data):
+        if not self._log:
+            return
+        try:
+            self._log.write(data)
+        except Exception:
+            logging.debug("Error writing console log, disabling it",
+                          exc_info=True)
+            self._close_log()
 
-        self.streamToTerminal = b""
-        self.terminalToStream = ""
+    def _close_log(self):
+        if self._log:
+            try:
+                self._log.close()
+            except Exception:
+                logging.debug("Error closing console log", exc_info=True)
+        self._log = None
+
+    def _open_log(self, dev):
+        if not self.config.get_console_serial_log():
+            return
+
+        name = self.vm.get_name()
+        if dev and dev.alias.name:
+            name += "-" + dev.alias.name
+        path = os.path.join(self.conn.get_cache_dir(), "console",
+                            name + ".log")
+        logging.debug("Logging serial console to %s", path)
+        self._log = _RotatingConsoleLog(path)
 
     def _event_on_stream(self, stream, events, opaque):
         ignore = stream
@@ -178,16 +351,22 @@ class LibvirtConsoleConnection(ConsoleConnection):
                 self.close()
                 return
 
-            queued_text = bool(self.streamToTerminal)
-            self.streamToTerminal += got
-            if not queued_text:
+            self._to_terminal.append(got)
+            self._log_data(got)
+            if self._capture:
+                self._capture.record(self.vm, self._capture_devname, got)
+            if not self._display_pending:
+                # Everything received before the idle callback runs
+                # is fed to the terminal in one go
+                self._display_pending = True
                 self.idle_add(self.display_data, terminal)
 
         if (events & libvirt.VIR_EVENT_HANDLE_WRITABLE and
-            self.terminalToStream):
+            self._to_stream):
 
             try:
-                done = self.stream.send(self.terminalToStream.encode())
+                done = self.stream.send(
+                    self._to_stream.peek(_STREAM_SEND_SIZE))
             except Exception:
                 logging.exception("Error sending stream data")
                 self.close()
@@ -197,12 +376,9 @@ class LibvirtConsoleConnection(ConsoleConnection):
                 # This is basically EAGAIN
                 return
 
-            self.terminalToStream = self.terminalToStream[done:]
+            self._to_stream.consume(done)
 
-        if not self.terminalToStream:
-            self.stream.eventUpdateCallback(libvirt.VIR_STREAM_EVENT_READABLE |
-                                            libvirt.VIR_STREAM_EVENT_ERROR |
-                                            libvirt.VIR_STREAM_EVENT_HANGUP)
+        self._update_stream_events()
 
 
     def is_open(self):
@@ -219,13 +395,24 @@ class LibvirtConsoleConnection(ConsoleConnection):
         # opening the first console device, so don't force prescence of
         # an alias
 
+        self._suspend_capture(terminal, name)
+
         stream = self.conn.get_backend().newStream(libvirt.VIR_STREAM_NONBLOCK)
         self.vm.open_console(name, stream)
         self.stream = stream
+        self._to_stream.clear()
+        self._reading_paused = False
+
+        try:
+            self._open_log(dev)
+        except Exception:
+            logging.debug("Error opening console log", exc_info=True)
+            self._close_log()
 
-        self.stream.eventAddCallback((libvirt.VIR_STREAM_EVENT_READABLE |
-                                      libvirt.VIR_STREAM_EVENT_ERROR |
-                                      libvirt.VIR_STREAM_EVENT_HANGUP),
+        self._stream_events = (libvirt.VIR_STREAM_EVENT_READABLE |
+                               libvirt.VIR_STREAM_EVENT_ERROR |
+                               libvirt.VIR_STREAM_EVENT_HANGUP)
+        self.stream.eventAddCallback(self._stream_events,
                                      self._event_on_stream,
                                      terminal)
 
@@ -241,6 +428,34 @@ class LibvirtConsoleConnection(ConsoleConnection):
                 logging.exception("Error finishing stream")
 
         self.stream = None
+        self._stream_events = None
+        self._to_stream.clear()
+        self._close_log()
+
+        if self._capture:
+            self._capture_position = self._capture.resume(
+                self.vm, self._capture_devname)
+            self._capture = None
+
+    def _suspend_capture(self, terminal, devname):
+        """
+        Take the console over from the background capture, showing the
+        output it recorded that this terminal hasn't seen yet. Does
+        nothing unless the capture is recording this VM and device.
+        """
+        capture = self.conn.get_console_capture()
+        if not capture or capture.suspend(self.vm, devname) is None:
+            return
+
+        self._capture = capture
+        self._capture_devname = devname
+        scrollback = capture.get_scrollback(self.vm, devname,
+                                            self._capture_position)
+        if scrollback:
+            self._to_terminal.append(scrollback)
+            if not self._display_pending:
+                self._display_pending = True
+                self.idle_add(self.display_data, terminal)
 
     def send_data(self, src, text, length, terminal):
         ignore = src
@@ -250,19 +465,29 @@ class LibvirtConsoleConnection(ConsoleConnection):
         if self.stream is None:
             return
 
-        self.terminalToStream += text
-        if self.terminalToStream:
-            self.stream.eventUpdateCallback(libvirt.VIR_STREAM_EVENT_READABLE |
-                                            libvirt.VIR_STREAM_EVENT_WRITABLE |
-                                            libvirt.VIR_STREAM_EVENT_ERROR |
-                                            libvirt.VIR_STREAM_EVENT_HANGUP)
+        self._to_stream.append(text.encode())
+        self._update_stream_events()
 
     def display_data(self, terminal):
-        if not self.streamToTerminal:
-            return
+        """
+        Feed pending data to the terminal, at most _TERMINAL_FEED_SIZE
+        per main loop iteration so a flooding guest can't starve the UI.
+        Returns True to be called again while data is left over.
+        """
+        data = self._to_terminal.peek(_TERMINAL_FEED_SIZE)
+        self._to_terminal.consume(len(data))
+        if data:
+            terminal.feed(data)
+        if self._log:
+            self._log.flush()
 
-        terminal.feed(self.streamToTerminal)
-        self.streamToTerminal = b""
+        # Resume reading if we were paused and have caught up
+        self._update_stream_events()
+
+        if self._to_terminal:
+            return True
+        self._display_pending = False
+        return False
 
 
 class vmmSerialConsole(vmmGObject):
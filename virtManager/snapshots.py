@@ -64,6 +64,12 @@ class vmmSnapshotPage(vmmGObjectUI):
         self._initial_populate = False
         self._unapplied_changes = False
 
+        # {(snapshot name, screenshot mtime): scaled pixbuf}
+        self._thumbnails = {}
+        self._thumbnails_loading = set()
+        self._shown_thumbnail_key = None
+        self._new_screenshot_serial = 0
+
         self._snapmenu = None
         self._init_ui()
 
@@ -103,6 +109,7 @@ class vmmSnapshotPage(vmmGObjectUI):
 
     def _cleanup(self):
         self.vm = None
+        self._thumbnails = {}
 
         self._snapshot_new.destroy()
         self._snapshot_new = None
@@ -291,21 +298,96 @@ class vmmSnapshotPage(vmmGObjectUI):
         return pixbuf.scale_simple(width, height,
                                    GdkPixbuf.InterpType.BILINEAR)
 
-    def _read_screenshot_file(self, name):
+    def _find_screenshot_file(self, name):
         if not name:
-            return
+            return None, None
 
         cache_dir = self.vm.get_cache_dir()
         basename = os.path.join(cache_dir, "snap-screenshot-%s" % name)
         files = glob.glob(basename + ".*")
         if not files:
-            return
+            return None, None
 
         filename = files[0]
         mime = _mime_to_ext(os.path.splitext(filename)[1][1:], reverse=True)
         if not mime:
+            return None, None
+        return filename, mime
+
+    def _thumbnail_path(self, name):
+        return os.path.join(self.vm.get_cache_dir(),
+                            "snap-thumbnail-%s.png" % name)
+
+    def _load_thumbnail_thread(self, key, filename, mime, thumbpath):
+        """
+        Load the scaled screenshot for a snapshot. The pre-scaled
+        thumbnail on disk is used if it was made from the current
+        screenshot file, otherwise it is regenerated.
+        """
+        mtime = str(key[1])
+        pixbuf = None
+        try:
+            if os.path.exists(thumbpath):
+                thumb = GdkPixbuf.Pixbuf.new_from_file(thumbpath)
+                if thumb.get_option("tEXt::vmm-source-mtime") == mtime:
+                    pixbuf = thumb
+
+            if not pixbuf:
+                pixbuf = self._make_screenshot_pixbuf(
+                    mime, open(filename, "rb").read())
+                try:
+                    pixbuf.savev(thumbpath, "png",
+                                 ["tEXt::vmm-source-mtime"], [mtime])
+                except Exception:
+                    logging.debug("Error saving thumbnail %s",
+                                  thumbpath, exc_info=True)
+        except Exception:
+            logging.exception("Error loading screenshot %s", filename)
+
+        self.idle_add(self._thumbnail_loaded, key, pixbuf)
+
+    def _thumbnail_loaded(self, key, pixbuf):
+        if self.vm is None:
+            return
+        self._thumbnails_loading.discard(key)
+        if pixbuf:
+            self._thumbnails[key] = pixbuf
+        if key == self._shown_thumbnail_key:
+            self._show_screenshot(pixbuf)
+
+    def _show_screenshot(self, pixbuf):
+        self.widget("snapshot-screenshot").set_visible(bool(pixbuf))
+        self.widget("snapshot-screenshot-label").set_visible(not bool(pixbuf))
+        if pixbuf:
+            self.widget("snapshot-screenshot").set_from_pixbuf(pixbuf)
+
+    def _set_screenshot(self, name):
+        """
+        Show the snapshot screenshot from the thumbnail cache, decoding
+        it in a thread if it isn't cached yet
+        """
+        self._shown_thumbnail_key = None
+        filename, mime = self._find_screenshot_file(name)
+        if not filename:
+            self._show_screenshot(None)
+            return
+
+        key = (name, os.stat(filename).st_mtime)
+        self._shown_thumbnail_key = key
+        if key in self._thumbnails:
+            self._show_screenshot(self._thumbnails[key])
             return
-        return self._make_screenshot_pixbuf(mime, open(filename, "rb").read())
+
+        # Hide everything until the decode finishes
+        self.widget("snapshot-screenshot").set_visible(False)
+        self.widget("snapshot-screenshot-label").set_visible(False)
+        if key in self._thumbnails_loading:
+            return
+        self._thumbnails_loading.add(key)
+        self._start_thread(self._load_thumbnail_thread,
+                           "Snapshot thumbnail %s" % name,
+                           args=[key, filename, mime,
+                                 self._thumbnail_path(name)])
 
     def _set_snapshot_state(self, snap=None):
         self.widget("snapshot-notebook").set_current_page(0)
@@ -351,11 +433,7 @@ class vmmSnapshotPage(vmmGObjectUI):
                 mode = _("External disk only")
             self.widget("snapshot-mode").set_text(mode)
 
-        sn = self._read_screenshot_file(name)
-        self.widget("snapshot-screenshot").set_visible(bool(sn))
-        self.widget("snapshot-screenshot-label").set_visible(not bool(sn))
-        if sn:
-            self.widget("snapshot-screenshot").set_from_pixbuf(sn)
+        self._set_screenshot(name)
 
         self.widget("snapshot-add").set_sensitive(True)
         self.widget("snapshot-delete").set_sensitive(bool(snap))
@@ -387,13 +465,15 @@ class vmmSnapshotPage(vmmGObjectUI):
     # 'New' handling #
     ##################
 
-    def _take_screenshot(self):
+    def _take_screenshot(self, read_data=True):
         stream = None
         try:
             stream = self.vm.conn.get_backend().newStream(0)
             screen = 0
             flags = 0
             mime = self.vm.get_backend().screenshot(stream, screen, flags)
+            if not read_data:
+                return mime, None
 
             ret = io.BytesIO()
             def _write_cb(_stream, data, userdata):
@@ -405,38 +485,60 @@ class vmmSnapshotPage(vmmGObjectUI):
             return mime, ret.getvalue()
         finally:
             try:
-                if stream:
+                if stream and read_data:
                     stream.finish()
+                elif stream:
+                    stream.abort()
             except Exception:
                 pass
 
-    def _get_screenshot(self):
-        if not self.vm.is_active():
-            logging.debug("Skipping screenshot since VM is not active")
-            return
-        if not self.vm.get_graphics_devices():
-            logging.debug("Skipping screenshot since VM has no graphics")
-            return
-
+    def _screenshot_thread(self, serial):
+        newpix = None
         try:
-            # Perform two screenshots, because qemu + qxl has a bug where
+            # Request two screenshots, because qemu + qxl has a bug where
             # screenshot generally only shows the data from the previous
             # screenshot request:
             # https://bugs.launchpad.net/qemu/+bug/1314293
-            self._take_screenshot()
+            # The first one only needs to be requested, so we drop its
+            # stream without reading it.
+            self._take_screenshot(read_data=False)
             mime, sdata = self._take_screenshot()
+
+            if _mime_to_ext(mime):
+                newpix = self._make_screenshot_pixbuf(mime, sdata)
+                setattr(newpix, "vmm_mimetype", mime)
+                setattr(newpix, "vmm_sndata", sdata)
         except Exception:
             logging.exception("Error taking screenshot")
+
+        self.idle_add(self._screenshot_taken, serial, newpix)
+
+    def _screenshot_taken(self, serial, newpix):
+        if self.vm is None or serial != self._new_screenshot_serial:
             return
+        uiutil.set_grid_row_visible(
+            self.widget("snapshot-new-screenshot"), bool(newpix))
+        if newpix:
+            self.widget("snapshot-new-screenshot").set_from_pixbuf(newpix)
+
+    def _start_screenshot(self):
+        """
+        Take a screenshot for the 'New' dialog in a thread. The screenshot
+        row is shown once it's ready.
+        """
+        self._new_screenshot_serial += 1
+        uiutil.set_grid_row_visible(
+            self.widget("snapshot-new-screenshot"), False)
 
-        ext = _mime_to_ext(mime)
-        if not ext:
+        if not self.vm.is_active():
+            logging.debug("Skipping screenshot since VM is not active")
+            return
+        if not self.vm.get_graphics_devices():
+            logging.debug("Skipping screenshot since VM has no graphics")
             return
 
-        newpix = self._make_screenshot_pixbuf(mime, sdata)
-        setattr(newpix, "vmm_mimetype", mime)
-        setattr(newpix, "vmm_sndata", sdata)
-        return newpix
+        self._start_thread(self._screenshot_thread, "Snapshot screenshot",
+                           args=[self._new_screenshot_serial])
 
     def _reset_new_state(self):
         collidelist = [s.get_xmlobj().name for s in self.vm.list_snapshots()]
@@ -451,11 +553,7 @@ class vmmSnapshotPage(vmmGObjectUI):
         self.widget("snapshot-new-status-icon").set_from_icon_name(
             self.vm.run_status_icon_name(), Gtk.IconSize.BUTTON)
 
-        sn = self._get_screenshot()
-        uiutil.set_grid_row_visible(
-            self.widget("snapshot-new-screenshot"), bool(sn))
-        if sn:
-            self.widget("snapshot-new-screenshot").set_from_pixbuf(sn)
+        self._start_screenshot()
 
 
     def _snapshot_new_name_changed(self, src):
@@ -499,9 +597,7 @@ class vmmSnapshotPage(vmmGObjectUI):
         return mime, sndata
 
     def _do_create_snapshot(self, asyncjob, xml, name, mime, sndata):
-        ignore = asyncjob
-
-        self.vm.create_snapshot(xml)
+        self.vm.create_snapshot(xml, meter=asyncjob.get_meter())
 
         try:
             cachedir = self.vm.get_cache_dir()
@@ -512,6 +608,9 @@ class vmmSnapshotPage(vmmGObjectUI):
                 p = basesn + "." + ext
                 if os.path.exists(basesn + "." + ext):
                     os.unlink(p)
+            thumbpath = self._thumbnail_path(name)
+            if os.path.exists(thumbpath):
+                os.unlink(thumbpath)
 
             if not mime or not sndata:
                 return
@@ -18,17 +18,28 @@
 #
 
 import functools
+import hashlib
 import logging
 import os
 import queue
 import socket
 import signal
+import subprocess
 import threading
+import time
 import ipaddress
 
+from virtinst import util
+
 from .baseclass import vmmGObject
 
 
+# Seconds an ssh control master stays around after its last tunnel closed
+_CONTROL_PERSIST = 300
+# Seconds we trust a successful control master health check
+_CONTROL_CHECK_CACHE = 10
+
+
 class ConnectionInfo(object):
     """
     Holds all the bits needed to make a connection to a graphical console
@@ -153,6 +164,100 @@ class _TunnelScheduler(object):
 _tunnel_scheduler = _TunnelScheduler()
 
 
+def _get_control_dir():
+    # unix socket paths are length limited, so prefer the short
+    # XDG_RUNTIME_DIR if it's available
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        ret = os.path.join(os.environ["XDG_RUNTIME_DIR"], "virt-manager-ssh")
+    else:
+        ret = os.path.join(util.get_cache_dir(), "ssh")
+    if not os.path.exists(ret):
+        os.makedirs(ret, 0o700)
+    return ret
+
+
+class _SSHControlMaster(object):
+    """
+    Shared multiplexed ssh connection to a single remote host.
+
+    Tunnel ssh processes are started with ControlMaster=auto, so the first
+    one spawns a persistent master that every later tunnel to the host
+    reuses, saving a full ssh handshake per console channel. ssh shuts
+    the master down itself after _CONTROL_PERSIST idle seconds.
+    """
+    def __init__(self, host, port, user):
+        self._target = []
+        if port:
+            self._target += ["-p", str(port)]
+        if user:
+            self._target += ["-l", user]
+        self._target += [host]
+
+        key = "%s@%s:%s" % (user or "", host, port or "")
+        self.path = os.path.join(_get_control_dir(), "ssh-%s" %
+            hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+        self._lock = threading.Lock()
+        self._last_check = 0
+
+    def get_ssh_options(self):
+        return ["-o", "ControlMaster=auto",
+                "-o", "ControlPath=%s" % self.path,
+                "-o", "ControlPersist=%d" % _CONTROL_PERSIST]
+
+    def is_alive(self):
+        """
+        Health check the master. A stale control socket left behind by
+        a dead master is removed, so the next tunnel starts a new one.
+        If the check itself times out the socket is kept.
+        """
+        with self._lock:
+            if time.time() - self._last_check < _CONTROL_CHECK_CACHE:
+                return True
+            if not os.path.exists(self.path):
+                return False
+
+            argv = (["ssh", "-O", "check", "-o", "ControlPath=%s" % self.path]
+                    + self._target)
+            self._last_check = 0
+            try:
+                ret = subprocess.call(argv,
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL, timeout=5)
+            except Exception as e:
+                # A timeout only means the master is slow or the host is
+                # busy. Report it as not alive for now, but leave the
+                # socket alone, removing it would orphan a live master
+                logging.debug("ssh control master check failed: %s", e)
+                return False
+
+            if ret == 0:
+                self._last_check = time.time()
+                return True
+
+            logging.debug("ssh control master %s is gone (ret=%s), "
+                          "removing it", self.path, ret)
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            return False
+
+
+_control_masters = {}
+_control_masters_lock = threading.Lock()
+
+
+def _get_control_master(ginfo):
+    host, port = ginfo.get_tunnel_host()
+    key = (host, port, ginfo.connuser)
+    with _control_masters_lock:
+        if key not in _control_masters:
+            _control_masters[key] = _SSHControlMaster(
+                host, port, ginfo.connuser)
+        return _control_masters[key]
+
+
 class _Tunnel(object):
     def __init__(self):
         self._pid = None
@@ -217,7 +322,7 @@ class _Tunnel(object):
         self._pid = pid
 
 
-def _make_ssh_command(ginfo):
+def _make_ssh_command(ginfo, master):
     if not ginfo.need_tunnel():
         return None
 
@@ -225,6 +330,8 @@ def _make_ssh_command(ginfo):
 
     # Build SSH cmd
     argv = ["ssh", "ssh"]
+    if master:
+        argv += master.get_ssh_options()
     if port:
         argv += ["-p", str(port)]
 
@@ -270,7 +377,14 @@ def _make_ssh_command(ginfo):
 class SSHTunnels(object):
     def __init__(self, ginfo):
         self._tunnels = []
-        self._sshcommand = _make_ssh_command(ginfo)
+        self._master = None
+        try:
+            if ginfo.need_tunnel():
+                self._master = _get_control_master(ginfo)
+        except Exception:
+            logging.debug("Error setting up ssh control master",
+                          exc_info=True)
+        self._sshcommand = _make_ssh_command(ginfo, self._master)
         self._locked = False
 
     def open_new(self):
@@ -305,6 +419,10 @@ class SSHTunnels(object):
         return "\n".join(errstrings)
 
     def _lock(self):
+        # With a live control master there is no ssh authentication
+        # that needs serializing, the tunnel is just a new channel
+        if self._master and self._master.is_alive():
+            return
         _tunnel_scheduler.lock()
         self._locked = True
 
@@ -0,0 +1,351 @@
+#
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import csv
+import glob
+import gzip
+import logging
+import os
+import re
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+
+# Name used in the 'object' column for connection wide samples
+HOST_OBJECT = "__host__"
+
+# (field name, help text). Field names double as CSV column names and
+# prometheus metric suffixes
+_FIELDS = [
+    ("cpu_host_percent", "CPU usage as a percentage of total host CPU"),
+    ("cpu_guest_percent", "CPU usage as a percentage of the guest's vCPUs"),
+    ("memory_kib", "Memory usage in KiB"),
+    ("memory_percent", "Memory usage as a percentage of total memory"),
+    ("disk_read_kib_per_sec", "Disk read rate in KiB/s"),
+    ("disk_write_kib_per_sec", "Disk write rate in KiB/s"),
+    ("net_rx_kib_per_sec", "Network receive rate in KiB/s"),
+    ("net_tx_kib_per_sec", "Network transmit rate in KiB/s"),
+]
+CSV_HEADER = ["timestamp", "object"] + [f[0] for f in _FIELDS]
+
+# sun_path is 108 bytes on linux, including the trailing NUL
+_MAX_SOCKET_PATH = 107
+
+
+def sample_domain(vm):
+    """
+    Build a sample dict from the latest stats recorded by a vmmDomain
+    """
+    return {
+        "cpu_host_percent": vm.host_cpu_time_percentage(),
+        "cpu_guest_percent": vm.guest_cpu_time_percentage(),
+        "memory_kib": vm.stats_memory(),
+        "memory_percent": vm.stats_memory_percentage(),
+        "disk_read_kib_per_sec": vm.disk_read_rate(),
+        "disk_write_kib_per_sec": vm.disk_write_rate(),
+        "net_rx_kib_per_sec": vm.network_rx_rate(),
+        "net_tx_kib_per_sec": vm.network_tx_rate(),
+    }
+
+
+def sample_connection(conn):
+    """
+    Build a sample dict from the latest host wide vmmConnection stats
+    """
+    return {
+        "cpu_host_percent": conn.host_cpu_time_percentage(),
+        "cpu_guest_percent": conn.guest_cpu_time_percentage(),
+        "memory_kib": conn.stats_memory(),
+        "memory_percent": conn.stats_memory_percentage(),
+        "disk_read_kib_per_sec": conn.disk_read_rate(),
+        "disk_write_kib_per_sec": conn.disk_write_rate(),
+        "net_rx_kib_per_sec": conn.network_rx_rate(),
+        "net_tx_kib_per_sec": conn.network_tx_rate(),
+    }
+
+
+def _escape_label(val):
+    return (str(val).replace("\\", "\\\\").
+            replace("\"", "\\\"").replace("\n", "\\n"))
+
+
+def format_prometheus(uri, samples):
+    """
+    Format the passed {objname: (timestamp, sampledict)} mapping in the
+    prometheus text exposition format
+    """
+    lines = []
+    for fieldname, helptext in _FIELDS:
+        for prefix, is_host in [("virt_manager_host_", True),
+                                ("virt_manager_domain_", False)]:
+            metric = prefix + fieldname
+            entries = []
+            for objname, (timestamp, sample) in sorted(samples.items()):
+                if (objname == HOST_OBJECT) != is_host:
+                    continue
+                labels = "uri=\"%s\"" % _escape_label(uri)
+                if not is_host:
+                    labels += ",domain=\"%s\"" % _escape_label(objname)
+                entries.append("%s{%s} %s %d" % (metric, labels,
+                    float(sample[fieldname]), int(timestamp * 1000)))
+
+            if not entries:
+                continue
+            lines.append("# HELP %s %s" % (metric, helptext))
+            lines.append("# TYPE %s gauge" % metric)
+            lines.extend(entries)
+    return "\n".join(lines) + "\n"
+
+
+class _ExportHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        recorder = self.server.recorder
+        is_http = False
+        try:
+            # Clients that speak HTTP (curl --unix-socket, prometheus via
+            # a socket proxy) get a proper response, anything else just
+            # gets the raw text
+            self.request.settimeout(0.5)
+            is_http = self.request.recv(4096).startswith(b"GET ")
+        except socket.timeout:
+            pass
+
+        data = recorder.get_prometheus_text().encode("utf-8")
+        if is_http:
+            header = ("HTTP/1.0 200 OK\r\n"
+                      "Content-Type: text/plain; version=0.0.4\r\n"
+                      "Content-Length: %d\r\n\r\n" % len(data))
+            data = header.encode("ascii") + data
+        self.request.sendall(data)
+
+
+class _ExportServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class vmmStatsRecorder(object):
+    """
+    Record every stats sample taken for a connection to a gzip compressed
+    CSV file, one file per day, and optionally serve the latest samples
+    on a local unix socket in prometheus text format.
+
+    History files older than history_days are deleted whenever a new
+    day's file is started, 0 keeps them all.
+
+    record() is called from the tick thread, everything else is thread
+    safe.
+    """
+    def __init__(self, uri, outdir, record_history=True, socket_path=None,
+                 history_days=0):
+        self._uri = uri
+        self._outdir = outdir
+        self._record_history = record_history
+        self._history_days = history_days
+        self._socket_path = socket_path
+        self._socket_dir = None
+        self._socket_error = None
+
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._fileobj = None
+        self._filename = None
+        self._writer = None
+        self._server = None
+
+        if self._socket_path:
+            self._start_server()
+
+    def _get_short_socket_path(self):
+        # A deep cache dir can push the socket path past what AF_UNIX
+        # allows, fall back to the runtime dir. That is usually shared,
+        # so put the socket in a fresh private 0700 directory nobody
+        # else can race us for
+        basedir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+        self._socket_dir = tempfile.mkdtemp(prefix="virt-manager-stats-",
+                                            dir=basedir)
+        return os.path.join(self._socket_dir, "stats.sock")
+
+    def _start_server(self):
+        try:
+            if len(os.fsencode(self._socket_path)) > _MAX_SOCKET_PATH:
+                shortpath = self._get_short_socket_path()
+                logging.debug("Stats socket path %s is too long, using %s",
+                              self._socket_path, shortpath)
+                self._socket_path = shortpath
+
+            if os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+            # Create the socket 0600 from the start, rather than
+            # chmod'ing it after other users could already connect
+            oldmask = os.umask(0o177)
+            try:
+                self._server = _ExportServer(self._socket_path,
+                                             _ExportHandler)
+            finally:
+                os.umask(oldmask)
+            self._server.recorder = self
+        except Exception as e:
+            logging.warning("Error creating stats socket %s: %s",
+                            self._socket_path, e)
+            self._socket_error = str(e)
+            self._server = None
+            self._remove_socket_dir()
+            return
+
+        logging.debug("Serving stats for %s on %s",
+                      self._uri, self._socket_path)
+        t = threading.Thread(target=self._server.serve_forever,
+                             name="Stats export %s" % self._uri)
+        t.daemon = True
+        t.start()
+
+
+    ##############
+    # Public API #
+    ##############
+
+    def get_socket_path(self):
+        return self._server and self._socket_path or None
+
+    def get_socket_error(self):
+        """
+        Return the error string if the export socket couldn't be created
+        """
+        return self._socket_error
+
+    def get_history_path(self):
+        return self._filename
+
+    def record(self, timestamp, samples, active=None):
+        """
+        :param timestamp: sample time, as returned by time.time()
+        :param samples: dict of {objname: sampledict}, where objname
+            is a VM name or HOST_OBJECT
+        :param active: optional list of VM names that are still running.
+            If passed, exported samples for any other VM are dropped,
+            though their final samples are still written to history.
+            Active VMs that weren't sampled this time keep their
+            previous sample.
+        """
+        with self._lock:
+            for objname, sample in samples.items():
+                self._latest[objname] = (timestamp, sample)
+            if active is not None:
+                keep = set(active) | set([HOST_OBJECT])
+                for objname in list(self._latest):
+                    if objname not in keep:
+                        del self._latest[objname]
+
+        if not self._record_history:
+            return
+
+        try:
+            writer = self._get_writer(timestamp)
+            for objname, sample in sorted(samples.items()):
+                writer.writerow(["%.3f" % timestamp, objname] +
+                    ["%.2f" % sample[f[0]] for f in _FIELDS])
+            self._fileobj.flush()
+        except Exception:
+            logging.debug("Error recording stats for %s, disabling "
+                          "history", self._uri, exc_info=True)
+            self._record_history = False
+            self._close_file()
+
+    def forget(self, objname):
+        """
+        Drop the exported samples for an object that went away
+        """
+        with self._lock:
+            self._latest.pop(objname, None)
+
+    def get_prometheus_text(self):
+        with self._lock:
+            samples = self._latest.copy()
+        return format_prometheus(self._uri, samples)
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            try:
+                os.unlink(self._socket_path)
+            except Exception:
+                pass
+            self._server = None
+        self._remove_socket_dir()
+        self._close_file()
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _remove_socket_dir(self):
+        if not self._socket_dir:
+            return
+        try:
+            os.rmdir(self._socket_dir)
+        except Exception as e:
+            logging.debug("Error removing %s: %s", self._socket_dir, e)
+        self._socket_dir = None
+
+    def _close_file(self):
+        if self._fileobj:
+            self._fileobj.close()
+        self._fileobj = None
+        self._writer = None
+
+    def _get_writer(self, timestamp):
+        filename = os.path.join(self._outdir, "stats-%s.csv.gz" %
+            time.strftime("%Y%m%d", time.localtime(timestamp)))
+        if filename == self._filename and self._writer:
+            return self._writer
+
+        self._close_file()
+        self._prune_history(timestamp)
+        is_new = not os.path.exists(filename)
+        # gzip supports appending, each session just adds a new member
+        self._fileobj = gzip.open(filename, "at", newline="")
+        self._filename = filename
+        self._writer = csv.writer(self._fileobj)
+        if is_new:
+            self._writer.writerow(CSV_HEADER)
+        return self._writer
+
+    def _prune_history(self, timestamp):
+        if self._history_days <= 0:
+            return
+
+        # File names sort by date, so compare the date strings directly
+        cutoff = time.strftime("%Y%m%d",
+            time.localtime(timestamp - (self._history_days * 24 * 60 * 60)))
+        for path in glob.glob(os.path.join(self._outdir, "stats-*.csv.gz")):
+            match = re.match(r"^stats-(\d{8})\.csv\.gz$",
+                             os.path.basename(path))
+            if not match or match.group(1) > cutoff:
+                continue
+            try:
+                logging.debug("Removing old stats history %s", path)
+                os.unlink(path)
+            except Exception as e:
+                logging.debug("Error removing %s: %s", path, e)
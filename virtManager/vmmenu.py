@@ -18,10 +18,16 @@
 # MA 02110-1301 USA.
 #
 
+import collections
+import concurrent.futures
 import logging
+import traceback
 
 from gi.repository import Gtk
 
+from virtinst import ManagedSaveOrchestrator
+from virtinst import util
+
 from .asyncjob import vmmAsyncJob
 
 
@@ -30,6 +36,12 @@ from .asyncjob import vmmAsyncJob
 ####################################################################
 
 class _VMMenu(Gtk.Menu):
+    """
+    :param current_vm_cb: Returns the vmmDomain to act on, or a list of
+        them if the parent supports multiple selection. Actions with a
+        bulkcb are run against every VM in the list, other actions
+        are only available when a single VM is selected.
+    """
     def __init__(self, src, current_vm_cb, show_open=True):
         Gtk.Menu.__init__(self)
         self._parent = src
@@ -39,7 +51,7 @@ class _VMMenu(Gtk.Menu):
         self._init_state()
 
     def _add_action(self, label, widgetname, cb,
-                    iconname="system-shutdown"):
+                    iconname="system-shutdown", bulkcb=None):
         if label.startswith("gtk-"):
             item = Gtk.ImageMenuItem.new_from_stock(label, None)
         else:
@@ -57,6 +69,12 @@ class _VMMenu(Gtk.Menu):
         if cb:
             def _cb(_menuitem):
                 _vm = self._current_vm_cb()
+                if isinstance(_vm, list):
+                    if len(_vm) > 1:
+                        if bulkcb:
+                            return bulkcb(self._parent, _vm)
+                        return
+                    _vm = _vm and _vm[0] or None
                 if _vm:
                     return cb(self._parent, _vm)
             item.connect("activate", _cb)
@@ -75,23 +93,28 @@ class VMShutdownMenu(_VMMenu):
     Shutdown submenu for reboot, forceoff, reset, etc.
     """
     def _init_state(self):
-        self._add_action(_("_Reboot"), "reboot", VMActionUI.reboot)
-        self._add_action(_("_Shut Down"), "shutdown", VMActionUI.shutdown)
-        self._add_action(_("F_orce Reset"), "reset", VMActionUI.reset)
-        self._add_action(_("_Force Off"), "destroy", VMActionUI.destroy)
+        self._add_action(_("_Reboot"), "reboot", VMActionUI.reboot,
+                bulkcb=VMBulkActionUI.reboot)
+        self._add_action(_("_Shut Down"), "shutdown", VMActionUI.shutdown,
+                bulkcb=VMBulkActionUI.shutdown)
+        self._add_action(_("F_orce Reset"), "reset", VMActionUI.reset,
+                bulkcb=VMBulkActionUI.reset)
+        self._add_action(_("_Force Off"), "destroy", VMActionUI.destroy,
+                bulkcb=VMBulkActionUI.destroy)
         self.add(Gtk.SeparatorMenuItem())
         self._add_action(_("Sa_ve"), "save", VMActionUI.save,
-                iconname=Gtk.STOCK_SAVE)
+                iconname=Gtk.STOCK_SAVE, bulkcb=VMBulkActionUI.save)
 
         self.show_all()
 
     def update_widget_states(self, vm):
+        vms = util.listify(vm)
         statemap = {
-            "reboot": bool(vm and vm.is_stoppable()),
-            "shutdown": bool(vm and vm.is_stoppable()),
-            "reset": bool(vm and vm.is_stoppable()),
-            "destroy": bool(vm and vm.is_destroyable()),
-            "save": bool(vm and vm.is_destroyable()),
+            "reboot": any([v.is_stoppable() for v in vms]),
+            "shutdown": any([v.is_stoppable() for v in vms]),
+            "reset": any([v.is_stoppable() for v in vms]),
+            "destroy": any([v.is_destroyable() for v in vms]),
+            "save": any([v.is_destroyable() for v in vms]),
         }
 
         for child in self.get_children():
@@ -101,8 +124,8 @@ class VMShutdownMenu(_VMMenu):
 
             if name == "reset":
                 child.set_tooltip_text(None)
-                if vm and not vm.conn.check_support(
-                        vm.conn.SUPPORT_CONN_DOMAIN_RESET):
+                if any([not v.conn.check_support(
+                        v.conn.SUPPORT_CONN_DOMAIN_RESET) for v in vms]):
                     child.set_tooltip_text(_("Hypervisor does not support "
                         "domain reset."))
                     child.set_sensitive(False)
@@ -114,11 +137,11 @@ class VMActionMenu(_VMMenu):
     """
     def _init_state(self):
         self._add_action(_("_Run"), "run", VMActionUI.run,
-                iconname=Gtk.STOCK_MEDIA_PLAY)
+                iconname=Gtk.STOCK_MEDIA_PLAY, bulkcb=VMBulkActionUI.run)
         self._add_action(_("_Pause"), "suspend", VMActionUI.suspend,
-                Gtk.STOCK_MEDIA_PAUSE)
+                Gtk.STOCK_MEDIA_PAUSE, bulkcb=VMBulkActionUI.suspend)
         self._add_action(_("R_esume"), "resume", VMActionUI.resume,
-                Gtk.STOCK_MEDIA_PAUSE)
+                Gtk.STOCK_MEDIA_PAUSE, bulkcb=VMBulkActionUI.resume)
         s = self._add_action(_("_Shut Down"), "shutdown", None)
         s.set_submenu(VMShutdownMenu(self._parent, self._current_vm_cb))
 
@@ -126,9 +149,11 @@ class VMActionMenu(_VMMenu):
         self._add_action(_("Clone..."), "clone",
                 VMActionUI.clone, iconname=None)
         self._add_action(_("Migrate..."), "migrate",
-                VMActionUI.migrate, iconname=None)
+                VMActionUI.migrate, iconname=None,
+                bulkcb=VMBulkActionUI.migrate)
         self._add_action(_("_Delete"), "delete",
-                VMActionUI.delete, iconname=Gtk.STOCK_DELETE)
+                VMActionUI.delete, iconname=Gtk.STOCK_DELETE,
+                bulkcb=VMBulkActionUI.delete)
 
         if self._show_open:
             self.add(Gtk.SeparatorMenuItem())
@@ -138,17 +163,22 @@ class VMActionMenu(_VMMenu):
         self.show_all()
 
     def update_widget_states(self, vm):
+        vms = util.listify(vm)
+        single = len(vms) == 1
         statemap = {
-            "run": bool(vm and vm.is_runable()),
-            "shutdown": bool(vm and vm.is_stoppable()),
-            "suspend": bool(vm and vm.is_stoppable()),
-            "resume": bool(vm and vm.is_paused()),
-            "migrate": bool(vm and vm.is_stoppable()),
-            "clone": bool(vm and vm.is_clonable()),
+            "run": any([v.is_runable() for v in vms]),
+            "shutdown": any([v.is_stoppable() for v in vms]),
+            "suspend": any([v.is_stoppable() for v in vms]),
+            "resume": any([v.is_paused() for v in vms]),
+            # The migrate queue moves VMs off a single source connection
+            "migrate": (any([v.is_stoppable() for v in vms]) and
+                        len(set([v.conn for v in vms])) == 1),
+            "clone": single and vms[0].is_clonable(),
+            "show": single,
         }
         vismap = {
-            "suspend": bool(vm and not vm.is_paused()),
-            "resume": bool(vm and vm.is_paused()),
+            "suspend": any([not v.is_paused() for v in vms]),
+            "resume": any([v.is_paused() for v in vms]),
         }
 
         for child in self.get_children():
@@ -343,3 +373,326 @@ class VMActionUI(object):
     def show(src, vm):
         from .details import vmmDetails
         vmmDetails.get_instance(src, vm).show()
+
+
+###########################################
+# Lifecycle actions across a VM selection #
+###########################################
+
+# Maximum number of lifecycle calls that are run at the same time
+BULK_MAX_WORKERS = 8
+
+
+def _bulk_cancel(asyncjob):
+    logging.debug("Cancelling bulk VM action")
+    asyncjob.job_canceled = True
+
+
+def _bulk_worker(asyncjob, vms, cb, errorintro):
+    """
+    Run cb(vm) for every VM through a bounded thread pool. Every VM's
+    result is written to the job details as it comes in, and failures
+    are reported together as a single job error.
+    """
+    asyncjob.details_enable()
+    failed = []
+    finished = 0
+
+    def _run(vm):
+        if asyncjob.job_canceled:
+            return False
+        cb(vm)
+        return True
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(BULK_MAX_WORKERS, len(vms))) as executor:
+        futures = dict([(executor.submit(_run, vm), vm) for vm in vms])
+        for future in concurrent.futures.as_completed(futures):
+            vm = futures[future]
+            finished += 1
+            try:
+                if future.result():
+                    result = _("done")
+                else:
+                    result = _("skipped")
+            except Exception as e:
+                logging.debug("Bulk action failed for '%s'",
+                              vm.get_name(), exc_info=True)
+                failed.append((vm.get_name(), str(e),
+                               "".join(traceback.format_exc())))
+                result = _("failed: %s") % str(e)
+
+            asyncjob.details_update("%s: %s\n" % (vm.get_name(), result))
+            asyncjob.set_progress(float(finished) / len(vms),
+                _("%(finished)d of %(total)d") %
+                {"finished": finished, "total": len(vms)})
+
+    if not failed:
+        return
+
+    error = (_("%(intro)s for %(count)d of %(total)d virtual machines: "
+               "%(names)s") %
+             {"intro": errorintro, "count": len(failed), "total": len(vms),
+              "names": ", ".join([f[0] for f in failed])})
+    details = "\n".join(["%s: %s\n%s" % f for f in failed])
+    asyncjob.set_error(error, details)
+
+
+def _bulk_action(src, vms, cb, title, text, errorintro):
+    if not vms:
+        return
+
+    logging.debug("Bulk action '%s' for vms=%s",
+                  title, [vm.get_name() for vm in vms])
+
+    def finish_cb(error, details):
+        if error is not None:
+            src.err.show_err(error, details=details)
+
+    progWin = vmmAsyncJob(_bulk_worker, [vms, cb, errorintro],
+                finish_cb, [], title, text % len(vms), src.topwin,
+                cancel_cb=(_bulk_cancel,))
+    progWin.run()
+
+
+def _managedsave_action(src, vms, do_restore, title, text, errorintro):
+    """
+    Save or restore vms through a ManagedSaveOrchestrator per connection,
+    and show the bytes and wall time for the run when it finishes.
+    Parallelism and the memory budget come from the per connection
+    config, restore order from each VM's restore priority.
+    """
+    byconn = collections.OrderedDict()
+    for vm in vms:
+        byconn.setdefault(vm.conn, []).append(vm)
+    orchs = [(conn, connvms,
+              ManagedSaveOrchestrator(conn.get_backend(),
+                maxworkers=conn.get_managedsave_workers(),
+                max_inflight_bytes=conn.get_managedsave_inflight_bytes()))
+             for conn, connvms in byconn.items()]
+    phases = []
+    unstarted = []
+
+    def cb(asyncjob):
+        failed = []
+        for conn, connvms, orch in orchs:
+            if asyncjob.job_canceled:
+                unstarted.extend([vm.get_name() for vm in connvms])
+                continue
+            doms = [vm.get_backend() for vm in connvms]
+            if do_restore:
+                priorities = dict((vm.get_name(), vm.get_restore_priority())
+                                  for vm in connvms)
+                phase = orch.restore(doms, priorities=priorities,
+                                     meter=asyncjob.get_meter())
+            else:
+                phase = orch.save(doms, meter=asyncjob.get_meter())
+            phases.append(phase)
+            failed += phase.get_failed()
+            conn.schedule_priority_tick(pollvm=True)
+
+        if failed:
+            asyncjob.set_error(
+                (_("%(intro)s for %(count)d of %(total)d virtual "
+                   "machines: %(names)s") %
+                 {"intro": errorintro, "count": len(failed),
+                  "total": len(vms),
+                  "names": ", ".join([f[0] for f in failed])}),
+                "\n".join(["%s: %s" % f for f in failed]))
+
+    def cancel_cb(asyncjob):
+        logging.debug("Cancelling managed save job")
+        asyncjob.job_canceled = True
+        for ignore1, ignore2, orch in orchs:
+            orch.cancel()
+
+    def finish_cb(error, details):
+        if error is not None:
+            src.err.show_err(error, details=details)
+            return
+        if not phases:
+            return
+
+        msg = "\n".join([p.format_summary() for p in phases])
+        cancelled = unstarted[:]
+        for phase in phases:
+            cancelled += phase.cancelled + phase.skipped
+        if cancelled:
+            msg += "\n\n" + (_("Cancelled: %s") % ", ".join(cancelled))
+        src.err.show_info(title, msg)
+
+    logging.debug("%s vms=%s", title, [vm.get_name() for vm in vms])
+    progWin = vmmAsyncJob(cb, [], finish_cb, [], title, text,
+                src.topwin, cancel_cb=(cancel_cb,))
+    progWin.run()
+
+
+class VMBulkActionUI(object):
+    """
+    Counterpart to VMActionUI for acting on a list of selected VMs:
+    confirm once, then run the lifecycle calls in parallel and report
+    a single aggregated result.
+    """
+
+    @staticmethod
+    def run(src, vms):
+        _bulk_action(src, [vm for vm in vms if vm.is_runable()],
+            lambda vm: vm.startup(),
+            _("Starting Virtual Machines"),
+            _("Starting %d virtual machines"),
+            _("Error starting domain"))
+
+    @staticmethod
+    def shutdown(src, vms):
+        vms = [vm for vm in vms if vm.is_stoppable()]
+        if not vms or not src.err.chkbox_helper(
+                src.config.get_confirm_poweroff,
+                src.config.set_confirm_poweroff,
+                text1=_("Are you sure you want to poweroff %d virtual "
+                        "machines?") % len(vms)):
+            return
+
+        _bulk_action(src, vms, lambda vm: vm.shutdown(),
+            _("Shutting Down Virtual Machines"),
+            _("Shutting down %d virtual machines"),
+            _("Error shutting down domain"))
+
+    @staticmethod
+    def reboot(src, vms):
+        vms = [vm for vm in vms if vm.is_stoppable()]
+        if not vms or not src.err.chkbox_helper(
+                src.config.get_confirm_poweroff,
+                src.config.set_confirm_poweroff,
+                text1=_("Are you sure you want to reboot %d virtual "
+                        "machines?") % len(vms)):
+            return
+
+        _bulk_action(src, vms, lambda vm: vm.reboot(),
+            _("Rebooting Virtual Machines"),
+            _("Rebooting %d virtual machines"),
+            _("Error rebooting domain"))
+
+    @staticmethod
+    def reset(src, vms):
+        vms = [vm for vm in vms if vm.is_stoppable()]
+        if not vms or not src.err.chkbox_helper(
+                src.config.get_confirm_forcepoweroff,
+                src.config.set_confirm_forcepoweroff,
+                text1=_("Are you sure you want to force reset %d virtual "
+                        "machines?") % len(vms),
+                text2=_("This will immediately reset the VMs without "
+                        "shutting down the OS and may cause data loss.")):
+            return
+
+        _bulk_action(src, vms, lambda vm: vm.reset(),
+            _("Resetting Virtual Machines"),
+            _("Resetting %d virtual machines"),
+            _("Error resetting domain"))
+
+    @staticmethod
+    def destroy(src, vms):
+        vms = [vm for vm in vms if vm.is_destroyable()]
+        if not vms or not src.err.chkbox_helper(
+                src.config.get_confirm_forcepoweroff,
+                src.config.set_confirm_forcepoweroff,
+                text1=_("Are you sure you want to force poweroff %d virtual "
+                        "machines?") % len(vms),
+                text2=_("This will immediately poweroff the VMs without "
+                        "shutting down the OS and may cause data loss.")):
+            return
+
+        _bulk_action(src, vms, lambda vm: vm.destroy(),
+            _("Forcing Off Virtual Machines"),
+            _("Forcing off %d virtual machines"),
+            _("Error shutting down domain"))
+
+    @staticmethod
+    def suspend(src, vms):
+        vms = [vm for vm in vms if vm.is_stoppable() and not vm.is_paused()]
+        if not vms or not src.err.chkbox_helper(
+                src.config.get_confirm_pause,
+                src.config.set_confirm_pause,
+                text1=_("Are you sure you want to pause %d virtual "
+                        "machines?") % len(vms)):
+            return
+
+        _bulk_action(src, vms, lambda vm: vm.suspend(),
+            _("Pausing Virtual Machines"),
+            _("Pausing %d virtual machines"),
+            _("Error pausing domain"))
+
+    @staticmethod
+    def resume(src, vms):
+        _bulk_action(src, [vm for vm in vms if vm.is_paused()],
+            lambda vm: vm.resume(),
+            _("Resuming Virtual Machines"),
+            _("Resuming %d virtual machines"),
+            _("Error unpausing domain"))
+
+    @staticmethod
+    def save(src, vms):
+        vms = [vm for vm in vms if vm.is_destroyable()]
+        if not vms or not src.err.chkbox_helper(
+                src.config.get_confirm_poweroff,
+                src.config.set_confirm_poweroff,
+                text1=_("Are you sure you want to save %d virtual "
+                        "machines?") % len(vms)):
+            return
+
+        _managedsave_action(src, vms, False,
+            _("Saving Virtual Machines"),
+            _("Saving memory of %d virtual machines to disk") % len(vms),
+            _("Error saving domain"))
+
+    @staticmethod
+    def save_all(src, conn):
+        vms = [vm for vm in conn.list_vms() if
+               vm.is_destroyable() and vm.is_persistent()]
+        if not vms:
+            src.err.show_info(_("There are no running virtual machines "
+                                "to save."))
+            return
+        VMBulkActionUI.save(src, vms)
+
+    @staticmethod
+    def restore_all(src, conn):
+        vms = [vm for vm in conn.list_vms() if
+               vm.is_runable() and vm.has_managed_save()]
+        if not vms:
+            src.err.show_info(_("There are no saved virtual machines "
+                                "to restore."))
+            return
+
+        _managedsave_action(src, vms, True,
+            _("Restoring Virtual Machines"),
+            _("Restoring memory of %d virtual machines from disk") %
+            len(vms),
+            _("Error restoring domain"))
+
+    @staticmethod
+    def migrate(src, vms):
+        if len(set([vm.conn for vm in vms])) != 1:
+            src.err.show_err(_("Only virtual machines from a single "
+                               "connection can be migrated together."))
+            return
+        VMActionUI.migrate(src, [vm for vm in vms if vm.is_stoppable()])
+
+    @staticmethod
+    def delete(src, vms):
+        if not src.err.yes_no(
+                _("Are you sure you want to delete %d virtual machines?") %
+                len(vms),
+                _("Running VMs will be forced off. Storage is not removed, "
+                  "use Delete on a single VM to also remove its storage.")):
+            return
+
+        def _delete(vm):
+            if vm.is_active():
+                vm.destroy()
+            if vm.is_persistent():
+                vm.delete()
+
+        _bulk_action(src, vms, _delete,
+            _("Deleting Virtual Machines"),
+            _("Deleting %d virtual machines"),
+            _("Error deleting virtual machine"))
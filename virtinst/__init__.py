@@ -93,5 +93,7 @@ from virtinst.lxcinstaller import LXCInstaller
 from virtinst.guest import Guest
 from virtinst.cloner import Cloner
 from virtinst.snapshot import DomainSnapshot
+from virtinst.migration import MigrationTuning
+from virtinst.managedsave import ManagedSaveOrchestrator
 
 from virtinst.connection import VirtualConnection
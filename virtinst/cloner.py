@@ -25,6 +25,7 @@ import os
 
 import libvirt
 
+from . import progress
 from . import util
 from .guest import Guest
 from .deviceinterface import VirtualNetworkInterface
@@ -40,6 +41,9 @@ class Cloner(object):
     CLONE_POLICY_NO_SHAREABLE  = 2
     CLONE_POLICY_NO_EMPTYMEDIA = 3
 
+    # Maximum number of clones duplicated at once by start_batch_duplicate
+    BATCH_WORKERS = 4
+
     def __init__(self, conn):
         self.conn = conn
 
@@ -62,10 +66,12 @@ class Cloner(object):
 
         self._force_target = []
         self._skip_target = []
+        self._linked_target = []
         self._preserve = True
         self._clone_running = False
         self._replace = False
         self._reflink = False
+        self._linked = False
 
         # Default clone policy for back compat: don't clone readonly,
         # shareable, or empty disks
@@ -73,9 +79,6 @@ class Cloner(object):
                               self.CLONE_POLICY_NO_SHAREABLE,
                               self.CLONE_POLICY_NO_EMPTYMEDIA]
 
-        # Generate a random UUID at the start
-        self.clone_uuid = util.generate_uuid(conn)
-
 
     ##############
     # Properties #
@@ -114,10 +117,13 @@ class Cloner(object):
         self._clone_name = name
     clone_name = property(get_clone_name, set_clone_name)
 
-    # UUID to use for the new guest clone
+    # UUID to use for the new guest clone. A random one is generated
+    # the first time it's needed
     def set_clone_uuid(self, uuid):
         self._clone_uuid = uuid
     def get_clone_uuid(self):
+        if self._clone_uuid is None:
+            self._clone_uuid = util.generate_uuid(self.conn)
         return self._clone_uuid
     clone_uuid = property(get_clone_uuid, set_clone_uuid)
 
@@ -225,6 +231,17 @@ class Cloner(object):
         return self._skip_target
     skip_target = property(get_skip_target, set_skip_target)
 
+    # List of disk targets that are cloned as a qcow2 overlay backed by
+    # the original disk, rather than a full copy
+    def set_linked_target(self, dev):
+        if isinstance(dev, list):
+            self._linked_target = dev[:]
+        else:
+            self._linked_target.append(dev)
+    def get_linked_target(self):
+        return self._linked_target
+    linked_target = property(get_linked_target, set_linked_target)
+
     # List of policy rules for determining which vm disks to clone.
     # See CLONE_POLICY_*
     def set_clone_policy(self, policy_list):
@@ -258,6 +275,13 @@ class Cloner(object):
         self._reflink = reflink
     reflink = property(_get_reflink, _set_reflink)
 
+    # If true, every cloned disk is a linked clone, see linked_target
+    def _get_linked(self):
+        return self._linked
+    def _set_linked(self, val):
+        self._linked = bool(val)
+    linked = property(_get_linked, _set_linked)
+
 
     ######################
     # Functional methods #
@@ -291,8 +315,13 @@ class Cloner(object):
         logging.debug("Original sizes: %s",
                       [d.get_size() for d in self.original_disks])
 
-        # If domain has devices to clone, it must be 'off' or 'paused'
-        if (not self.clone_running and
+        # If domain has devices to clone, it must be 'off' or 'paused'.
+        # Linked clones are never allowed to back onto a running VM's
+        # disks, since the VM would keep writing to their backing store
+        clone_running = self.clone_running
+        if [d for d in self.original_disks if self._is_linked_clone(d)]:
+            clone_running = False
+        if (not clone_running and
             (self.original_dom and len(self.original_disks) != 0)):
             status = self.original_dom.info()[0]
 
@@ -301,6 +330,53 @@ class Cloner(object):
                 raise RuntimeError(_("Domain with devices to clone must be "
                                      "paused or shutoff."))
 
+    def _is_linked_clone(self, orig_disk):
+        return self.linked or orig_disk.target in self.linked_target
+
+    def _get_duplicate_size(self):
+        """
+        Bytes start_duplicate will copy. Linked clones only write
+        overlay metadata, so they don't count.
+        """
+        return sum(int(d.get_size() * 1024 * 1024 * 1024)
+                   for d in self.original_disks
+                   if not self._is_linked_clone(d))
+
+    def _setup_linked_clone_destination(self, orig_disk, clone_disk):
+        """
+        Set up clone_disk to be created as a qcow2 overlay whose backing
+        store is the original disk. The original image is only ever read
+        from, but it must not be modified while linked clones exist.
+        Nothing stops that from happening, so warn about it.
+        """
+        vol_install = clone_disk.get_vol_install()
+        if not orig_disk.path or not vol_install:
+            raise RuntimeError(
+                _("Linked clone '%s' must be a new volume in a "
+                  "storage pool.") % clone_disk.path)
+        if not vol_install.supports_property("format"):
+            raise RuntimeError(
+                _("Storage pool of linked clone '%s' doesn't support "
+                  "qcow2 images.") % clone_disk.path)
+        if self.reflink:
+            raise ValueError(_("Linked clones can't be combined "
+                               "with reflink."))
+
+        vol_install.format = "qcow2"
+        vol_install.capacity = int(orig_disk.get_size() * 1024 * 1024 * 1024)
+        vol_install.allocation = 0
+        vol_install.backing_store = orig_disk.path
+        # StorageVolume.install detects the format of managed backing
+        # stores, otherwise go with what the original VM was using
+        if not orig_disk.get_vol_object():
+            vol_install.backing_format = orig_disk.driver_type
+        clone_disk.set_vol_install(vol_install)
+
+        logging.warning(_("'%(path)s' is now the backing image of linked "
+            "clone '%(clone)s'. Running the original VM or otherwise "
+            "writing to it will corrupt the clone."),
+            {"path": orig_disk.path, "clone": self._clone_name})
+
     def _setup_disk_clone_destination(self, orig_disk, clone_disk):
         """
         Helper that validates the new path location
@@ -308,6 +384,11 @@ class Cloner(object):
         if self.preserve_dest_disks:
             return
 
+        if self._is_linked_clone(orig_disk):
+            self._setup_linked_clone_destination(orig_disk, clone_disk)
+            clone_disk.validate()
+            return
+
         if clone_disk.get_vol_object():
             # Special case: non remote cloning of a guest using
             # managed block devices: fall back to local cloning if
@@ -401,7 +482,7 @@ class Cloner(object):
         logging.debug("Clone paths: %s", [d.path for d in self.clone_disks])
 
         self._guest.name = self._clone_name
-        self._guest.uuid = self._clone_uuid
+        self._guest.uuid = self.clone_uuid
         self._clone_macs.reverse()
         for dev in self._guest.get_devices("graphics"):
             if dev.port and dev.port != -1:
@@ -423,9 +504,7 @@ class Cloner(object):
         for i, orig_disk in enumerate(self._original_disks):
             clone_disk = self._clone_disks[i]
 
-            for disk in self._guest.get_devices("disk"):
-                if disk.target == orig_disk.target:
-                    xmldisk = disk
+            xmldisk = self._guest.find_device_by_target(orig_disk.target)
 
             self._setup_disk_clone_destination(orig_disk, clone_disk)
 
@@ -434,6 +513,9 @@ class Cloner(object):
             xmldisk.type = clone_disk.type
             xmldisk.driver_name = orig_disk.driver_name
             xmldisk.driver_type = orig_disk.driver_type
+            if (not self.preserve_dest_disks and
+                self._is_linked_clone(orig_disk)):
+                xmldisk.driver_type = "qcow2"
             xmldisk.path = clone_disk.path
 
         # For guest agent channel, remove a path to generate a new one with
@@ -479,7 +561,128 @@ class Cloner(object):
 
         logging.debug("Duplicating finished.")
 
-    def generate_clone_disk_path(self, origpath, newname=None):
+    def generate_batch(self, count, name_template=None):
+        """
+        Set up count clones of the original guest in one pass. Must be
+        called after setup_original(), and returns a list of Cloner
+        instances that are ready for start_duplicate() or
+        start_batch_duplicate().
+
+        The original XML is parsed and its disks validated only once.
+        Names, UUIDs, MACs and disk paths are picked against a single
+        snapshot of the objects on the connection, plus everything
+        already handed out to earlier clones in the batch.
+
+        :param count: Number of clones to set up
+        :param name_template: printf style template with one integer
+            conversion, like 'web%02d', which is filled in with 1, 2,
+            3, ... skipping names already in use. Defaults to the
+            generate_clone_name() naming scheme
+        """
+        if self._guest is None:
+            raise RuntimeError(_("setup_original() must be called "
+                                 "before generating clones."))
+        if count < 1:
+            raise ValueError(_("Clone count must be at least 1."))
+        if self.preserve_dest_disks:
+            raise ValueError(_("Several clones can't share the same "
+                               "preserved disks."))
+        if self._clone_macs and count > 1:
+            raise ValueError(_("Several clones can't share the same "
+                               "MAC addresses."))
+
+        if name_template is None:
+            name_template = self._default_name_template()
+        try:
+            name_template % 1
+        except (TypeError, ValueError):
+            raise ValueError(_("Name template '%s' must contain exactly one "
+                               "integer format like %%d.") % name_template)
+
+        # The snapshot of objects we must not collide with
+        domains = self.conn.listAllDomains()
+        taken_names = set(d.name() for d in domains)
+        taken_uuids = set(d.UUIDString() for d in domains)
+        taken_macs = set()
+        for guest in self.conn.fetch_all_guests():
+            for nic in guest.get_devices("interface"):
+                if nic.macaddr:
+                    taken_macs.add(nic.macaddr.lower())
+        taken_paths = set()
+
+        nics = len(self._guest.get_devices("interface"))
+        ret = []
+        num = 0
+        while len(ret) < count:
+            num += 1
+            if num >= 100000:
+                raise ValueError(_("Name generation range exceeded."))
+            name = name_template % num
+            if name in taken_names and not self.replace:
+                continue
+            Guest.validate_name(self.conn, name, check_collision=False,
+                                validate=False)
+            taken_names.add(name)
+
+            clone = self._make_batch_clone()
+            clone._clone_name = name
+            clone.clone_uuid = self._generate_batch_uuid(taken_uuids)
+            clone._clone_macs = [self._generate_batch_mac(taken_macs)
+                                 for ignore in range(nics)]
+
+            paths = []
+            for orig_disk in self.original_disks:
+                path = None
+                if orig_disk.path:
+                    path = self.generate_clone_disk_path(
+                        orig_disk.path, newname=name,
+                        collidelist=list(taken_paths))
+                    taken_paths.add(path)
+                paths.append(path)
+            clone.clone_paths = paths
+            clone.setup_clone()
+            ret.append(clone)
+
+        logging.debug("Generated batch clones: %s",
+                      [c.clone_name for c in ret])
+        return ret
+
+    @staticmethod
+    def start_batch_duplicate(clones, meter=None, maxworkers=None):
+        """
+        Run start_duplicate() for every Cloner in clones, with at most
+        maxworkers clones copying disks at once. Progress of all the
+        clones is summed up on the passed meter.
+
+        A failed clone doesn't stop the others. Returns a list with the
+        exception raised for each clone, or None if it succeeded.
+        """
+        meter = util.ensure_meter(meter)
+        if maxworkers is None:
+            maxworkers = Cloner.BATCH_WORKERS
+
+        size = 0
+        for clone in clones:
+            if clone.preserve:
+                size += clone._get_duplicate_size()
+        batchmeter = progress.BatchMeter(meter,
+            _("Cloning %d guests") % len(clones), size)
+
+        def _duplicate(clone):
+            try:
+                clone.start_duplicate(batchmeter.make_child())
+            except Exception as e:
+                logging.debug("Batch clone of '%s' failed",
+                              clone.clone_name, exc_info=True)
+                return e
+            return None
+
+        ret = util.parallel_map(_duplicate, clones, maxworkers)
+        batchmeter.end()
+        return ret
+
+    def generate_clone_disk_path(self, origpath, newname=None,
+                                 collidelist=None):
         origname = self.original_guest
         newname = newname or self.clone_name
         path = origpath
@@ -507,9 +710,10 @@ class Cloner(object):
                     clonebase,
                     lambda p: VirtualDisk.path_definitely_exists(self.conn, p),
                     suffix,
-                    lib_collision=False)
+                    lib_collision=False,
+                    collidelist=collidelist)
 
-    def generate_clone_name(self):
+    def _split_clone_name(self):
         # If the orig name is "foo-clone", we don't want the clone to be
         # "foo-clone-clone", we want "foo-clone1"
         basename = self.original_guest
@@ -522,10 +726,17 @@ class Cloner(object):
                 start_num = int(str(num_match.group()))
             basename = basename.replace(match.group(), "")
 
-        basename = basename + "-clone"
+        return basename + "-clone", start_num
+
+    def generate_clone_name(self):
+        basename, start_num = self._split_clone_name()
         return util.generate_name(basename,
                                   self.conn.lookupByName,
-                                  sep="", start_num=start_num)
+                                  sep="", start_num=start_num,
+                                  listnames_cb=self._list_guest_names)
+
+    def _list_guest_names(self):
+        return [d.name() for d in self.conn.listAllDomains()]
 
 
 
@@ -533,6 +744,62 @@ class Cloner(object):
     # Private helper functions #
     ############################
 
+    def _default_name_template(self):
+        basename, ignore = self._split_clone_name()
+        return basename.replace("%", "%%") + "%d"
+
+    def _make_batch_clone(self):
+        """
+        Build a Cloner for one batch member, reusing our parsed original
+        guest and disk info instead of looking them up again
+        """
+        clone = Cloner(self.conn)
+        clone._original_guest = self._original_guest
+        clone._original_xml = self._original_xml
+        clone.original_dom = self.original_dom
+        clone._original_disks = self._original_disks
+        clone._guest = Guest(self.conn, parsexml=self._original_xml)
+        clone._guest.id = None
+        clone._guest.replace = self.replace
+
+        clone._clone_sparse = self._clone_sparse
+        clone._force_target = self._force_target[:]
+        clone._skip_target = self._skip_target[:]
+        clone._linked_target = self._linked_target[:]
+        clone._preserve = self._preserve
+        clone._clone_running = self._clone_running
+        clone._replace = self._replace
+        clone._reflink = self._reflink
+        clone._linked = self._linked
+        clone._clone_policy = self._clone_policy[:]
+        return clone
+
+    def _generate_batch_uuid(self, taken_uuids):
+        for i in range(256):
+            if self.conn.fake_conn_predictable():
+                # Testing hack, unique but stable across runs
+                uuid = "00000000-1111-2222-3333-%012d" % (
+                    len(taken_uuids) + i)
+            else:
+                uuid = util.randomUUID(self.conn)
+            if uuid not in taken_uuids:
+                taken_uuids.add(uuid)
+                return uuid
+        raise RuntimeError(_("Failed to generate non-conflicting UUID"))
+
+    def _generate_batch_mac(self, taken_macs):
+        for i in range(256):
+            if self.conn.fake_conn_predictable():
+                # Testing hack, unique but stable across runs
+                num = len(taken_macs) + i
+                mac = "00:11:22:33:%02x:%02x" % (num // 256, num % 256)
+            else:
+                mac = VirtualNetworkInterface.generate_mac(self.conn)
+            if mac and mac not in taken_macs:
+                taken_macs.add(mac)
+                return mac
+        raise RuntimeError(_("Failed to generate non-conflicting MAC"))
+
     # Parse disk paths that need to be cloned from the original guest's xml
     # Return a list of VirtualDisk instances pointing to the original
     # storage
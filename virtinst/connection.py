@@ -73,6 +73,9 @@ class VirtualConnection(object):
 
         self._support_cache = {}
         self._fetch_cache = {}
+        self._fetch_cache_stats = {"hits": 0, "misses": 0, "patches": 0}
+        self._fetch_cache_event_ids = []
+        self._fetch_vols_by_pool = None
 
         # These let virt-manager register a callback which provides its
         # own cached object lists, rather than doing fresh calls
@@ -120,10 +123,12 @@ class VirtualConnection(object):
     def close(self):
         ret = 0
         if self._libvirtconn:
+            self.disable_fetch_cache_events()
             ret = self._libvirtconn.close()
         self._libvirtconn = None
         self._uri = None
         self._fetch_cache = {}
+        self._fetch_vols_by_pool = None
         return ret
 
     def fake_conn_predictable(self):
@@ -169,11 +174,34 @@ class VirtualConnection(object):
     _FETCH_KEY_VOLS = "vols"
     _FETCH_KEY_NODEDEVS = "nodedevs"
 
+    # Max number of concurrent XMLDesc calls when priming the cache
+    FETCH_WORKERS = 8
+
+    def _cache_lookup(self, key, fetchfunc):
+        if key in self._fetch_cache:
+            self._fetch_cache_stats["hits"] += 1
+        else:
+            self._fetch_cache_stats["misses"] += 1
+            self._fetch_cache[key] = fetchfunc()
+        return self._fetch_cache[key][:]
+
+    def _fetch_xml_parallel(self, objs, build_cb, typename):
+        def _build(obj):
+            try:
+                return build_cb(obj)
+            except Exception as e:
+                logging.debug("Fetching %s XML failed: %s", typename, e)
+                return None
+        ret = util.parallel_map(_build, objs, self.FETCH_WORKERS)
+        return [xmlobj for xmlobj in ret if xmlobj is not None]
+
+    def _build_guest_raw(self, domobj):
+        return Guest(weakref.ref(self), parsexml=domobj.XMLDesc(0))
+
     def _fetch_all_guests_raw(self):
         ignore, ignore, ret = pollhelpers.fetch_vms(
             self, {}, lambda obj, ignore: obj)
-        return [Guest(weakref.ref(self), parsexml=obj.XMLDesc(0))
-                for obj in ret]
+        return self._fetch_xml_parallel(ret, self._build_guest_raw, "domain")
 
     def fetch_all_guests(self):
         """
@@ -181,11 +209,8 @@ class VirtualConnection(object):
         """
         if self.cb_fetch_all_guests:
             return self.cb_fetch_all_guests()  # pylint: disable=not-callable
-
-        key = self._FETCH_KEY_GUESTS
-        if key not in self._fetch_cache:
-            self._fetch_cache[key] = self._fetch_all_guests_raw()
-        return self._fetch_cache[key][:]
+        return self._cache_lookup(self._FETCH_KEY_GUESTS,
+                                  self._fetch_all_guests_raw)
 
     def _build_pool_raw(self, poolobj):
         return StoragePool(weakref.ref(self),
@@ -194,7 +219,7 @@ class VirtualConnection(object):
     def _fetch_all_pools_raw(self):
         ignore, ignore, ret = pollhelpers.fetch_pools(
             self, {}, lambda obj, ignore: obj)
-        return [self._build_pool_raw(poolobj) for poolobj in ret]
+        return self._fetch_xml_parallel(ret, self._build_pool_raw, "pool")
 
     def fetch_all_pools(self):
         """
@@ -202,11 +227,8 @@ class VirtualConnection(object):
         """
         if self.cb_fetch_all_pools:
             return self.cb_fetch_all_pools()  # pylint: disable=not-callable
-
-        key = self._FETCH_KEY_POOLS
-        if key not in self._fetch_cache:
-            self._fetch_cache[key] = self._fetch_all_pools_raw()
-        return self._fetch_cache[key][:]
+        return self._cache_lookup(self._FETCH_KEY_POOLS,
+                                  self._fetch_all_pools_raw)
 
     def _fetch_vols_raw(self, poolxmlobj):
         ret = []
@@ -217,18 +239,19 @@ class VirtualConnection(object):
         ignore, ignore, vols = pollhelpers.fetch_volumes(
             self, pool, {}, lambda obj, ignore: obj)
 
-        for vol in vols:
-            try:
-                xml = vol.XMLDesc(0)
-                ret.append(StorageVolume(weakref.ref(self), parsexml=xml))
-            except Exception as e:
-                logging.debug("Fetching volume XML failed: %s", e)
+        ret = self._fetch_xml_parallel(vols,
+            lambda vol: StorageVolume(weakref.ref(self),
+                                      parsexml=vol.XMLDesc(0)),
+            "volume")
         return ret
 
     def _fetch_all_vols_raw(self):
         ret = []
+        self._fetch_vols_by_pool = {}
         for poolxmlobj in self.fetch_all_pools():
-            ret.extend(self._fetch_vols_raw(poolxmlobj))
+            vols = self._fetch_vols_raw(poolxmlobj)
+            self._fetch_vols_by_pool[poolxmlobj.name] = vols
+            ret.extend(vols)
         return ret
 
     def fetch_all_vols(self):
@@ -237,11 +260,8 @@ class VirtualConnection(object):
         """
         if self.cb_fetch_all_vols:
             return self.cb_fetch_all_vols()  # pylint: disable=not-callable
-
-        key = self._FETCH_KEY_VOLS
-        if key not in self._fetch_cache:
-            self._fetch_cache[key] = self._fetch_all_vols_raw()
-        return self._fetch_cache[key][:]
+        return self._cache_lookup(self._FETCH_KEY_VOLS,
+                                  self._fetch_all_vols_raw)
 
     def _cache_new_pool_raw(self, poolobj):
         # Make sure cache is primed
@@ -257,7 +277,10 @@ class VirtualConnection(object):
         if self._FETCH_KEY_VOLS not in self._fetch_cache:
             return
         vollist = self._fetch_cache[self._FETCH_KEY_VOLS]
-        vollist.extend(self._fetch_vols_raw(poolxmlobj))
+        vols = self._fetch_vols_raw(poolxmlobj)
+        vollist.extend(vols)
+        if self._fetch_vols_by_pool is not None:
+            self._fetch_vols_by_pool[poolxmlobj.name] = vols
 
     def cache_new_pool(self, poolobj):
         """
@@ -268,11 +291,14 @@ class VirtualConnection(object):
             return self.cb_cache_new_pool(poolobj)
         return self._cache_new_pool_raw(poolobj)
 
+    def _build_nodedev_raw(self, devobj):
+        return NodeDevice.parse(weakref.ref(self), devobj.XMLDesc(0))
+
     def _fetch_all_nodedevs_raw(self):
         ignore, ignore, ret = pollhelpers.fetch_nodedevs(
             self, {}, lambda obj, ignore: obj)
-        return [NodeDevice.parse(weakref.ref(self), obj.XMLDesc(0))
-                for obj in ret]
+        return self._fetch_xml_parallel(ret, self._build_nodedev_raw,
+                                        "nodedev")
 
     def fetch_all_nodedevs(self):
         """
@@ -280,11 +306,185 @@ class VirtualConnection(object):
         """
         if self.cb_fetch_all_nodedevs:
             return self.cb_fetch_all_nodedevs()  # pylint: disable=not-callable
+        return self._cache_lookup(self._FETCH_KEY_NODEDEVS,
+                                  self._fetch_all_nodedevs_raw)
+
+    def fetch_cache_stats(self):
+        """
+        Return a dict of fetch cache counters: 'hits' and 'misses' count
+        fetch_all_* calls served from or missing the cache, 'patches'
+        counts single entries refreshed from libvirt events.
+        """
+        return self._fetch_cache_stats.copy()
+
+
+    #################################
+    # Event driven cache refreshing #
+    #################################
+
+    # This lets long running users of virtinst keep the fetch_all_* cache
+    # current without flushing it wholesale. It requires the caller to
+    # have registered and be running a libvirt event loop implementation,
+    # like libvirt.virEventRegisterDefaultImpl()
 
-        key = self._FETCH_KEY_NODEDEVS
+    def _patch_cache_entry(self, key, name, build_cb):
+        """
+        Replace the cached entry called 'name' under 'key' with the result
+        of build_cb(). If build_cb is None, the entry is just removed.
+        """
         if key not in self._fetch_cache:
-            self._fetch_cache[key] = self._fetch_all_nodedevs_raw()
-        return self._fetch_cache[key][:]
+            return None
+
+        newobj = None
+        if build_cb:
+            try:
+                newobj = build_cb()
+            except Exception as e:
+                logging.debug("Error refreshing cached %s=%s, dropping "
+                              "the whole cache: %s", key, name, e)
+                self._fetch_cache.pop(key, None)
+                return None
+
+        objlist = [o for o in self._fetch_cache[key] if o.name != name]
+        if newobj:
+            objlist.append(newobj)
+        self._fetch_cache[key] = objlist
+        self._fetch_cache_stats["patches"] += 1
+        return newobj
+
+    def _patch_cache_vols(self, poolname, poolxmlobj):
+        """
+        Refresh the cached volume list for the pool 'poolname'. If
+        poolxmlobj is None, the pool is gone and its volumes are dropped.
+        """
+        if self._FETCH_KEY_VOLS not in self._fetch_cache:
+            return
+        if self._fetch_vols_by_pool is None:
+            # Volume list was primed without a per pool mapping,
+            # so we can't patch it
+            self._fetch_cache.pop(self._FETCH_KEY_VOLS)
+            return
+
+        self._fetch_vols_by_pool.pop(poolname, None)
+        if poolxmlobj:
+            try:
+                self._fetch_vols_by_pool[poolname] = (
+                    self._fetch_vols_raw(poolxmlobj))
+            except Exception as e:
+                logging.debug("Error refreshing volumes for pool=%s: %s",
+                              poolname, e)
+                self._fetch_cache.pop(self._FETCH_KEY_VOLS)
+                return
+
+        vollist = []
+        for vols in self._fetch_vols_by_pool.values():
+            vollist.extend(vols)
+        self._fetch_cache[self._FETCH_KEY_VOLS] = vollist
+        self._fetch_cache_stats["patches"] += 1
+
+    def _domain_cache_event(self, conn, domain, event, detail, userdata):
+        ignore = conn
+        ignore = detail
+        ignore = userdata
+
+        build_cb = lambda: self._build_guest_raw(domain)
+        if event == getattr(libvirt, "VIR_DOMAIN_EVENT_UNDEFINED", 1):
+            build_cb = None
+        self._patch_cache_entry(self._FETCH_KEY_GUESTS,
+                                domain.name(), build_cb)
+
+    def _storage_pool_cache_event(self, conn, pool, event, detail, userdata):
+        ignore = conn
+        ignore = detail
+        ignore = userdata
+
+        build_cb = lambda: self._build_pool_raw(pool)
+        if event == getattr(libvirt, "VIR_STORAGE_POOL_EVENT_UNDEFINED", 1):
+            build_cb = None
+        name = pool.name()
+        poolxmlobj = self._patch_cache_entry(self._FETCH_KEY_POOLS,
+                                             name, build_cb)
+        self._patch_cache_vols(name, poolxmlobj)
+
+    def _storage_pool_refresh_cache_event(self, conn, pool, userdata):
+        ignore = conn
+        ignore = userdata
+
+        name = pool.name()
+        for poolxmlobj in self._fetch_cache.get(self._FETCH_KEY_POOLS, []):
+            if poolxmlobj.name == name:
+                self._patch_cache_vols(name, poolxmlobj)
+                return
+
+    def _node_device_cache_event(self, conn, dev, event, detail, userdata):
+        ignore = conn
+        ignore = detail
+        ignore = userdata
+
+        build_cb = lambda: self._build_nodedev_raw(dev)
+        if event == getattr(libvirt, "VIR_NODE_DEVICE_EVENT_DELETED", 1):
+            build_cb = None
+        self._patch_cache_entry(self._FETCH_KEY_NODEDEVS,
+                                dev.name(), build_cb)
+
+    def _node_device_update_cache_event(self, conn, dev, userdata):
+        self._node_device_cache_event(conn, dev, None, None, userdata)
+
+    def enable_fetch_cache_events(self):
+        """
+        Register libvirt event callbacks that keep the fetch_all_* cache
+        up to date, refreshing only the objects that changed.
+
+        :returns: True if at least one event type could be registered
+        """
+        if self._fetch_cache_event_ids:
+            return True
+
+        conn = self._libvirtconn
+
+        def _register(objtype, eventname, eventval, cb):
+            try:
+                eventid = getattr(libvirt, eventname, eventval)
+                regfunc = getattr(conn, "%sEventRegisterAny" % objtype)
+                deregfunc = getattr(conn, "%sEventDeregisterAny" % objtype)
+                self._fetch_cache_event_ids.append(
+                    (deregfunc, regfunc(None, eventid, cb, None)))
+            except Exception as e:
+                logging.debug("Error registering %s cache event: %s",
+                              eventname, e)
+
+        _register("domain", "VIR_DOMAIN_EVENT_ID_LIFECYCLE", 0,
+                  self._domain_cache_event)
+        for eventname, eventval in [
+                ("VIR_DOMAIN_EVENT_ID_BALLOON_CHANGE", 13),
+                ("VIR_DOMAIN_EVENT_ID_TRAY_CHANGE", 10),
+                ("VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED", 15),
+                ("VIR_DOMAIN_EVENT_ID_DEVICE_ADDED", 19)]:
+            _register("domain", eventname, eventval,
+                      lambda c, d, *args: self._domain_cache_event(
+                          c, d, None, None, None))
+
+        _register("storagePool", "VIR_STORAGE_POOL_EVENT_ID_LIFECYCLE", 0,
+                  self._storage_pool_cache_event)
+        _register("storagePool", "VIR_STORAGE_POOL_EVENT_ID_REFRESH", 1,
+                  self._storage_pool_refresh_cache_event)
+        _register("nodeDevice", "VIR_NODE_DEVICE_EVENT_ID_LIFECYCLE", 0,
+                  self._node_device_cache_event)
+        _register("nodeDevice", "VIR_NODE_DEVICE_EVENT_ID_UPDATE", 1,
+                  self._node_device_update_cache_event)
+
+        return bool(self._fetch_cache_event_ids)
+
+    def disable_fetch_cache_events(self):
+        """
+        Deregister any callbacks added by enable_fetch_cache_events
+        """
+        for deregfunc, cbid in self._fetch_cache_event_ids:
+            try:
+                deregfunc(cbid)
+            except Exception as e:
+                logging.debug("Error deregistering cache event: %s", e)
+        self._fetch_cache_event_ids = []
 
 
     #########################
@@ -858,6 +858,13 @@ class VirtualDisk(VirtualDevice):
         if path:
             self._set_xmlpath(path)
 
+    def will_create_storage(self):
+        """
+        If true, setup() will create new storage for this disk
+        """
+        return bool(self._storage_backend and
+                    self._storage_backend.will_create_storage())
+
     def wants_storage_creation(self):
         """
         If true, this disk needs storage creation parameters or things
@@ -900,7 +907,7 @@ class VirtualDisk(VirtualDevice):
         If storage doesn't exist (a non-existent file 'path', or 'vol_install'
         was specified), we create it.
         """
-        if not self._storage_backend.will_create_storage():
+        if not self.will_create_storage():
             return
 
         meter = util.ensure_meter(meter)
@@ -26,6 +26,7 @@ import libvirt
 
 from virtcli import CLIConfig
 
+from . import progress
 from . import util
 from . import support
 from .osdict import OSDB
@@ -106,6 +107,9 @@ class Guest(XMLBuilder):
         raise ValueError(_("Guest name '%s' is already in use.") % name)
 
 
+    # Maximum number of new disk images created at once by start_install
+    DISK_SETUP_WORKERS = 4
+
     _XML_ROOT_NAME = "domain"
     _XML_PROP_ORDER = ["type", "name", "uuid", "title", "description",
         "hotplugmemorymax", "hotplugmemoryslots", "maxmemory", "memory", "blkiotune",
@@ -136,6 +140,9 @@ class Guest(XMLBuilder):
         self._install_cdrom_device = None
         self._defaults_are_set = False
 
+        # (devtype, keyname) -> (children serial, {keyval: device})
+        self._device_lookup_cache = {}
+
         # The libvirt virDomain object we 'Create'
         self.domain = None
 
@@ -282,11 +289,28 @@ class Guest(XMLBuilder):
         :param devtype: Device type to search for (one of
                         VirtualDevice.virtual_device_types)
         """
-        newlist = []
-        for i in self._devices:
-            if devtype == "all" or i.virtual_device_type == devtype:
-                newlist.append(i)
-        return newlist
+        return list(self.get_devices_view(devtype))
+
+    def get_devices_view(self, devtype):
+        """
+        Like get_devices, but return an immutable tuple straight from
+        the guest's per device type index instead of building a new
+        list. Adding or removing devices replaces the index entry, so
+        the returned tuple never changes underneath the caller. For
+        devtype 'all' a new tuple is built every time.
+
+        :param devtype: Device type to search for (one of
+                        VirtualDevice.virtual_device_types)
+        """
+        if devtype == "all":
+            return tuple(self._devices)
+
+        # Only instantiates devices of the requested type if the
+        # device list hasn't been parsed yet
+        devclass = VirtualDevice.virtual_device_classes.get(devtype)
+        if not devclass:
+            return ()
+        return Guest._devices.get_view_for_class(self, devclass)
 
     _devices = XMLChildProperty(
         [VirtualDevice.virtual_device_classes[_n]
@@ -297,10 +321,56 @@ class Guest(XMLBuilder):
         """
         Return a list of all devices being installed with the guest
         """
-        retlist = []
-        for devtype in VirtualDevice.virtual_device_types:
-            retlist.extend(self.get_devices(devtype))
-        return retlist
+        # _devices is already ordered by VirtualDevice.virtual_device_types
+        return self.get_devices("all")
+
+    def _find_device(self, devtype, keyname, keyfunc, keyval):
+        """
+        Return the first device of devtype where keyfunc(dev) == keyval.
+        The key -> device mapping is cached until devices are added or
+        removed, and re-checked on every hit since device properties
+        can change at any time.
+        """
+        if keyval is None:
+            return None
+
+        cachekey = (devtype, keyname)
+        serial = self._children_serial
+        cacheserial, cache = self._device_lookup_cache.get(
+            cachekey, (None, {}))
+        dev = cache.get(keyval)
+        if (cacheserial == serial and dev is not None and
+            keyfunc(dev) == keyval):
+            return dev
+
+        cache = {}
+        for dev in self.get_devices_view(devtype):
+            cache.setdefault(keyfunc(dev), dev)
+        self._device_lookup_cache[cachekey] = (serial, cache)
+        return cache.get(keyval)
+
+    def find_device_by_alias(self, alias):
+        """
+        Return the device with the passed <alias name=.../>, or None
+        """
+        return self._find_device("all", "alias",
+            lambda dev: dev.alias.name, alias)
+
+    def find_device_by_target(self, target):
+        """
+        Return the disk with the passed target device name, or None
+        """
+        return self._find_device("disk", "target",
+            lambda dev: dev.target, target)
+
+    def find_device_by_mac(self, macaddr):
+        """
+        Return the interface with the passed MAC address, or None
+        """
+        if macaddr:
+            macaddr = macaddr.lower()
+        return self._find_device("interface", "macaddr",
+            lambda dev: dev.macaddr and dev.macaddr.lower(), macaddr)
 
 
     ############################
@@ -318,6 +388,67 @@ class Guest(XMLBuilder):
             self._install_cdrom_device.path = self.installer.cdrom_path()
             self._install_cdrom_device.validate()
 
+    def _setup_disks(self, disks, meter):
+        """
+        Create storage for the passed disks. The images are independent
+        of each other, so they are created in parallel with their
+        progress summed into one meter. If any creation fails, every
+        image created here is removed before the error is raised.
+        """
+        if len(disks) <= 1:
+            for disk in disks:
+                disk.setup(meter)
+            return
+
+        meter = util.ensure_meter(meter)
+        size = sum([int(d.get_size() * 1024 * 1024 * 1024) for d in disks])
+        batchmeter = progress.BatchMeter(meter,
+            _("Allocating %d disks") % len(disks), size)
+        errors = []
+
+        def _setup(disk):
+            if errors:
+                # Something already failed, don't start more work
+                return
+            try:
+                disk.setup(batchmeter.make_child())
+            except Exception as e:
+                logging.debug("Creating storage for disk=%s failed",
+                              disk.path, exc_info=True)
+                errors.append(e)
+
+        util.parallel_map(_setup, disks, self.DISK_SETUP_WORKERS)
+        if not errors:
+            batchmeter.end()
+            return
+
+        created = [d for d in disks if d.storage_was_created]
+        logging.debug("Disk creation failed, rolling back %d created "
+                      "disks", len(created))
+        for disk in created:
+            self._remove_created_disk(disk, meter)
+        raise errors[0]
+
+    def _remove_created_disk(self, disk, meter):
+        logging.debug("Removing created disk path=%s vol_object=%s",
+            disk.path, disk.get_vol_object())
+        name = os.path.basename(disk.path)
+
+        try:
+            meter.start(size=None, text=_("Removing disk '%s'") % name)
+
+            if disk.get_vol_object():
+                disk.get_vol_object().delete()
+            else:
+                os.unlink(disk.path)
+            disk.storage_was_created = False
+
+            meter.end(0)
+        except Exception as e:
+            logging.debug("Failed to remove disk '%s'",
+                name, exc_info=True)
+            logging.error("Failed to remove disk '%s': %s", name, e)
+
     def _prepare_get_install_xml(self):
         # We do a shallow copy of the OS block here, so that we can
         # set the install time properties but not permanently overwrite
@@ -477,8 +608,12 @@ class Guest(XMLBuilder):
         try:
             # Create devices if required (disk images, etc.)
             if not dry:
+                disks = [d for d in self.get_devices("disk") if
+                         d.will_create_storage()]
+                self._setup_disks(disks, meter)
                 for dev in self.get_all_devices():
-                    dev.setup(meter)
+                    if dev not in disks:
+                        dev.setup(meter)
 
             install_xml, final_xml = self._build_xml()
             if return_xml:
@@ -511,23 +646,7 @@ class Guest(XMLBuilder):
             return
 
         for disk in clean_disks:
-            logging.debug("Removing created disk path=%s vol_object=%s",
-                disk.path, disk.get_vol_object())
-            name = os.path.basename(disk.path)
-
-            try:
-                meter.start(size=None, text=_("Removing disk '%s'") % name)
-
-                if disk.get_vol_object():
-                    disk.get_vol_object().delete()
-                else:
-                    os.unlink(disk.path)
-
-                meter.end(0)
-            except Exception as e:
-                logging.debug("Failed to remove disk '%s'",
-                    name, exc_info=True)
-                logging.error("Failed to remove disk '%s': %s", name, e)
+            self._remove_created_disk(disk, meter)
 
 
     ###########################
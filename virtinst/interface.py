@@ -118,8 +118,11 @@ class Interface(XMLBuilder):
         if prefix="br", we find the first unused name such as "br0", "br1",
         etc.
         """
+        def listnames():
+            return conn.listInterfaces() + conn.listDefinedInterfaces()
+
         return util.generate_name(prefix, conn.interfaceLookupByName, sep="",
-                                  force_num=True)
+                                  force_num=True, listnames_cb=listnames)
 
     _XML_ROOT_NAME = "interface"
     _XML_PROP_ORDER = ["type", "name", "start_mode", "macaddr", "mtu",
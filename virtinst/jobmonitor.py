@@ -0,0 +1,302 @@
+#
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import logging
+import threading
+import time
+
+import libvirt
+
+from .progress import RateEstimator, format_number, format_time
+
+
+class JobStats(object):
+    """
+    One sample of a running domain job, from virDomainGetJobStats,
+    virDomainGetJobInfo or virDomainGetBlockJobInfo. Byte counts are
+    None when the hypervisor doesn't report them.
+    """
+    def __init__(self, stats, operation=None):
+        self.raw = stats
+        self.operation = stats.get("operation", operation)
+        self.timestamp = time.time()
+
+        self.time_elapsed = stats.get("time_elapsed")
+        self.time_remaining = stats.get("time_remaining")
+
+        self.data_total = stats.get("data_total")
+        self.data_processed = stats.get("data_processed")
+        self.data_remaining = stats.get("data_remaining")
+
+        self.memory_total = stats.get("memory_total")
+        self.memory_processed = stats.get("memory_processed")
+        self.memory_remaining = stats.get("memory_remaining")
+        self.memory_iteration = stats.get("memory_iteration")
+        self.memory_bps = stats.get("memory_bps")
+        self.memory_postcopy_requests = stats.get("memory_postcopy_requests")
+
+        # Reported in pages per second
+        self.memory_dirty_rate = None
+        if stats.get("memory_dirty_rate") is not None:
+            self.memory_dirty_rate = (stats["memory_dirty_rate"] *
+                                      stats.get("memory_page_size", 4096))
+
+        self.disk_total = stats.get("disk_total")
+        self.disk_processed = stats.get("disk_processed")
+        self.disk_remaining = stats.get("disk_remaining")
+
+        # While the job runs, this is libvirt's estimate of the final
+        # downtime in milliseconds
+        self.downtime = stats.get("downtime")
+        self.auto_converge_throttle = stats.get("auto_converge_throttle")
+
+        # Filled in by JobMonitor
+        self.throughput = None
+        self.eta = None
+        # Our own guess at the downtime in milliseconds, from the memory
+        # left and the current throughput, when libvirt gives none
+        self.estimated_downtime = None
+
+    def get_total(self):
+        if self.data_total:
+            return self.data_total
+        return self.disk_total
+
+    def get_processed(self):
+        if self.data_total:
+            if self.data_remaining is not None:
+                return self.data_total - self.data_remaining
+            return self.data_processed
+        return self.disk_processed
+
+    def is_converging(self):
+        """
+        False if the guest dirties memory faster than we transfer it,
+        None if we can't tell
+        """
+        if not self.memory_dirty_rate or not self.throughput:
+            return None
+        return self.memory_dirty_rate < self.throughput
+
+    def format_summary(self):
+        """
+        Short one line summary, suitable for a progress meter
+        """
+        parts = []
+        if self.memory_iteration:
+            parts.append(_("pass %d") % self.memory_iteration)
+        if self.memory_dirty_rate:
+            parts.append(_("dirty %sB/s") %
+                         format_number(self.memory_dirty_rate))
+        if self.eta is not None:
+            parts.append(_("ETA %s") % format_time(self.eta))
+        return ", ".join(parts)
+
+    def format_details(self):
+        """
+        Multi line description of every known number
+        """
+        lines = []
+        def _add(label, val):
+            if val is not None:
+                lines.append("%s: %s" % (label, val))
+        def _bytes(val):
+            if val is None:
+                return None
+            return "%sB" % format_number(val)
+
+        if self.throughput is not None:
+            _add(_("Throughput"), "%s/s" % _bytes(self.throughput))
+        if self.eta is not None:
+            _add(_("Time remaining"), format_time(self.eta, True))
+        if self.memory_total:
+            _add(_("Memory transferred"), "%s / %s" %
+                 (_bytes(self.memory_processed), _bytes(self.memory_total)))
+        _add(_("Memory pass"), self.memory_iteration)
+        if self.memory_dirty_rate is not None:
+            _add(_("Memory dirty rate"),
+                 "%s/s" % _bytes(self.memory_dirty_rate))
+        if self.downtime is not None:
+            _add(_("Expected downtime"), _("%d ms") % self.downtime)
+        elif self.estimated_downtime is not None:
+            _add(_("Estimated downtime"),
+                 _("~%d ms") % self.estimated_downtime)
+        if self.auto_converge_throttle is not None:
+            _add(_("Auto-converge throttle"),
+                 "%d%%" % self.auto_converge_throttle)
+        if self.disk_total:
+            _add(_("Disk transferred"), "%s / %s" %
+                 (_bytes(self.disk_processed), _bytes(self.disk_total)))
+        if self.is_converging() is False:
+            lines.append(_("Memory is dirtied faster than it is "
+                           "transferred, the job may not converge"))
+        return "\n".join(lines)
+
+
+class JobMonitor(object):
+    """
+    Poll the running job of a libvirt virDomain, smooth the throughput
+    and ETA with a RateEstimator, and report to a progress meter.
+
+    Works for anything reported by virDomainGetJobStats (migrate, save,
+    memory snapshots, core dumps), and for block jobs like block copy
+    when a disk target is passed. Falls back to virDomainGetJobInfo
+    when jobStats is not supported.
+
+    If the meter has a set_job_stats method, every JobStats sample is
+    passed to it as well.
+    """
+    POLL_INTERVAL = .5
+
+    def __init__(self, dom, meter=None, text=None, disk=None):
+        self._dom = dom
+        self._meter = meter
+        self._text = text
+        self._disk = disk
+
+        self._re = RateEstimator()
+        self._re_total = None
+        self._use_jobstats = True
+        self._latest = None
+        self._stop = False
+        self._meter_started = False
+
+    def get_latest(self):
+        return self._latest
+
+    def stop(self):
+        self._stop = True
+
+    def _fetch(self):
+        if self._disk:
+            info = self._dom.blockJobInfo(self._disk, 0)
+            if not info:
+                return None
+            # cur/end are arbitrary units, bytes in practice for qemu
+            return JobStats({"disk_total": info["end"],
+                             "disk_processed": info["cur"],
+                             "disk_remaining": info["end"] - info["cur"],
+                             "disk_bps": info.get("bandwidth")},
+                            operation="blockjob")
+
+        if self._use_jobstats:
+            try:
+                stats = self._dom.jobStats(0)
+                if stats.get("type", libvirt.VIR_DOMAIN_JOB_NONE) == \
+                        libvirt.VIR_DOMAIN_JOB_NONE:
+                    return None
+                return JobStats(stats)
+            except (AttributeError, libvirt.libvirtError) as e:
+                logging.debug("jobStats failed, falling back to "
+                              "jobInfo: %s", e)
+                self._use_jobstats = False
+
+        info = self._dom.jobInfo()
+        if info[0] == libvirt.VIR_DOMAIN_JOB_NONE:
+            return None
+        return JobStats({
+            "time_elapsed": info[1], "time_remaining": info[2],
+            "data_total": info[3], "data_processed": info[4],
+            "data_remaining": info[5],
+            "memory_total": info[6], "memory_processed": info[7],
+            "memory_remaining": info[8],
+            "disk_total": info[9], "disk_processed": info[10],
+            "disk_remaining": info[11]})
+
+    def poll(self):
+        """
+        Take one sample and report it. Returns the JobStats, or None if
+        no job is running
+        """
+        stats = self._fetch()
+        if not stats:
+            return None
+
+        total = stats.get_total()
+        processed = stats.get_processed()
+        # total is 0 if the job hasn't really started yet
+        if total:
+            if total != self._re_total:
+                # Totals grow when memory is dirtied or a disk keeps
+                # being written, restart the estimate around the new one
+                if self._re_total is None:
+                    self._re.start(total, stats.timestamp)
+                else:
+                    self._re.total = total
+                self._re_total = total
+            self._re.update(processed, stats.timestamp)
+
+            stats.throughput = self._re.average_rate()
+            if stats.throughput and stats.time_remaining:
+                stats.eta = stats.time_remaining / 1000.0
+            else:
+                stats.eta = self._re.remaining_time()
+            if stats.downtime is None and stats.memory_remaining and \
+                    stats.throughput:
+                stats.estimated_downtime = int(
+                    stats.memory_remaining * 1000 / stats.throughput)
+
+        self._latest = stats
+        self._report(stats)
+        return stats
+
+    def _report(self, stats):
+        meter = self._meter
+        if not meter:
+            return
+
+        if hasattr(meter, "set_job_stats"):
+            meter.set_job_stats(stats)
+
+        total = stats.get_total()
+        if not total:
+            return
+        if not self._meter_started:
+            meter.start(size=total, text=self._text)
+            self._meter_started = True
+        elif meter.size != total:
+            meter.size = total
+            meter.re.total = total
+        meter.update(stats.get_processed())
+
+    def run(self, thread=None):
+        """
+        Poll until stop() is called, or the passed thread exits
+        """
+        while not self._stop:
+            time.sleep(self.POLL_INTERVAL)
+            if thread and not thread.is_alive():
+                return
+            try:
+                self.poll()
+            except Exception:
+                logging.debug("Error polling domain job", exc_info=True)
+                return
+
+    def start(self):
+        """
+        Poll from a daemon thread until the calling thread exits, which
+        is usually the one making the blocking libvirt call
+        """
+        t = threading.Thread(target=self.run,
+                             args=(threading.current_thread(),),
+                             name="Job monitor %s" % self._dom.name())
+        t.daemon = True
+        t.start()
+        return t
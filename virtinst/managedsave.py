@@ -0,0 +1,309 @@
+#
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import collections
+import logging
+import threading
+import time
+
+import libvirt
+
+from . import util
+from .jobmonitor import JobMonitor
+from .progress import format_number, format_time
+
+
+class ManagedSavePhase(object):
+    """
+    Results of a ManagedSaveOrchestrator save or restore run
+    """
+    def __init__(self):
+        # domain name -> None on success, or the raised exception
+        self.results = collections.OrderedDict()
+        # Names of domains that weren't started because of cancel()
+        self.skipped = []
+        # Names of domains whose job was aborted by cancel(). These
+        # aren't in results, so they aren't reported as failures
+        self.cancelled = []
+        # Bytes written or read. This is the saved memory size reported
+        # by libvirt where available, guest memory size otherwise
+        self.bytes = 0
+        # Wall clock seconds for the whole run
+        self.elapsed = 0
+
+    def get_succeeded(self):
+        return [name for name, err in self.results.items() if not err]
+
+    def get_failed(self):
+        return [(name, err) for name, err in self.results.items() if err]
+
+    def format_summary(self):
+        rate = 0
+        if self.elapsed:
+            rate = self.bytes / self.elapsed
+        return (_("%(ok)d of %(total)d VMs, %(size)sB in %(time)s "
+                  "(%(rate)sB/s)") %
+                {"ok": len(self.get_succeeded()),
+                 "total": (len(self.results) + len(self.skipped) +
+                           len(self.cancelled)),
+                 "size": format_number(self.bytes),
+                 "time": format_time(self.elapsed, True),
+                 "rate": format_number(rate)})
+
+
+class ManagedSaveOrchestrator(object):
+    """
+    Managed save the running VMs of a connection, for example before
+    host maintenance, and restore them again afterwards.
+
+    VMs are saved in parallel, at most maxworkers at a time. If
+    max_inflight_bytes is set, it is a fixed budget: a VM is only
+    started while the summed memory size of the VMs already in progress
+    stays below it. It is not adjusted from the measured save
+    throughput, pick it to suit the save storage. Restores use the same
+    limits and are started in priority order.
+    """
+    DEFAULT_WORKERS = 4
+    POLL_INTERVAL = .5
+
+    def __init__(self, conn, maxworkers=DEFAULT_WORKERS,
+                 max_inflight_bytes=None):
+        self.conn = conn
+        self.maxworkers = max(1, int(maxworkers))
+        self.max_inflight_bytes = max_inflight_bytes
+
+        self._cancelled = False
+        self._monitors = {}
+        self._lock = threading.Lock()
+
+
+    ##############
+    # Public API #
+    ##############
+
+    def get_save_candidates(self):
+        """
+        Running persistent domains, which are the ones managed save
+        works for
+        """
+        doms = self.conn.listAllDomains(
+            libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE |
+            libvirt.VIR_CONNECT_LIST_DOMAINS_PERSISTENT)
+        return sorted(doms, key=lambda d: d.name())
+
+    def get_restore_candidates(self, priorities=None):
+        """
+        Inactive domains with a managed save image, in restore order
+        """
+        doms = self.conn.listAllDomains(
+            libvirt.VIR_CONNECT_LIST_DOMAINS_INACTIVE |
+            libvirt.VIR_CONNECT_LIST_DOMAINS_MANAGEDSAVE)
+        return self.sort_by_priority(doms, priorities)
+
+    @staticmethod
+    def sort_by_priority(doms, priorities=None):
+        """
+        Sort domains into restore order. Lower priority values go first,
+        the default is 0. Ties go to autostart domains, then by name.
+
+        :param priorities: dict of domain name -> priority
+        """
+        priorities = priorities or {}
+        def _key(dom):
+            try:
+                autostart = dom.autostart()
+            except libvirt.libvirtError:
+                autostart = False
+            return (priorities.get(dom.name(), 0), not autostart, dom.name())
+        return sorted(doms, key=_key)
+
+    def cancel(self):
+        """
+        Don't start any more domains, and abort the saves in progress.
+        This is permanent, a cancelled orchestrator won't start any
+        domains in later save or restore calls either.
+        """
+        self._cancelled = True
+        with self._lock:
+            doms = [m[0] for m in self._monitors.values()]
+        for dom in doms:
+            try:
+                dom.abortJob()
+            except Exception as e:
+                logging.debug("Error aborting save of %s: %s",
+                              dom.name(), e)
+
+    def save(self, doms=None, meter=None):
+        """
+        Managed save the passed libvirt virDomains, or every running one
+
+        :returns: ManagedSavePhase
+        """
+        if doms is None:
+            doms = self.get_save_candidates()
+        return self._run(doms, self._save_one, meter,
+                         _("Saving %d virtual machines") % len(doms))
+
+    def restore(self, doms=None, priorities=None, meter=None):
+        """
+        Start the passed libvirt virDomains, or every domain with a
+        managed save image, in priority order. See sort_by_priority
+
+        :returns: ManagedSavePhase
+        """
+        if doms is None:
+            doms = self.get_restore_candidates(priorities)
+        else:
+            doms = self.sort_by_priority(doms, priorities)
+        return self._run(doms, self._restore_one, meter,
+                         _("Restoring %d virtual machines") % len(doms))
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _get_size(self, dom):
+        try:
+            # Current memory in KiB, which bounds the saved image size
+            return dom.info()[2] * 1024
+        except libvirt.libvirtError as e:
+            logging.debug("Error getting memory of %s: %s", dom.name(), e)
+            return 0
+
+    def _save_one(self, dom, size):
+        monitor = JobMonitor(dom)
+        with self._lock:
+            self._monitors[dom.name()] = (dom, monitor)
+        t = threading.Thread(target=monitor.run,
+                             name="Save monitor %s" % dom.name())
+        t.daemon = True
+        t.start()
+
+        try:
+            logging.debug("Managed saving %s", dom.name())
+            dom.managedSave(0)
+        finally:
+            monitor.stop()
+            with self._lock:
+                self._monitors.pop(dom.name(), None)
+
+        stats = monitor.get_latest()
+        if stats and stats.get_total():
+            return stats.get_total()
+        return size
+
+    def _restore_one(self, dom, size):
+        logging.debug("Restoring %s from managed save", dom.name())
+        dom.create()
+        return size
+
+    def _get_inflight_progress(self):
+        processed = 0
+        with self._lock:
+            monitors = [m[1] for m in self._monitors.values()]
+        for monitor in monitors:
+            stats = monitor.get_latest()
+            if stats and stats.get_processed():
+                processed += stats.get_processed()
+        return processed
+
+    def _can_start(self, state, size):
+        if not state["running"]:
+            return True
+        if state["running"] >= self.maxworkers:
+            return False
+        if self.max_inflight_bytes is None:
+            return True
+        return state["inflight"] + size <= self.max_inflight_bytes
+
+    def _run(self, doms, cb, meter, text):
+        meter = util.ensure_meter(meter)
+        phase = ManagedSavePhase()
+
+        sizes = [self._get_size(dom) for dom in doms]
+        state = {"running": 0, "inflight": 0, "done": 0}
+        cond = threading.Condition()
+        results = {}
+
+        def _worker(dom, size):
+            err = None
+            try:
+                done = cb(dom, size)
+            except Exception as e:
+                logging.debug("Error processing %s", dom.name(),
+                              exc_info=True)
+                err = e
+                done = 0
+            with cond:
+                # Jobs aborted by cancel() aren't failures
+                if (self._cancelled and
+                    isinstance(err, libvirt.libvirtError) and
+                    err.get_error_code() ==
+                    libvirt.VIR_ERR_OPERATION_ABORTED):
+                    phase.cancelled.append(dom.name())
+                else:
+                    results[dom.name()] = err
+                phase.bytes += done
+                state["running"] -= 1
+                state["inflight"] -= size
+                state["done"] += size
+                cond.notify_all()
+
+        def _update_meter():
+            with cond:
+                done = state["done"]
+            meter.update(done + self._get_inflight_progress())
+
+        logging.debug("%s: maxworkers=%s max_inflight_bytes=%s",
+                      text, self.maxworkers, self.max_inflight_bytes)
+        meter.start(size=sum(sizes), text=text)
+        starttime = time.time()
+        threads = []
+
+        for dom, size in zip(doms, sizes):
+            with cond:
+                while not self._cancelled and not self._can_start(state,
+                                                                  size):
+                    cond.wait(self.POLL_INTERVAL)
+                    _update_meter()
+                if self._cancelled:
+                    phase.skipped.append(dom.name())
+                    continue
+                state["running"] += 1
+                state["inflight"] += size
+
+            t = threading.Thread(target=_worker, args=(dom, size),
+                                 name="Managed save %s" % dom.name())
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            while t.is_alive():
+                t.join(self.POLL_INTERVAL)
+                _update_meter()
+
+        phase.elapsed = time.time() - starttime
+        for dom in doms:
+            if dom.name() in results:
+                phase.results[dom.name()] = results[dom.name()]
+        meter.end(state["done"])
+        logging.debug("%s finished: %s", text, phase.format_summary())
+        return phase
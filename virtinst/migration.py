@@ -0,0 +1,254 @@
+#
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301 USA.
+#
+
+import logging
+import threading
+import time
+
+import libvirt
+
+
+def _get_constant(name):
+    if not hasattr(libvirt, name):
+        raise ValueError(_("This version of libvirt-python doesn't "
+                           "support %s") % name)
+    return getattr(libvirt, name)
+
+
+def set_max_downtime(dom, downtime):
+    """
+    Change the maximum tolerable downtime, in milliseconds, of the
+    migration running for the passed libvirt virDomain
+    """
+    logging.debug("Setting migrate max downtime of %s to %sms",
+                  dom.name(), downtime)
+    dom.migrateSetMaxDowntime(int(downtime), 0)
+
+
+def set_max_bandwidth(dom, bandwidth):
+    """
+    Change the bandwidth cap, in MiB/s, of the migration running for
+    the passed libvirt virDomain. 0 removes the cap
+    """
+    logging.debug("Setting migrate max bandwidth of %s to %sMiB/s",
+                  dom.name(), bandwidth)
+    dom.migrateSetMaxSpeed(int(bandwidth), 0)
+
+
+def start_postcopy(dom):
+    """
+    Switch the migration running for the passed libvirt virDomain to
+    post-copy mode. The migration must have been started with
+    MigrationTuning.postcopy enabled
+    """
+    logging.debug("Switching migration of %s to post-copy", dom.name())
+    dom.migrateStartPostCopy(0)
+
+
+class MigrationTuning(object):
+    """
+    Performance knobs for a live migration, for guests that would
+    otherwise never converge: compression, auto-converge, post-copy,
+    parallel connections, plus bandwidth and downtime limits.
+
+    Pass get_flags() and get_params() to migrate3/migrateToURI3, and
+    call start_live_tuning() right before it to apply the settings that
+    libvirt only accepts while the migration job is running.
+    """
+    COMPRESSION_XBZRLE = "xbzrle"
+    COMPRESSION_MT = "mt"
+    COMPRESSION_METHODS = [COMPRESSION_XBZRLE, COMPRESSION_MT]
+
+    LIVE_TUNING_INTERVAL = .5
+
+    @staticmethod
+    def from_string(optstr):
+        """
+        Build a MigrationTuning from a comma separated option string,
+        like: compression=xbzrle+mt,auto-converge=on,postcopy-after=30,
+        parallel=4,bandwidth=1000,downtime=300
+        """
+        def _bool(val):
+            if val.lower() in ["on", "yes", "true", "1"]:
+                return True
+            if val.lower() in ["off", "no", "false", "0"]:
+                return False
+            raise ValueError(_("Unknown boolean value '%s'") % val)
+
+        tuning = MigrationTuning()
+        for opt in [o for o in (optstr or "").split(",") if o]:
+            key, dummy, val = opt.partition("=")
+            key = key.strip().replace("_", "-")
+            val = val.strip()
+            try:
+                if key == "compression":
+                    tuning.compression = [m for m in val.split("+") if m]
+                elif key == "compression-threads":
+                    tuning.compression_threads = int(val)
+                elif key == "auto-converge":
+                    tuning.auto_converge = _bool(val)
+                elif key == "postcopy":
+                    tuning.postcopy = _bool(val)
+                elif key == "postcopy-after":
+                    tuning.postcopy = True
+                    tuning.postcopy_after = int(val)
+                elif key == "parallel":
+                    tuning.parallel_connections = int(val)
+                elif key == "bandwidth":
+                    tuning.bandwidth = int(val)
+                elif key == "downtime":
+                    tuning.downtime = int(val)
+                else:
+                    raise ValueError(_("Unknown migration option '%s'") %
+                                     key)
+            except ValueError as e:
+                raise ValueError(_("Error parsing migration option '%s': "
+                                   "%s") % (opt, e))
+        tuning.validate()
+        return tuning
+
+    def __init__(self):
+        # List of COMPRESSION_* methods
+        self.compression = []
+        # Number of compression threads for COMPRESSION_MT
+        self.compression_threads = None
+        # Throttle guest vCPUs until the migration converges
+        self.auto_converge = False
+        # Allow switching to post-copy mode
+        self.postcopy = False
+        # Switch to post-copy after this many seconds of pre-copy
+        self.postcopy_after = None
+        # Number of parallel migration connections
+        self.parallel_connections = None
+        # Bandwidth cap in MiB/s
+        self.bandwidth = None
+        # Maximum tolerable downtime in milliseconds
+        self.downtime = None
+
+    def validate(self):
+        for method in self.compression:
+            if method not in self.COMPRESSION_METHODS:
+                raise ValueError(_("Unknown compression method '%s'") %
+                                 method)
+        if (self.compression_threads and
+            self.COMPRESSION_MT not in self.compression):
+            raise ValueError(_("Compression threads require the "
+                               "'%s' compression method") %
+                             self.COMPRESSION_MT)
+        if self.postcopy_after is not None and not self.postcopy:
+            raise ValueError(_("Post-copy switchover requires post-copy "
+                               "to be enabled"))
+        for name in ["compression_threads", "postcopy_after",
+                     "parallel_connections", "bandwidth", "downtime"]:
+            val = getattr(self, name)
+            if val is not None and val < 0:
+                raise ValueError(_("%s can not be negative") % name)
+
+    def is_default(self):
+        return not (self.compression or self.auto_converge or
+                    self.postcopy or self.parallel_connections or
+                    self.bandwidth or self.downtime)
+
+    def get_flags(self):
+        flags = 0
+        if self.compression:
+            flags |= _get_constant("VIR_MIGRATE_COMPRESSED")
+        if self.auto_converge:
+            flags |= _get_constant("VIR_MIGRATE_AUTO_CONVERGE")
+        if self.postcopy:
+            flags |= _get_constant("VIR_MIGRATE_POSTCOPY")
+        if self.parallel_connections:
+            flags |= _get_constant("VIR_MIGRATE_PARALLEL")
+        return flags
+
+    def get_params(self):
+        params = {}
+        if self.compression:
+            # Passing the same typed parameter several times selects
+            # several methods, the python bindings take a list for that
+            key = _get_constant("VIR_MIGRATE_PARAM_COMPRESSION")
+            params[key] = (len(self.compression) == 1 and
+                           self.compression[0] or self.compression[:])
+        if self.compression_threads:
+            key = _get_constant("VIR_MIGRATE_PARAM_COMPRESSION_MT_THREADS")
+            params[key] = int(self.compression_threads)
+        if self.parallel_connections:
+            key = _get_constant("VIR_MIGRATE_PARAM_PARALLEL_CONNECTIONS")
+            params[key] = int(self.parallel_connections)
+        if self.bandwidth:
+            params[libvirt.VIR_MIGRATE_PARAM_BANDWIDTH] = int(self.bandwidth)
+        return params
+
+    def start_live_tuning(self, dom):
+        """
+        Start a thread that waits for the migration job of the passed
+        libvirt virDomain to show up, applies the max downtime, and
+        triggers the post-copy switchover once postcopy_after expires.
+        Call this right before starting the blocking migrate call.
+
+        Returns the thread, or None if there is nothing to do.
+        """
+        if not self.downtime and self.postcopy_after is None:
+            return None
+
+        t = threading.Thread(target=self._live_tuning_thread,
+                             args=(dom,),
+                             name="Migration tuning %s" % dom.name())
+        t.daemon = True
+        t.start()
+        return t
+
+    def _live_tuning_thread(self, dom):
+        # Give up if the job never shows up, like when migrate3
+        # errors out immediately
+        deadline = time.time() + 30
+        started = None
+        downtime_set = False
+
+        while True:
+            time.sleep(self.LIVE_TUNING_INTERVAL)
+            try:
+                jobtype = dom.jobInfo()[0]
+            except libvirt.libvirtError as e:
+                logging.debug("Stopping migration tuning: %s", e)
+                return
+
+            if jobtype == libvirt.VIR_DOMAIN_JOB_NONE:
+                if started or time.time() > deadline:
+                    return
+                continue
+            if started is None:
+                started = time.time()
+
+            try:
+                if self.downtime and not downtime_set:
+                    set_max_downtime(dom, self.downtime)
+                    downtime_set = True
+
+                if (self.postcopy_after is not None and
+                    time.time() - started >= self.postcopy_after):
+                    start_postcopy(dom)
+                    return
+            except libvirt.libvirtError:
+                logging.debug("Error tuning running migration",
+                              exc_info=True)
+                return
+
+            if downtime_set and self.postcopy_after is None:
+                return
@@ -30,6 +30,7 @@ import math
 import fcntl
 import struct
 import termios
+import threading
 
 # Code from http://mail.python.org/pipermail/python-list/2000-May/033365.html
 def terminal_width(fd=1):
@@ -112,6 +113,7 @@ class BaseMeter:
         self.last_amount_read = 0
         self.last_update_time = None
         self.re = RateEstimator()
+        self.job_stats = None
 
     def start(self, filename=None, url=None, basename=None,
               size=None, now=None, text=None):
@@ -158,6 +160,14 @@ class BaseMeter:
     def _do_end(self, amount_read, now=None):
         pass
 
+    def set_job_stats(self, stats):
+        # Latest virtinst.jobmonitor.JobStats for the job we are tracking
+        self.job_stats = stats
+        self._do_job_stats(stats)
+
+    def _do_job_stats(self, stats):
+        pass
+
 #  This is kind of a hack, but progress is gotten from grabber which doesn't
 # know about the total size to download. So we do this so we can get the data
 # out of band here. This will be "fixed" one way or anther soon.
@@ -244,6 +254,9 @@ class TextMeter(BaseMeter):
             text = self.text
         else:
             text = self.basename
+        summary = self.job_stats and self.job_stats.format_summary()
+        if summary:
+            text = "%s (%s)" % (text, summary)
 
         ave_dl = format_number(self.re.average_rate())
         sofar_size = None
@@ -322,6 +335,75 @@ class TextMeter(BaseMeter):
 
 text_progress_meter = TextMeter
 
+class BatchMeter(object):
+    """
+    Fold the progress of several concurrent jobs, like disk copies or
+    volume creations, into a single meter. Each job reports through its
+    own child meter, from its own thread, and the parent meter sees the
+    summed byte counts.
+    """
+    class _Child(object):
+        def __init__(self, parent):
+            self._parent = parent
+            self._size = 0
+            self._amount = 0
+
+        def start(self, size=None, **kwargs):
+            ignore = kwargs
+            with self._parent.lock:
+                self._size = size or 0
+                self._amount = 0
+
+        def _set_amount(self, amount_read):
+            if self._size:
+                amount_read = min(amount_read, self._size)
+            self._amount = amount_read
+
+        def update(self, amount_read, now=None):
+            ignore = now
+            with self._parent.lock:
+                self._set_amount(amount_read)
+                self._parent.report()
+
+        def end(self, amount_read, now=None):
+            ignore = now
+            # Not every copy path calls start(), so fold each finished
+            # job into the parent total here
+            with self._parent.lock:
+                self._set_amount(amount_read)
+                self._parent.done += self._amount
+                self._size = 0
+                self._amount = 0
+                self._parent.report()
+
+        def amount(self):
+            return self._amount
+
+    def __init__(self, meter, text, size):
+        self.lock = threading.Lock()
+        self.done = 0
+        self._meter = meter
+        self._size = size
+        self._children = []
+        self._meter.start(size=self._size, text=text)
+
+    def make_child(self):
+        child = self._Child(self)
+        with self.lock:
+            self._children.append(child)
+        return child
+
+    def report(self):
+        amount = self.done + sum(c.amount() for c in self._children)
+        if self._size:
+            amount = min(amount, self._size)
+        self._meter.update(amount)
+
+    def end(self):
+        with self.lock:
+            self._meter.end(self._size or 0)
+
+
 ######################################################################
 # support classes and functions
 
@@ -34,7 +34,8 @@ class DomainSnapshot(XMLBuilder):
     def find_free_name(vm, collidelist):
         return util.generate_name("snapshot", vm.snapshotLookupByName,
                                   sep="", start_num=1, force_num=True,
-                                  collidelist=collidelist)
+                                  collidelist=collidelist,
+                                  listnames_cb=vm.snapshotListNames)
 
     @staticmethod
     def state_str_to_int(state):
@@ -20,6 +20,7 @@
 import os
 import logging
 import threading
+import time
 
 import libvirt
 
@@ -299,6 +300,8 @@ class StoragePool(_StorageObject):
             return False
 
         kwargs["lib_collision"] = False
+        kwargs["listnames_cb"] = lambda: [
+            p.name for p in conn.fetch_all_pools()]
         return util.generate_name(basename, cb, **kwargs)
 
 
@@ -550,6 +553,141 @@ class StoragePool(_StorageObject):
 
 
 
+class _AllocationWatch(object):
+    def __init__(self, poller, name, meter):
+        self.poller = poller
+        self.name = name
+        self.meter = meter
+        self.vol = None
+        self.stopped = False
+        self.interval = poller.MIN_INTERVAL
+        self.next_poll = time.time() + self.interval
+
+    def stop(self):
+        self.poller.unwatch(self)
+
+
+class _AllocationPoller(object):
+    """
+    Report allocation progress for the volumes being created in a pool.
+    Every StorageVolume.install running against the same pool shares
+    one poller thread.
+
+    For file based pools on a local connection, the allocation is read
+    with a stat() of the volume path, which costs no RPC. Otherwise each
+    volume is looked up and polled with vol.info(), with its interval
+    doubling from MIN_INTERVAL up to MAX_INTERVAL.
+    """
+    MIN_INTERVAL = .2
+    MAX_INTERVAL = 10
+    LOCAL_INTERVAL = 1
+
+    _pollers = {}
+    _pollers_lock = threading.Lock()
+
+    @classmethod
+    def watch(cls, conn, pool, pool_xml, name, meter):
+        """
+        Start reporting the allocation of volume 'name' to meter.
+        Call stop() on the returned object when the install finishes
+        """
+        key = (conn.uri, pool.name())
+        with cls._pollers_lock:
+            poller = cls._pollers.get(key)
+            if not poller:
+                poller = cls(key, conn, pool, pool_xml)
+                cls._pollers[key] = poller
+            return poller._add(name, meter)  # pylint: disable=protected-access
+
+    def __init__(self, key, conn, pool, pool_xml):
+        self._key = key
+        self._pool = pool
+        self._cond = threading.Condition()
+        self._watches = []
+        self._thread = None
+
+        self._local_dir = None
+        if (not conn.is_remote() and
+            not conn.is_really_test() and
+            pool_xml.type in [StoragePool.TYPE_DIR,
+                              StoragePool.TYPE_FS,
+                              StoragePool.TYPE_NETFS] and
+            pool_xml.target_path and
+            os.path.isdir(pool_xml.target_path)):
+            self._local_dir = pool_xml.target_path
+
+    def _add(self, name, meter):
+        watch = _AllocationWatch(self, name, meter)
+        with self._cond:
+            self._watches.append(watch)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run,
+                    name="Checking storage allocation %s" % self._key[1])
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify_all()
+        return watch
+
+    def unwatch(self, watch):
+        with self._cond:
+            watch.stopped = True
+            self._cond.notify_all()
+
+    def _poll(self, watch):
+        alloc = None
+        if self._local_dir:
+            path = os.path.join(self._local_dir, watch.name)
+            try:
+                alloc = os.stat(path).st_blocks * 512
+            except OSError as e:
+                if os.path.exists(path):
+                    logging.debug("Can't stat %s, falling back to "
+                                  "polling libvirt: %s", path, e)
+                    self._local_dir = None
+            watch.next_poll = time.time() + self.LOCAL_INTERVAL
+            if alloc is not None or self._local_dir:
+                # A missing file just means createXML hasn't made it
+                # yet, keep to the local schedule without any RPC
+                return alloc
+
+        try:
+            if not watch.vol:
+                watch.vol = self._pool.storageVolLookupByName(watch.name)
+            alloc = watch.vol.info()[2]
+        except Exception:
+            # The volume doesn't exist until createXML gets going
+            pass
+        watch.interval = min(watch.interval * 2, self.MAX_INTERVAL)
+        watch.next_poll = time.time() + watch.interval
+        return alloc
+
+    def _run(self):
+        while True:
+            with self._pollers_lock:
+                with self._cond:
+                    self._watches = [w for w in self._watches
+                                     if not w.stopped]
+                    if not self._watches:
+                        self._pollers.pop(self._key, None)
+                        self._thread = None
+                        return
+
+            with self._cond:
+                now = time.time()
+                due = [w for w in self._watches if w.next_poll <= now]
+                if not due:
+                    self._cond.wait(min([w.next_poll for w in
+                                         self._watches]) - now)
+                    continue
+
+            for watch in due:
+                alloc = self._poll(watch)
+                with self._cond:
+                    # Never report after stop() returned
+                    if alloc is not None and not watch.stopped:
+                        watch.meter.update(alloc)
+
+
 class StorageVolume(_StorageObject):
     """
     Base class for building and installing libvirt storage volume xml
@@ -574,6 +712,7 @@ class StorageVolume(_StorageObject):
         pool_object.refresh(0)
         return util.generate_name(basename,
                                   pool_object.storageVolLookupByName,
+                                  listnames_cb=pool_object.listVolumes,
                                   **kwargs)
 
     TYPE_FILE = getattr(libvirt, "VIR_STORAGE_VOL_FILE", 0)
@@ -591,8 +730,6 @@ class StorageVolume(_StorageObject):
         self._pool_xml = None
         self._reflink = False
 
-        self._install_finished = threading.Event()
-
 
     ######################
     # Non XML properties #
@@ -789,11 +926,7 @@ class StorageVolume(_StorageObject):
         logging.debug("Creating storage volume '%s' with xml:\n%s",
                       self.name, xml)
 
-        t = threading.Thread(target=self._progress_thread,
-                             name="Checking storage allocation",
-                             args=(meter,))
-        t.setDaemon(True)
-
+        report_progress = bool(meter)
         meter = util.ensure_meter(meter)
 
         cloneflags = 0
@@ -809,11 +942,19 @@ class StorageVolume(_StorageObject):
             cloneflags |= getattr(libvirt,
                 "VIR_STORAGE_VOL_CREATE_REFLINK", 1)
 
+        # An overlay only allocates what was asked for up front, often
+        # just its metadata, the rest is read from the backing store
+        size = self.capacity
+        if self.backing_store:
+            size = self.allocation or 0
+
+        watch = None
         try:
-            self._install_finished.clear()
-            t.start()
-            meter.start(size=self.capacity,
+            meter.start(size=size,
                         text=_("Allocating '%s'") % self.name)
+            if report_progress:
+                watch = _AllocationPoller.watch(self.conn, self.pool,
+                    self._pool_xml, self.name, meter)
 
             if self.input_vol:
                 vol = self.pool.createXMLFrom(xml, self.input_vol, cloneflags)
@@ -821,9 +962,10 @@ class StorageVolume(_StorageObject):
                 logging.debug("Using vol create flags=%s", createflags)
                 vol = self.pool.createXML(xml, createflags)
 
-            self._install_finished.set()
-            t.join()
-            meter.end(self.capacity)
+            if watch:
+                watch.stop()
+                watch = None
+            meter.end(size)
             logging.debug("Storage volume '%s' install complete.",
                           self.name)
             return vol
@@ -831,32 +973,9 @@ class StorageVolume(_StorageObject):
             logging.debug("Error creating storage volume", exc_info=True)
             raise RuntimeError("Couldn't create storage volume "
                                "'%s': '%s'" % (self.name, str(e)))
-
-    def _progress_thread(self, meter):
-        vol = None
-        if not meter:
-            return
-
-        while True:
-            try:
-                if not vol:
-                    vol = self.pool.storageVolLookupByName(self.name)
-                vol.info()
-                break
-            except Exception:
-                if self._install_finished.wait(.2):
-                    break
-
-        if vol is None:
-            logging.debug("Couldn't lookup storage volume in prog thread.")
-            return
-
-        while True:
-            ignore, ignore, alloc = vol.info()
-            meter.update(alloc)
-            if self._install_finished.wait(1):
-                break
-
+        finally:
+            if watch:
+                watch.stop()
 
     def is_size_conflict(self):
         """
@@ -109,7 +109,8 @@ def validate_macaddr(val):
 
 
 def generate_name(base, collision_cb, suffix="", lib_collision=True,
-                  start_num=1, sep="-", force_num=False, collidelist=None):
+                  start_num=1, sep="-", force_num=False, collidelist=None,
+                  listnames_cb=None):
     """
     Generate a new name from the passed base string, verifying it doesn't
     collide with the collision callback.
@@ -133,9 +134,24 @@ def generate_name(base, collision_cb, suffix="", lib_collision=True,
         generated number (default is "-")
     :param force_num: Force the generated name to always end with a number
     :param collidelist: An extra list of names to check for collision
+    :param listnames_cb: Optional callback returning every name currently
+        in use, like a listAllDomains wrapper. If it succeeds, the free
+        name is picked from that list with no per name collision_cb
+        calls. If it raises, we fall back to collision_cb.
     """
     collidelist = collidelist or []
 
+    if listnames_cb:
+        try:
+            names = set(listnames_cb())
+        except Exception as e:
+            logging.debug("Listing names failed, falling back to "
+                          "per name lookups: %s", e)
+        else:
+            names.update(collidelist)
+            return _generate_name_from_set(base, names, suffix,
+                                           start_num, sep, force_num)
+
     def collide(n):
         if n in collidelist:
             return True
@@ -160,6 +176,36 @@ def generate_name(base, collision_cb, suffix="", lib_collision=True,
     raise ValueError(_("Name generation range exceeded."))
 
 
+def _generate_name_from_set(base, names, suffix, start_num, sep, force_num):
+    """
+    generate_name logic for when we have the full set of used names.
+    Returns the same result as trying each candidate in turn, but with
+    a single scan over the numbers already in use.
+    """
+    if not force_num and (base + suffix) not in names:
+        return base + suffix
+
+    numre = re.compile("^%s([0-9]+)%s$" %
+                       (re.escape(base + sep), re.escape(suffix)))
+    used = set()
+    for name in names:
+        match = numre.match(name)
+        # Skip things like foo-01, which we would never generate
+        if match and str(int(match.group(1))) == match.group(1):
+            used.add(int(match.group(1)))
+
+    num = start_num
+    for usednum in sorted(used):
+        if usednum < num:
+            continue
+        if usednum != num:
+            break
+        num += 1
+
+    if num >= start_num + 100000:
+        raise ValueError(_("Name generation range exceeded."))
+    return "%s%s%d%s" % (base, sep, num, suffix)
+
 
 def generate_uuid(conn):
     for ignore in range(256):
@@ -301,6 +347,26 @@ def register_libvirt_error_handler():
     libvirt.registerErrorHandler(f=libvirt_callback, ctx=None)
 
 
+def parallel_map(func, items, maxworkers):
+    """
+    Run func over every entry in items using a pool of at most maxworkers
+    threads, returning the results in the same order as items.
+
+    This is intended for libvirt RPC heavy work like XMLDesc calls, where
+    the python bindings drop the GIL for the duration of the call. Any
+    exception raised by func is propagated to the caller.
+    """
+    items = list(items)
+    maxworkers = min(maxworkers, len(items))
+    if maxworkers <= 1:
+        return [func(item) for item in items]
+
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=maxworkers) as executor:
+        return list(executor.map(func, items))
+
+
 def ensure_meter(meter):
     if meter:
         return meter
@@ -96,6 +96,8 @@ class _XMLBase(object):
         raise NotImplementedError()
     def count(self, xpath):
         raise NotImplementedError()
+    def node_child_names(self, xpath):
+        raise NotImplementedError()
     def _find(self, fullxpath):
         raise NotImplementedError()
     def _node_tostring(self, node):
@@ -293,6 +295,20 @@ class _Libxml2API(_XMLBase):
     def count(self, xpath):
         return len(self._ctx.xpathEval(xpath))
 
+    def node_child_names(self, xpath):
+        """
+        Return the element names of all children of the node at xpath,
+        with a namespace prefix if there is one
+        """
+        ret = []
+        for node in self._ctx.xpathEval(xpath + "/*"):
+            name = node.name
+            ns = node.ns()
+            if ns and ns.name:
+                name = "%s:%s" % (ns.name, name)
+            ret.append(name)
+        return ret
+
     def _node_tostring(self, node):
         return node.serialize()
     def _node_from_xml(self, xml):
@@ -36,6 +36,20 @@ _trackprops = bool("VIRTINST_TEST_SUITE" in os.environ)
 _allprops = []
 _seenprops = []
 
+# Matches any character that isn't in string.printable, which includes
+# everything outside of ASCII
+_unprintable_re = re.compile("[^%s]" % re.escape(string.printable))
+
+
+def sanitize_xml(xml):
+    """
+    Strip all non-ASCII and non-printable characters from the passed XML,
+    see XMLBuilder._XML_SANITIZE
+    """
+    if hasattr(xml, 'decode'):
+        xml = xml.decode("ascii", "ignore")
+    return _unprintable_re.sub("", xml)
+
 
 class _XMLChildList(list):
     """
@@ -104,8 +118,78 @@ class XMLChildProperty(property):
             raise RuntimeError("Didn't find expected property=%s" % self)
         return self._propname
 
+    def _build_children(self, xmlbuilder, child_class, count):
+        prop_path = self.get_prop_xpath(xmlbuilder, child_class)
+        if self.is_single:
+            return child_class(xmlbuilder.conn,
+                parentxmlstate=xmlbuilder._xmlstate,
+                relative_object_xpath=prop_path)
+
+        ret = []
+        for idx in range(count):
+            idxstr = "[%d]" % (idx + 1)
+            ret.append(child_class(xmlbuilder.conn,
+                parentxmlstate=xmlbuilder._xmlstate,
+                relative_object_xpath=(prop_path + idxstr)))
+        return ret
+
+    def _count_class(self, xmlbuilder, child_class):
+        xmlstate = xmlbuilder._xmlstate
+        return xmlstate.xmlapi.count(xmlstate.make_abs_xpath(
+            self.get_prop_xpath(xmlbuilder, child_class)))
+
+    def _count_parsed(self, xmlbuilder):
+        """
+        Count the XML nodes for every child class. When there are
+        multiple classes, like Guest._devices, this is a single pass
+        over the parent node rather than one XPath lookup per class.
+        """
+        if len(self.child_classes) == 1:
+            child_class = self.child_classes[0]
+            return {child_class: self._count_class(xmlbuilder, child_class)}
+
+        xmlstate = xmlbuilder._xmlstate
+        parent_xpath = self.get_prop_xpath(
+            xmlbuilder, self.child_classes[0]).rsplit("/", 1)[0]
+        namecount = {}
+        for name in xmlstate.xmlapi.node_child_names(
+                xmlstate.make_abs_xpath(parent_xpath)):
+            namecount[name] = namecount.get(name, 0) + 1
+        return dict((c, namecount.get(c._XML_ROOT_NAME, 0))
+                    for c in self.child_classes)
+
+    def _get_index(self, xmlbuilder):
+        return xmlbuilder._child_index.setdefault(
+            self._findpropname(xmlbuilder), {})
+
+    def _materialize(self, xmlbuilder, propname):
+        """
+        Instantiate the child objects whose parsing was deferred by
+        XMLBuilder._initial_child_parse. Objects already built by
+        get_view_for_class are reused, so references handed out stay valid.
+        """
+        xmlbuilder._lazy_children.remove(propname)
+        if self.is_single:
+            xmlbuilder._propstore[propname] = self._build_children(
+                xmlbuilder, self.child_classes[0], 1)
+            return
+
+        index = self._get_index(xmlbuilder)
+        counts = None
+        objlist = []
+        for child_class in self.child_classes:
+            if child_class not in index:
+                if counts is None:
+                    counts = self._count_parsed(xmlbuilder)
+                index[child_class] = tuple(self._build_children(
+                    xmlbuilder, child_class, counts[child_class]))
+            objlist.extend(index[child_class])
+        xmlbuilder._propstore[propname] = objlist
+
     def _get(self, xmlbuilder):
         propname = self._findpropname(xmlbuilder)
+        if propname in xmlbuilder._lazy_children:
+            self._materialize(xmlbuilder, propname)
         if propname not in xmlbuilder._propstore and not self.is_single:
             xmlbuilder._propstore[propname] = []
         return xmlbuilder._propstore[propname]
@@ -117,6 +201,39 @@ class XMLChildProperty(property):
                              self._get(xmlbuilder),
                              xmlbuilder)
 
+    def get_view_for_class(self, xmlbuilder, child_class):
+        """
+        Return a tuple of the child objects of class child_class. This
+        is the per class index itself, not a copy: adding or removing
+        children replaces the tuple, so it's safe to hold on to.
+
+        If the property hasn't been parsed yet, only child_class
+        objects are built.
+        """
+        if self.is_single:
+            return tuple(obj for obj in [self._get(xmlbuilder)]
+                         if obj.__class__ == child_class)
+
+        propname = self._findpropname(xmlbuilder)
+        index = self._get_index(xmlbuilder)
+        if child_class not in index:
+            if propname not in xmlbuilder._lazy_children:
+                return ()
+            index[child_class] = tuple(self._build_children(xmlbuilder,
+                child_class, self._count_class(xmlbuilder, child_class)))
+        return index[child_class]
+
+    def count_for_class(self, xmlbuilder, child_class):
+        """
+        Return the number of child_class objects, without instantiating
+        anything if the property hasn't been parsed yet
+        """
+        if (not self.is_single and
+            self._findpropname(xmlbuilder) in xmlbuilder._lazy_children and
+            child_class not in self._get_index(xmlbuilder)):
+            return self._count_class(xmlbuilder, child_class)
+        return len(self.get_view_for_class(xmlbuilder, child_class))
+
     def clear(self, xmlbuilder):
         if self.is_single:
             self._get(xmlbuilder).clear()
@@ -127,6 +244,11 @@ class XMLChildProperty(property):
     def append(self, xmlbuilder, newobj):
         # Keep the list ordered by the order of passed in child classes
         objlist = self._get(xmlbuilder)
+        index = self._get_index(xmlbuilder)
+        index[newobj.__class__] = (
+            index.get(newobj.__class__, ()) + (newobj,))
+        xmlbuilder._children_serial += 1
+
         if len(self.child_classes) == 1:
             objlist.append(newobj)
             return
@@ -143,8 +265,10 @@ class XMLChildProperty(property):
         objlist.insert(idx, newobj)
     def remove(self, xmlbuilder, obj):
         self._get(xmlbuilder).remove(obj)
-    def set(self, xmlbuilder, obj):
-        xmlbuilder._propstore[self._findpropname(xmlbuilder)] = obj
+        index = self._get_index(xmlbuilder)
+        index[obj.__class__] = tuple(o for o in
+            index.get(obj.__class__, ()) if o is not obj)
+        xmlbuilder._children_serial += 1
 
     def get_prop_xpath(self, xmlbuilder, obj):
         relative_xpath = self.relative_xpath + "/" + obj._XML_ROOT_NAME
@@ -538,15 +662,18 @@ class XMLBuilder(object):
         self.conn = conn
 
         if self._XML_SANITIZE:
-            if hasattr(parsexml, 'decode'):
-                parsexml = parsexml.decode("ascii", "ignore").encode("ascii")
-            else:
-                parsexml = parsexml.encode("ascii", "ignore").decode("ascii")
-
-            parsexml = "".join([c for c in parsexml if c in string.printable])
+            parsexml = sanitize_xml(parsexml)
 
         self._propstore = {}
         self._proporder = []
+        # Child properties that haven't been instantiated yet, see
+        # _initial_child_parse
+        self._lazy_children = set()
+        # propname -> {child_class: (objects)} for list child properties,
+        # kept in sync by XMLChildProperty
+        self._child_index = {}
+        # Bumped whenever a child object is added or removed
+        self._children_serial = 0
         self._xmlstate = _XMLState(self._XML_ROOT_NAME,
                                    parsexml, parentxmlstate,
                                    relative_object_xpath)
@@ -554,32 +681,32 @@ class XMLBuilder(object):
         self._initial_child_parse()
 
     def _initial_child_parse(self):
-        # Walk the XML tree and hand of parsing to any registered
-        # child classes
-        for xmlprop in list(self._all_child_props().values()):
-            if xmlprop.is_single:
-                child_class = xmlprop.child_classes[0]
-                prop_path = xmlprop.get_prop_xpath(self, child_class)
-                obj = child_class(self.conn,
-                    parentxmlstate=self._xmlstate,
-                    relative_object_xpath=prop_path)
-                xmlprop.set(self, obj)
-                continue
-
-            if self._xmlstate.is_build:
-                continue
+        # Child objects are only instantiated when the property is
+        # first accessed, see XMLChildProperty._materialize. Parsing a
+        # domain then doesn't build every device and sub-element up
+        # front when the caller only wants the name or the disks.
+        #
+        # Objects we are building from scratch have no child list
+        # content to parse, only singletons need to be created.
+        for propname, xmlprop in self._all_child_props().items():
+            if xmlprop.is_single or not self._xmlstate.is_build:
+                self._lazy_children.add(propname)
 
-            for child_class in xmlprop.child_classes:
-                prop_path = xmlprop.get_prop_xpath(self, child_class)
+    def _built_children(self, propname):
+        """
+        Return the child objects already instantiated for propname,
+        without triggering any deferred parsing
+        """
+        if propname in self._lazy_children:
+            ret = []
+            for objs in self._child_index.get(propname, {}).values():
+                ret.extend(objs)
+            return ret
+        return util.listify(self._propstore.get(propname))
 
-                nodecount = self._xmlstate.xmlapi.count(
-                    self._xmlstate.make_abs_xpath(prop_path))
-                for idx in range(nodecount):
-                    idxstr = "[%d]" % (idx + 1)
-                    obj = child_class(self.conn,
-                        parentxmlstate=self._xmlstate,
-                        relative_object_xpath=(prop_path + idxstr))
-                    xmlprop.append(self, obj)
+    def _materialize_children(self):
+        for propname in list(self._lazy_children):
+            self._all_child_props()[propname]._get(self)
 
     def __repr__(self):
         return "<%s %s %s>" % (self.__class__.__name__.split(".")[-1],
@@ -698,7 +825,7 @@ class XMLBuilder(object):
         if relative_object_xpath != -1:
             self._xmlstate.set_relative_object_xpath(relative_object_xpath)
         for propname in self._all_child_props():
-            for p in util.listify(getattr(self, propname, [])):
+            for p in self._built_children(propname):
                 p._set_xpaths(self._xmlstate.abs_xpath())
 
     def _set_child_xpaths(self):
@@ -709,6 +836,10 @@ class XMLBuilder(object):
         """
         typecount = {}
         for propname, xmlprop in self._all_child_props().items():
+            if propname in self._lazy_children:
+                # Not parsed yet, the XML for these classes hasn't
+                # changed so any objects already built are still correct
+                continue
             for obj in util.listify(getattr(self, propname)):
                 idxstr = ""
                 if not xmlprop.is_single:
@@ -728,7 +859,7 @@ class XMLBuilder(object):
         """
         self._xmlstate.parse(*args, **kwargs)
         for propname in self._all_child_props():
-            for p in util.listify(getattr(self, propname, [])):
+            for p in self._built_children(propname):
                 p._parse_with_children(None, self._xmlstate)
 
     def add_child(self, obj):
@@ -769,8 +900,18 @@ class XMLBuilder(object):
         """
         ret = []
         for prop in list(self._all_child_props().values()):
-            ret += [obj for obj in util.listify(prop._get(self))
-                    if obj.__class__ == klass]
+            if klass in prop.child_classes:
+                ret += prop.get_view_for_class(self, klass)
+        return ret
+
+    def count_children_for_class(self, klass):
+        """
+        Return the number of XML child objects with the passed class
+        """
+        ret = 0
+        for prop in list(self._all_child_props().values()):
+            if klass in prop.child_classes:
+                ret += prop.count_for_class(self, klass)
         return ret
 
     def child_class_is_singleton(self, klass):
@@ -790,6 +931,10 @@ class XMLBuilder(object):
         Callback that adds the implicitly tracked XML properties to
         the backing xml.
         """
+        # Deferred children need to be built against our own XML
+        # document, not the one we are temporarily switching to
+        self._materialize_children()
+
         origproporder = self._proporder[:]
         origpropstore = self._propstore.copy()
         origapi = self._xmlstate.xmlapi